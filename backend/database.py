@@ -1,9 +1,12 @@
 """
 Database configuration and session management
 """
+from contextvars import ContextVar
+from typing import Optional
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 # SQLite database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./msp_system.db"
@@ -17,9 +20,17 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Set by /api/batch so all of its sub-requests share one session
+shared_session: ContextVar[Optional[Session]] = ContextVar("shared_session", default=None)
+
 
 def get_db():
     """Dependency to get database session"""
+    shared = shared_session.get()
+    if shared is not None:
+        # Owned (and closed) by the batch request
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
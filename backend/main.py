@@ -13,17 +13,50 @@ import uvicorn
 from database import get_db, engine, Base
 from auth import create_access_token, verify_password, get_password_hash, get_current_user
 from models import User
-from routers import knowledge, monitoring, ticketing, dashboard, teams, boards, appointments, companies, analytics, customer_portal
+from routers import knowledge, monitoring, ticketing, dashboard, teams, boards, appointments, companies, analytics, customer_portal, batch
+from services.prober import prober
+from services.anomaly import anomaly_detector
+from services.boards import rank_rebalancer
+from services.scheduling import shutdown_solver_pool
+from services.reminders import reminder_dispatcher
+from services.sla_timer import sla_timer
+from shared.serializers import FastJSONResponse, warm_serializers
+from shared.etag import ConditionalGetMiddleware
+from shared.compression import ContentNegotiationMiddleware
+from shared.cache import RedisBackend, response_backend
+
+# Background workers
+ENABLE_HEALTH_PROBER = True
+ENABLE_ANOMALY_DETECTOR = True
+ENABLE_RANK_REBALANCER = True
+ENABLE_REMINDER_DISPATCHER = True
+ENABLE_SLA_TIMER = True
+
+# Response cache: None keeps it per process; a Redis URL (e.g.
+# "redis://localhost:6379/0") shares entries and invalidation across workers
+RESPONSE_CACHE_REDIS_URL = None
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Compile the per-model serializers once instead of on first request
+warm_serializers(Base)
+
+if RESPONSE_CACHE_REDIS_URL:
+    response_backend.use(RedisBackend.from_url(RESPONSE_CACHE_REDIS_URL))
+
 app = FastAPI(
     title="MSP IT Management System API",
     description="Unified backend for Access Center, Knowledge Base, Monitoring Dashboard, and Ticketing System",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# ETag + 304 for JSON GETs, then MessagePack/gzip/brotli on the way out
+# (added first so CORS stays outermost)
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(ContentNegotiationMiddleware)
+
 # CORS configuration for local development
 app.add_middleware(
     CORSMiddleware,
@@ -49,6 +82,33 @@ app.include_router(appointments.router, prefix="/api/appointments", tags=["Appoi
 app.include_router(companies.router, prefix="/api/companies", tags=["Companies & Assets"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
 app.include_router(customer_portal.router, prefix="/api/portal", tags=["Customer Portal"])
+app.include_router(batch.router, prefix="/api/batch", tags=["Batch"])
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    """Start in-process background workers"""
+    if ENABLE_HEALTH_PROBER:
+        await prober.start()
+    if ENABLE_ANOMALY_DETECTOR:
+        await anomaly_detector.start()
+    if ENABLE_RANK_REBALANCER:
+        await rank_rebalancer.start()
+    if ENABLE_REMINDER_DISPATCHER:
+        await reminder_dispatcher.start()
+    if ENABLE_SLA_TIMER:
+        await sla_timer.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Stop background workers and flush buffered writes"""
+    await prober.stop()
+    await anomaly_detector.stop()
+    await rank_rebalancer.stop()
+    await reminder_dispatcher.stop()
+    await sla_timer.stop()
+    shutdown_solver_pool()
 
 
 @app.post("/api/auth/login")
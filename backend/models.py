@@ -1,7 +1,7 @@
 """
 SQLAlchemy database models for all systems
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, Float, ForeignKey, Enum, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -39,6 +39,9 @@ class KnowledgeCategory(Base):
 
 class KnowledgeArticle(Base):
     __tablename__ = "knowledge_articles"
+    __table_args__ = (
+        Index("ix_knowledge_articles_created_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -162,15 +165,29 @@ class MonitoredService(Base):
     last_check = Column(DateTime, nullable=True)
     response_time = Column(Float, nullable=True)  # in milliseconds
     uptime_percentage = Column(Float, default=100.0)
+    check_interval = Column(Integer, default=60)  # seconds between active probes
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     alerts = relationship("Alert", back_populates="service")
     metrics = relationship("ServiceMetric", back_populates="service")
+    status_spans = relationship("ServiceStatusSpan", back_populates="service")
 
 
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index("ix_alerts_fingerprint_status", "fingerprint", "status"),
+        # At most one open alert per fingerprint, even with concurrent ingest (OPEN_ALERT_STATUSES)
+        Index(
+            "ux_alerts_open_fingerprint", "fingerprint", unique=True,
+            sqlite_where=text("status IN ('active', 'acknowledged')"),
+            postgresql_where=text("status IN ('active', 'acknowledged')")
+        ),
+        Index("ix_alerts_status_severity_created", "status", "severity", "created_at"),
+        Index("ix_alerts_service_status", "service_id", "status"),
+        Index("ix_alerts_created_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     service_id = Column(Integer, ForeignKey("monitored_services.id"))
@@ -178,12 +195,47 @@ class Alert(Base):
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
     status = Column(String(20), default="active")  # active, acknowledged, resolved
+    fingerprint = Column(String(40), nullable=True)  # hash of service, severity and title
+    occurrence_count = Column(Integer, default=1)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+    is_flapping = Column(Boolean, default=False)
+    incident_id = Column(Integer, ForeignKey("alert_incidents.id"), nullable=True)
     acknowledged_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     acknowledged_at = Column(DateTime, nullable=True)
     resolved_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     service = relationship("MonitoredService", back_populates="alerts")
+    incident = relationship("AlertIncident", back_populates="alerts")
+
+
+class AlertIncident(Base):
+    """Alerts from services that depend on each other, grouped together"""
+    __tablename__ = "alert_incidents"
+    __table_args__ = (
+        Index("ix_alert_incidents_status_root", "status", "root_service_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    root_service_id = Column(Integer, ForeignKey("monitored_services.id"))
+    title = Column(String(200), nullable=False)
+    severity = Column(String(20), nullable=False)  # highest severity among its alerts
+    status = Column(String(20), default="open")  # open, resolved
+    alert_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+    resolved_at = Column(DateTime, nullable=True)
+    
+    alerts = relationship("Alert", back_populates="incident")
+
+
+class ServiceDependency(Base):
+    __tablename__ = "service_dependencies"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    service_id = Column(Integer, ForeignKey("monitored_services.id"), index=True)
+    depends_on_service_id = Column(Integer, ForeignKey("monitored_services.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class ServiceMetric(Base):
@@ -199,6 +251,23 @@ class ServiceMetric(Base):
     service = relationship("MonitoredService", back_populates="metrics")
 
 
+class ServiceStatusSpan(Base):
+    """One interval during which a service held a single status"""
+    __tablename__ = "service_status_spans"
+    __table_args__ = (
+        Index("ix_status_spans_service_started", "service_id", "started_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    service_id = Column(Integer, ForeignKey("monitored_services.id"), nullable=False)
+    status = Column(String(20), nullable=False)  # up, down, warning, unknown
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=True)  # NULL while the span is open
+    downtime_before = Column(Float, default=0.0)  # seconds of downtime in all earlier spans
+    
+    service = relationship("MonitoredService", back_populates="status_spans")
+
+
 class SLA(Base):
     __tablename__ = "slas"
     
@@ -244,6 +313,10 @@ class TicketPriority(str, enum.Enum):
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    __table_args__ = (
+        Index("ix_tickets_created_id", "created_at", "id"),
+        Index("ix_tickets_status_sla_due", "status", "sla_due_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     ticket_number = Column(String(20), unique=True, nullable=False)
@@ -258,7 +331,9 @@ class Ticket(Base):
     asset_id = Column(Integer, ForeignKey("assets.id"), nullable=True)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
     sla_policy_id = Column(Integer, ForeignKey("sla_policies.id"), nullable=True)
-    sla_due_date = Column(DateTime, nullable=True)
+    response_due_date = Column(DateTime, nullable=True)  # first response deadline
+    sla_due_date = Column(DateTime, nullable=True)  # resolution deadline
+    sla_state = Column(String(20), nullable=True)  # at_risk, breached; None while on track
     first_response_at = Column(DateTime, nullable=True)
     resolution = Column(Text, nullable=True)
     time_spent_minutes = Column(Integer, default=0)
@@ -267,10 +342,25 @@ class Ticket(Base):
     resolved_at = Column(DateTime, nullable=True)
     closed_at = Column(DateTime, nullable=True)
     
-    comments = relationship("TicketComment", back_populates="ticket")
+    comments = relationship("TicketComment", back_populates="ticket", order_by="TicketComment.created_at")
     time_entries = relationship("TimeEntry", back_populates="ticket")
     article_links = relationship("ArticleTicketLink", back_populates="ticket")
 
+    # Read-side collections for the ticket detail view (services/tickets.py)
+    tags = relationship("TicketTag", viewonly=True, order_by="TicketTag.id")
+    dependencies = relationship(
+        "TicketDependency", viewonly=True, order_by="TicketDependency.id",
+        primaryjoin="Ticket.id == TicketDependency.ticket_id"
+    )
+    custom_field_values = relationship(
+        "CustomFieldValue", viewonly=True, order_by="CustomFieldValue.id"
+    )
+    attachments = relationship(
+        "Attachment", viewonly=True, order_by="Attachment.id",
+        primaryjoin="Ticket.id == Attachment.ticket_id"
+    )
+    satisfaction = relationship("CustomerSatisfaction", viewonly=True, uselist=False)
+
 
 class TicketComment(Base):
     __tablename__ = "ticket_comments"
@@ -350,10 +440,11 @@ class Board(Base):
     team_id = Column(Integer, ForeignKey("teams.id"), nullable=True)
     created_by = Column(Integer, ForeignKey("users.id"))
     is_active = Column(Boolean, default=True)
+    version = Column(Integer, default=1, nullable=False)  # bumped on any change to columns, cards or their tickets
     created_at = Column(DateTime, default=datetime.utcnow)
     
     team = relationship("Team", back_populates="boards")
-    columns = relationship("BoardColumn", back_populates="board", order_by="BoardColumn.position")
+    columns = relationship("BoardColumn", back_populates="board", order_by="BoardColumn.rank")
 
 
 class BoardColumn(Base):
@@ -362,8 +453,11 @@ class BoardColumn(Base):
     id = Column(Integer, primary_key=True, index=True)
     board_id = Column(Integer, ForeignKey("boards.id"))
     name = Column(String(100), nullable=False)
-    position = Column(Integer, default=0)
+    position = Column(Integer, default=0)  # legacy index; order is decided by rank
+    rank = Column(String(64), nullable=True)  # see shared/ranking.py
     wip_limit = Column(Integer, nullable=True)  # Work in progress limit
+    card_count = Column(Integer, default=0, nullable=False)  # maintained on card moves, checked against wip_limit
+    stage = Column(String(20), default="active")  # queue, active, done - for lead and cycle time
     color = Column(String(7), nullable=True)  # Hex color
     
     board = relationship("Board", back_populates="columns")
@@ -372,18 +466,69 @@ class BoardColumn(Base):
 
 class BoardCard(Base):
     __tablename__ = "board_cards"
+    __table_args__ = (
+        Index("ix_board_cards_column_rank", "board_column_id", "rank"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     board_column_id = Column(Integer, ForeignKey("board_columns.id"))
     ticket_id = Column(Integer, ForeignKey("tickets.id"))
-    position = Column(Integer, default=0)
+    position = Column(Integer, default=0)  # legacy index; order is decided by rank
+    rank = Column(String(64), nullable=True)  # see shared/ranking.py
+    version = Column(Integer, default=1, nullable=False)  # optimistic concurrency for moves
+    entered_at = Column(DateTime, default=datetime.utcnow)  # added to the board (lead time start)
+    started_at = Column(DateTime, nullable=True)  # first reached an active column (cycle time start)
     
     column = relationship("BoardColumn", back_populates="cards")
 
+    __mapper_args__ = {"version_id_col": version}
+
+
+class BoardCardMovement(Base):
+    """Card entering, leaving or changing columns; the source of flow metrics"""
+    __tablename__ = "board_card_movements"
+    __table_args__ = (
+        Index("ix_board_card_movements_board_moved", "board_id", "moved_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    board_id = Column(Integer, ForeignKey("boards.id"), nullable=False)
+    card_id = Column(Integer, nullable=False)  # no FK: the log outlives removed cards
+    ticket_id = Column(Integer, ForeignKey("tickets.id"))
+    from_column_id = Column(Integer, nullable=True)  # None when added to the board
+    to_column_id = Column(Integer, nullable=True)  # None when removed
+    moved_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    moved_at = Column(DateTime, default=datetime.utcnow)
+    lead_minutes = Column(Float, nullable=True)  # set on moves into a done column
+    cycle_minutes = Column(Float, nullable=True)
+
+
+class BoardFlowDaily(Base):
+    """Per-column daily rollup of the movement log (cumulative flow, throughput)"""
+    __tablename__ = "board_flow_daily"
+    __table_args__ = (
+        Index("ix_board_flow_daily_column_day", "board_id", "column_id", "day", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    board_id = Column(Integer, ForeignKey("boards.id"), nullable=False)
+    column_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    card_count = Column(Integer, default=0, nullable=False)  # as of the last move that day
+    entered = Column(Integer, default=0, nullable=False)
+    completed = Column(Integer, default=0, nullable=False)
+    lead_minutes_total = Column(Float, default=0.0, nullable=False)
+    cycle_minutes_total = Column(Float, default=0.0, nullable=False)
+    cycle_completed = Column(Integer, default=0, nullable=False)  # completions with a cycle time
+
 
 # ============= Appointments Scheduler =============
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        Index("ix_appointments_technician_start", "technician_id", "start_time"),
+        Index("ix_appointments_reminder_start", "reminder_sent", "start_time"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -402,6 +547,59 @@ class Appointment(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class AppointmentSeries(Base):
+    """A recurring appointment: one row and a rule, expanded per queried window"""
+    __tablename__ = "appointment_series"
+    __table_args__ = (
+        Index("ix_appointment_series_technician_start", "technician_id", "start_time"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(200), nullable=False)
+    description = Column(Text, nullable=True)
+    ticket_id = Column(Integer, ForeignKey("tickets.id"), nullable=True)
+    customer_id = Column(Integer, ForeignKey("users.id"))
+    technician_id = Column(Integer, ForeignKey("users.id"))
+    start_time = Column(DateTime, nullable=False)  # first occurrence
+    end_time = Column(DateTime, nullable=False)
+    rrule = Column(String(255), nullable=False)  # e.g. FREQ=WEEKLY;BYDAY=MO,TH;COUNT=20
+    ends_at = Column(DateTime, nullable=True)  # end of the last occurrence; NULL if open-ended
+    location = Column(String(200), nullable=True)
+    status = Column(String(20), default="scheduled")  # scheduled, confirmed, cancelled
+    meeting_link = Column(String(255), nullable=True)
+    notes = Column(Text, nullable=True)
+    # Original start of the last unmodified occurrence reminded; exceptions track their own
+    reminded_through = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    exceptions = relationship("AppointmentException", back_populates="series", cascade="all, delete-orphan")
+
+
+class AppointmentException(Base):
+    """One occurrence of a series moved, changed or cancelled"""
+    __tablename__ = "appointment_exceptions"
+    __table_args__ = (
+        Index("ix_appointment_exceptions_occurrence", "series_id", "original_start", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    series_id = Column(Integer, ForeignKey("appointment_series.id"), nullable=False)
+    original_start = Column(DateTime, nullable=False)  # the start the rule gives it
+    # NULL keeps the series' value
+    status = Column(String(20), nullable=True)
+    start_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True)
+    title = Column(String(200), nullable=True)
+    location = Column(String(200), nullable=True)
+    notes = Column(Text, nullable=True)
+    reminder_sent = Column(Boolean, default=False)  # for this occurrence at its current time
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    series = relationship("AppointmentSeries", back_populates="exceptions")
+
+
 # ============= SLA Management =============
 class SLAPolicy(Base):
     __tablename__ = "sla_policies"
@@ -416,6 +614,34 @@ class SLAPolicy(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class BusinessCalendar(Base):
+    __tablename__ = "business_calendars"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True, index=True)  # None: default calendar
+    timezone = Column(String(50), default="UTC")
+    working_hours = Column(Text, nullable=True)  # JSON {"mon": [["09:00", "17:00"]], ...}; None: Mon-Fri 9-17
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    holidays = relationship("CalendarHoliday", back_populates="calendar", cascade="all, delete-orphan")
+
+
+class CalendarHoliday(Base):
+    __tablename__ = "calendar_holidays"
+    __table_args__ = (
+        Index("ix_calendar_holidays_calendar_date", "calendar_id", "date", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    calendar_id = Column(Integer, ForeignKey("business_calendars.id"), nullable=False)
+    date = Column(Date, nullable=False)  # local date in the calendar's timezone
+    name = Column(String(100), nullable=True)
+
+    calendar = relationship("BusinessCalendar", back_populates="holidays")
+
+
 # ============= Automation Rules =============
 class AutomationRule(Base):
     __tablename__ = "automation_rules"
@@ -550,6 +776,8 @@ class TicketDependency(Base):
     depends_on_ticket_id = Column(Integer, ForeignKey("tickets.id"))
     dependency_type = Column(String(50), default="blocks")  # blocks, relates_to, duplicates
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    depends_on_ticket = relationship("Ticket", foreign_keys=[depends_on_ticket_id], viewonly=True)
 
 
 # ============= Custom Fields =============
@@ -577,6 +805,8 @@ class CustomFieldValue(Base):
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
     value = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    field = relationship("CustomField", viewonly=True)
 
 
 # ============= File Attachments =============
@@ -671,3 +901,13 @@ class ScheduledReport(Base):
     next_run = Column(DateTime, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ============= Background Workers =============
+class WorkerLease(Base):
+    """Which process runs a singleton background worker, until when"""
+    __tablename__ = "worker_leases"
+    
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100), nullable=False)  # host:pid:nonce of the holding process
+    expires_at = Column(DateTime, nullable=False)
@@ -1,14 +1,26 @@
 """
 API endpoints for Appointment Scheduler
-Uses shared CRUD patterns to eliminate code duplication
 """
-from typing import Optional
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional, Union
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from shared.router_factory import create_crud_router
-from shared.crud import CRUDBase
-from models import Appointment
+from database import get_db
+from auth import get_current_user
+from models import User, Appointment, AppointmentException, AppointmentSeries, TeamMember
+from services.availability import (
+    BLOCKING_STATUSES, WORKDAY_END_HOUR, WORKDAY_START_HOUR, as_naive_utc, availability, subtract
+)
+from services.recurrence import Override, Recurrence, Series, occurrence_key
+from services.scheduling import DEFAULT_TIME_BUDGET_SECONDS, SCHEDULE_MAX_VISITS, optimize
+
+router = APIRouter()
+
+# Series occurrences are listed this far ahead when no end_date is given
+SERIES_LIST_DAYS = 90
 
 
 # Pydantic schemas
@@ -35,25 +47,157 @@ class AppointmentUpdate(BaseModel):
     notes: Optional[str] = None
 
 
-# Create CRUD operations
-appointment_crud = CRUDBase(Appointment)
+class SeriesCreate(BaseModel):
+    title: str
+    description: Optional[str] = None
+    ticket_id: Optional[int] = None
+    customer_id: int
+    technician_id: int
+    start_time: datetime  # first occurrence
+    end_time: datetime
+    rrule: str  # e.g. FREQ=WEEKLY;BYDAY=MO,TH;COUNT=20
+    location: Optional[str] = None
+    meeting_link: Optional[str] = None
+    notes: Optional[str] = None
+
 
-# Use router factory for standard CRUD endpoints
-router = create_crud_router(
-    model=Appointment,
-    create_schema=AppointmentCreate,
-    update_schema=AppointmentUpdate,
-    crud_operations=appointment_crud,
-    route_prefix="",
-    tags=["Appointments"]
-)
+class SeriesUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    rrule: Optional[str] = None
+    location: Optional[str] = None
+    status: Optional[str] = None
+    meeting_link: Optional[str] = None
+    notes: Optional[str] = None
+
+
+class OccurrenceUpdate(BaseModel):
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    status: Optional[str] = None
+    title: Optional[str] = None
+    location: Optional[str] = None
+    notes: Optional[str] = None
+
+
+class TimeWindow(BaseModel):
+    start: datetime
+    end: datetime
+
+
+class VisitRequest(BaseModel):
+    id: Optional[str] = None  # caller's reference, echoed back
+    title: str
+    description: Optional[str] = None
+    ticket_id: Optional[int] = None
+    customer_id: int
+    duration_minutes: int
+    windows: List[TimeWindow]
+    location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    team_id: Optional[int] = None
+    technician_ids: Optional[List[int]] = None
+    priority: int = 0
+
+
+class ScheduleRequest(BaseModel):
+    visits: List[VisitRequest]
+    time_budget_seconds: float = DEFAULT_TIME_BUDGET_SECONDS
+    commit: bool = False
+
+
+def check_availability(db: Session, technician_id: int, start_time: datetime, end_time: datetime,
+                       exclude_id: Optional[int] = None) -> bool:
+    """True if the technician has nothing booked overlapping the slot (see services/availability.py)"""
+    return availability.is_free(db, technician_id, start_time, end_time, exclude_id)
+
+
+def _recheck(db: Session, technician_id: int, start_time: datetime, end_time: datetime,
+             exclude_id: Union[int, str, None] = None):
+    """
+    Final overlap check inside the writing transaction, after the write is
+    flushed: the shared timelines can miss a booking another worker just made
+    """
+    db.flush()
+    if not availability.is_free(db, technician_id, start_time, end_time, exclude_id, fresh=True):
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Technician is not available at this time")
+
+
+def _recurrence(rrule: str, start_time: datetime, end_time: datetime) -> Recurrence:
+    if start_time >= end_time:
+        raise HTTPException(status_code=400, detail="End time must be after start time")
+    try:
+        return Recurrence(rrule, start_time, end_time - start_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rrule: {str(e)}")
+
+
+def _check_series(db: Session, technician_id: int, series: Series, exclude_series: Optional[int] = None,
+                  fresh: bool = False):
+    if fresh:
+        db.flush()
+    clashes = availability.series_conflicts(db, technician_id, series, exclude_series, fresh=fresh)
+    if clashes:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Technician is not available at this time (first clash: {clashes[0][0].isoformat()})"
         )
+
+
+def _get_series(db: Session, series_id: int) -> AppointmentSeries:
+    series = db.query(AppointmentSeries).filter(AppointmentSeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=404, detail="Appointment series not found")
+    return series
+
+
+def _occurrence_dict(series: AppointmentSeries, original: datetime, start: datetime, end: datetime,
+                     status: str, exception: Optional[AppointmentException]) -> dict:
+    return {
+        "id": None,
+        "series_id": series.id,
+        "occurrence": occurrence_key(series.id, original),
+        "original_start": original.isoformat(),
+        "title": (exception and exception.title) or series.title,
+        "description": series.description,
+        "ticket_id": series.ticket_id,
+        "customer_id": series.customer_id,
+        "technician_id": series.technician_id,
+        "start_time": start.isoformat(),
+        "end_time": end.isoformat(),
+        "location": (exception and exception.location) or series.location,
+        "status": status,
+        "meeting_link": series.meeting_link,
+        "notes": (exception and exception.notes) or series.notes,
+        "created_at": series.created_at.isoformat()
+    }
+
+
+def expand_series(db: Session, start: datetime, end: datetime, technician_id: Optional[int] = None,
+                  customer_id: Optional[int] = None, status: Optional[str] = None) -> list:
+    """(start, dict) for series occurrences inside [start, end), exceptions applied"""
+    query = db.query(AppointmentSeries).options(selectinload(AppointmentSeries.exceptions)).filter(
+        AppointmentSeries.start_time < end,
+        (AppointmentSeries.ends_at.is_(None)) | (AppointmentSeries.ends_at > start)
     )
+    if technician_id:
+        query = query.filter(AppointmentSeries.technician_id == technician_id)
+    if customer_id:
+        query = query.filter(AppointmentSeries.customer_id == customer_id)
     
-    if exclude_id:
-        query = query.filter(Appointment.id != exclude_id)
-    
-    return query.count() == 0
+    found = []
+    for series in query.all():
+        exceptions = {e.original_start: e for e in series.exceptions}
+        for original, s, e, occurrence_status in Series.from_row(series).occurrences(start, end):
+            if s < start or e > end or (status and occurrence_status != status):
+                continue
+            found.append((s, _occurrence_dict(series, original, s, e, occurrence_status, exceptions.get(original))))
+    return found
 
 
 @router.get("/")
@@ -86,28 +230,327 @@ async def get_appointments(
     
     appointments = query.order_by(Appointment.start_time).all()
     
+    # Recurring series only exist as rules; expand them for the requested window
+    window_start = as_naive_utc(start_date) if start_date else datetime.utcnow().replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    window_end = as_naive_utc(end_date) if end_date else window_start + timedelta(days=SERIES_LIST_DAYS)
+    occurrences = expand_series(db, window_start, window_end, technician_id, customer_id, status)
+    
+    listed = [
+        (appt.start_time, {
+            "id": appt.id,
+            "title": appt.title,
+            "description": appt.description,
+            "ticket_id": appt.ticket_id,
+            "customer_id": appt.customer_id,
+            "technician_id": appt.technician_id,
+            "start_time": appt.start_time.isoformat(),
+            "end_time": appt.end_time.isoformat(),
+            "location": appt.location,
+            "status": appt.status,
+            "meeting_link": appt.meeting_link,
+            "notes": appt.notes,
+            "created_at": appt.created_at.isoformat()
+        })
+        for appt in appointments
+    ] + occurrences
+    listed.sort(key=lambda item: item[0])
+    
+    return {"appointments": [item for start, item in listed]}
+
+
+@router.post("/schedule")
+async def schedule_visits(
+    schedule: ScheduleRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Assign technicians and slots to a batch of visits
+
+    Visits go to working-hour free time of the listed technicians, the team's
+    members, or any technician, inside one of their windows, keeping travel
+    between located visits short. With commit the assignments are booked;
+    any slot taken in the meantime is reported back as a conflict.
+    """
+    if not schedule.visits:
+        raise HTTPException(status_code=400, detail="No visits to schedule")
+    if len(schedule.visits) > SCHEDULE_MAX_VISITS:
+        raise HTTPException(status_code=400, detail=f"At most {SCHEDULE_MAX_VISITS} visits per request")
+    
+    visits = []
+    for visit in schedule.visits:
+        if visit.duration_minutes <= 0:
+            raise HTTPException(status_code=400, detail="duration_minutes must be positive")
+        windows = [(as_naive_utc(w.start), as_naive_utc(w.end)) for w in visit.windows]
+        if not windows or any(start >= end for start, end in windows):
+            raise HTTPException(status_code=400, detail="Each visit needs windows with end after start")
+        visits.append({**visit.dict(exclude={"windows"}), "windows": windows})
+    
+    try:
+        result = await optimize(db, visits, schedule.time_budget_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Scheduling did not finish in time")
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    assignments, conflicts = [], []
+    for assignment in result["assignments"]:
+        visit = schedule.visits[assignment["visit"]]
+        entry = {
+            "visit": assignment["visit"],
+            "id": visit.id,
+            "technician_id": assignment["technician_id"],
+            "start_time": assignment["start"].isoformat(),
+            "end_time": assignment["end"].isoformat()
+        }
+        if schedule.commit:
+            # The solver worked from a snapshot; someone may have booked since
+            if not check_availability(db, assignment["technician_id"], assignment["start"], assignment["end"]):
+                conflicts.append(assignment["visit"])
+                continue
+            appointment = Appointment(
+                title=visit.title,
+                description=visit.description,
+                ticket_id=visit.ticket_id,
+                customer_id=visit.customer_id,
+                technician_id=assignment["technician_id"],
+                start_time=assignment["start"],
+                end_time=assignment["end"],
+                location=visit.location
+            )
+            db.add(appointment)
+            db.flush()
+            if not availability.is_free(db, appointment.technician_id, appointment.start_time,
+                                        appointment.end_time, appointment.id, fresh=True):
+                db.delete(appointment)
+                db.flush()
+                conflicts.append(assignment["visit"])
+                continue
+            entry["appointment"] = appointment
+        assignments.append(entry)
+    
+    if schedule.commit:
+        db.commit()
+        for entry in assignments:
+            entry["appointment_id"] = entry.pop("appointment").id
+    
     return {
-        "appointments": [
+        "assignments": assignments,
+        "unassigned": [
+            {"visit": index, "id": schedule.visits[index].id, "reason": "conflict" if index in conflicts else "no_slot"}
+            for index in sorted(result["unassigned"] + conflicts)
+        ],
+        "committed": schedule.commit,
+        "stats": result["stats"]
+    }
+
+
+@router.post("/series")
+async def create_series(
+    series_data: SeriesCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create a recurring appointment; start_time/end_time are the first occurrence"""
+    series_data.start_time = as_naive_utc(series_data.start_time)
+    series_data.end_time = as_naive_utc(series_data.end_time)
+    recurrence = _recurrence(series_data.rrule, series_data.start_time, series_data.end_time)
+    _check_series(db, series_data.technician_id, Series(None, "scheduled", recurrence, {}))
+    
+    series = AppointmentSeries(**series_data.dict(), ends_at=recurrence.last_end())
+    db.add(series)
+    db.flush()
+    _check_series(db, series_data.technician_id, Series(None, "scheduled", recurrence, {}),
+                  exclude_series=series.id, fresh=True)
+    db.commit()
+    db.refresh(series)
+    
+    return {"message": "Appointment series created", "series_id": series.id}
+
+
+@router.get("/series/{series_id}")
+async def get_series(
+    series_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a recurring appointment with its exceptions"""
+    series = _get_series(db, series_id)
+    
+    return {
+        "id": series.id,
+        "title": series.title,
+        "description": series.description,
+        "ticket_id": series.ticket_id,
+        "customer_id": series.customer_id,
+        "technician_id": series.technician_id,
+        "start_time": series.start_time.isoformat(),
+        "end_time": series.end_time.isoformat(),
+        "rrule": series.rrule,
+        "ends_at": series.ends_at.isoformat() if series.ends_at else None,
+        "location": series.location,
+        "status": series.status,
+        "meeting_link": series.meeting_link,
+        "notes": series.notes,
+        "exceptions": [
             {
-                "id": appt.id,
-                "title": appt.title,
-                "description": appt.description,
-                "ticket_id": appt.ticket_id,
-                "customer_id": appt.customer_id,
-                "technician_id": appt.technician_id,
-                "start_time": appt.start_time.isoformat(),
-                "end_time": appt.end_time.isoformat(),
-                "location": appt.location,
-                "status": appt.status,
-                "meeting_link": appt.meeting_link,
-                "notes": appt.notes,
-                "created_at": appt.created_at.isoformat()
+                "original_start": e.original_start.isoformat(),
+                "status": e.status,
+                "start_time": e.start_time.isoformat() if e.start_time else None,
+                "end_time": e.end_time.isoformat() if e.end_time else None,
+                "title": e.title,
+                "location": e.location,
+                "notes": e.notes
             }
-            for appt in appointments
-        ]
+            for e in sorted(series.exceptions, key=lambda e: e.original_start)
+        ],
+        "created_at": series.created_at.isoformat(),
+        "updated_at": series.updated_at.isoformat()
     }
 
 
+@router.put("/series/{series_id}")
+async def update_series(
+    series_id: int,
+    series_data: SeriesUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Update a whole series; exceptions the new rule no longer produces are dropped"""
+    series = _get_series(db, series_id)
+    
+    if series_data.start_time:
+        series_data.start_time = as_naive_utc(series_data.start_time)
+    if series_data.end_time:
+        series_data.end_time = as_naive_utc(series_data.end_time)
+    rescheduled = series_data.start_time or series_data.end_time or series_data.rrule
+    recurrence = _recurrence(
+        series_data.rrule or series.rrule,
+        series_data.start_time or series.start_time,
+        series_data.end_time or series.end_time
+    )
+    
+    # Exceptions survive a rule change only for occurrences the new rule still produces
+    kept = [e for e in series.exceptions if recurrence.includes(e.original_start)]
+    status = series_data.status or series.status
+    reopening = status in BLOCKING_STATUSES and series.status not in BLOCKING_STATUSES
+    blocking = (rescheduled and status in BLOCKING_STATUSES) or reopening
+    if blocking:
+        overrides = {e.original_start: Override(e.status, e.start_time, e.end_time) for e in kept}
+        candidate = Series(series.id, status, recurrence, overrides)
+        _check_series(db, series.technician_id, candidate, exclude_series=series.id)
+    
+    for key, value in series_data.dict(exclude_unset=True).items():
+        setattr(series, key, value)
+    if rescheduled:
+        series.ends_at = recurrence.last_end()
+        for exception in list(series.exceptions):
+            if exception not in kept:
+                series.exceptions.remove(exception)
+    if blocking:
+        _check_series(db, series.technician_id, candidate, exclude_series=series.id, fresh=True)
+    
+    db.commit()
+    
+    return {"message": "Appointment series updated"}
+
+
+@router.delete("/series/{series_id}")
+async def delete_series(
+    series_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel every occurrence of a series"""
+    series = _get_series(db, series_id)
+    series.status = "cancelled"
+    db.commit()
+    
+    return {"message": "Appointment series cancelled"}
+
+
+def _exception_for(series: AppointmentSeries, original_start: datetime) -> AppointmentException:
+    """The occurrence's exception row, new if it has none yet; 404 if the rule has no such occurrence"""
+    recurrence = Recurrence(series.rrule, series.start_time, series.end_time - series.start_time)
+    if not recurrence.includes(original_start):
+        raise HTTPException(status_code=404, detail="Occurrence not found")
+    for exception in series.exceptions:
+        if exception.original_start == original_start:
+            return exception
+    # Already reminded if the series' mark covered it before it became an exception
+    exception = AppointmentException(
+        original_start=original_start,
+        reminder_sent=series.reminded_through is not None and original_start <= series.reminded_through
+    )
+    series.exceptions.append(exception)
+    return exception
+
+
+@router.put("/series/{series_id}/occurrences/{original_start}")
+async def update_occurrence(
+    series_id: int,
+    original_start: datetime,
+    occurrence_data: OccurrenceUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Move or change one occurrence of a series, identified by the start the rule gives it"""
+    series = _get_series(db, series_id)
+    original_start = as_naive_utc(original_start)
+    exception = _exception_for(series, original_start)
+    
+    duration = series.end_time - series.start_time
+    old_start = exception.start_time or original_start
+    old_end = exception.end_time or old_start + duration
+    old_status = exception.status or series.status
+    new_start = as_naive_utc(occurrence_data.start_time) if occurrence_data.start_time else old_start
+    new_end = as_naive_utc(occurrence_data.end_time) if occurrence_data.end_time else (
+        new_start + (old_end - old_start) if occurrence_data.start_time else old_end
+    )
+    if new_start >= new_end:
+        raise HTTPException(status_code=400, detail="End time must be after start time")
+    
+    new_status = occurrence_data.status or old_status
+    moved = (new_start, new_end) != (old_start, old_end)
+    if new_status in BLOCKING_STATUSES and (moved or old_status not in BLOCKING_STATUSES):
+        if not availability.is_free(db, series.technician_id, new_start, new_end,
+                                    exclude_id=occurrence_key(series.id, original_start)):
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Technician is not available at this time")
+    
+    exception.start_time, exception.end_time = new_start, new_end
+    if new_start != old_start:
+        # A moved occurrence gets a reminder for its new time
+        exception.reminder_sent = False
+    for key, value in occurrence_data.dict(exclude_unset=True, exclude={"start_time", "end_time"}).items():
+        setattr(exception, key, value)
+    if new_status in BLOCKING_STATUSES and (moved or old_status not in BLOCKING_STATUSES):
+        _recheck(db, series.technician_id, new_start, new_end, occurrence_key(series.id, original_start))
+    db.commit()
+    
+    return {"message": "Occurrence updated", "occurrence": occurrence_key(series.id, original_start)}
+
+
+@router.delete("/series/{series_id}/occurrences/{original_start}")
+async def cancel_occurrence(
+    series_id: int,
+    original_start: datetime,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel one occurrence of a series"""
+    series = _get_series(db, series_id)
+    exception = _exception_for(series, as_naive_utc(original_start))
+    exception.status = "cancelled"
+    db.commit()
+    
+    return {"message": "Occurrence cancelled"}
+
+
 @router.get("/{appointment_id}")
 async def get_appointment(
     appointment_id: int,
@@ -146,6 +589,8 @@ async def create_appointment(
     current_user: User = Depends(get_current_user)
 ):
     """Create a new appointment"""
+    appointment_data.start_time = as_naive_utc(appointment_data.start_time)
+    appointment_data.end_time = as_naive_utc(appointment_data.end_time)
     # Validate start and end times
     if appointment_data.start_time >= appointment_data.end_time:
         raise HTTPException(status_code=400, detail="End time must be after start time")
@@ -167,6 +612,8 @@ async def create_appointment(
     )
     
     db.add(appointment)
+    db.flush()
+    _recheck(db, appointment.technician_id, appointment.start_time, appointment.end_time, appointment.id)
     db.commit()
     db.refresh(appointment)
     
@@ -187,18 +634,30 @@ async def update_appointment(
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     # If updating times, check availability
+    if appointment_data.start_time:
+        appointment_data.start_time = as_naive_utc(appointment_data.start_time)
+    if appointment_data.end_time:
+        appointment_data.end_time = as_naive_utc(appointment_data.end_time)
     new_start = appointment_data.start_time or appointment.start_time
     new_end = appointment_data.end_time or appointment.end_time
     
     if new_start >= new_end:
         raise HTTPException(status_code=400, detail="End time must be after start time")
     
-    if appointment_data.start_time or appointment_data.end_time:
+    # Reopening a cancelled appointment books its slot again
+    reopening = appointment_data.status in BLOCKING_STATUSES and appointment.status not in BLOCKING_STATUSES
+    rebooking = appointment_data.start_time or appointment_data.end_time or reopening
+    if rebooking:
         if not check_availability(db, appointment.technician_id, new_start, new_end, appointment_id):
             raise HTTPException(status_code=400, detail="Technician is not available at this time")
     
     for key, value in appointment_data.dict(exclude_unset=True).items():
         setattr(appointment, key, value)
+    if appointment_data.start_time:
+        # A rescheduled appointment gets a reminder for its new time
+        appointment.reminder_sent = False
+    if rebooking and appointment.status in BLOCKING_STATUSES:
+        _recheck(db, appointment.technician_id, new_start, new_end, appointment_id)
     
     db.commit()
     
@@ -223,35 +682,67 @@ async def delete_appointment(
     return {"message": "Appointment cancelled"}
 
 
+@router.get("/availability/first")
+async def get_first_available(
+    start: datetime,
+    end: datetime,
+    duration_minutes: Optional[int] = None,
+    team_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    First technician free for a slot
+
+    Without duration_minutes the slot is exactly start-end; with it, the
+    earliest working-hour slot of that length between start and end.
+    Candidates are the team's members, or every technician.
+    """
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="End time must be after start time")
+    if duration_minutes is not None and duration_minutes <= 0:
+        raise HTTPException(status_code=400, detail="duration_minutes must be positive")
+    
+    if team_id:
+        query = db.query(TeamMember.user_id).filter(TeamMember.team_id == team_id).order_by(TeamMember.user_id)
+    else:
+        query = db.query(User.id).filter(User.role == "technician", User.is_active == True).order_by(User.id)
+    technician_ids = [row[0] for row in query.all()]
+    
+    found = availability.first_available(
+        db, technician_ids, start, end,
+        timedelta(minutes=duration_minutes) if duration_minutes else None
+    ) if technician_ids else None
+    if found is None:
+        raise HTTPException(status_code=404, detail="No technician available")
+    
+    technician_id, slot_start, slot_end = found
+    return {
+        "technician_id": technician_id,
+        "start": slot_start.isoformat(),
+        "end": slot_end.isoformat()
+    }
+
+
 @router.get("/availability/{technician_id}")
 async def get_availability(
     technician_id: int,
     date: datetime,
+    min_minutes: int = 0,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get technician availability for a specific day"""
-    start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_of_day = as_naive_utc(date).replace(hour=0, minute=0, second=0, microsecond=0)
     end_of_day = start_of_day + timedelta(days=1)
     
-    appointments = db.query(Appointment).filter(
-        Appointment.technician_id == technician_id,
-        Appointment.status.in_(["scheduled", "confirmed"]),
-        Appointment.start_time >= start_of_day,
-        Appointment.start_time < end_of_day
-    ).order_by(Appointment.start_time).all()
-    
     # Working hours: 9 AM to 5 PM
-    working_start = start_of_day.replace(hour=9)
-    working_end = start_of_day.replace(hour=17)
+    working_start = start_of_day.replace(hour=WORKDAY_START_HOUR)
+    working_end = start_of_day.replace(hour=WORKDAY_END_HOUR)
     
-    busy_slots = [
-        {
-            "start": appt.start_time.isoformat(),
-            "end": appt.end_time.isoformat()
-        }
-        for appt in appointments
-    ]
+    busy = availability.busy(db, technician_id, start_of_day, end_of_day)
+    free = subtract([(working_start, working_end)], busy, timedelta(minutes=min_minutes))
     
     return {
         "technician_id": technician_id,
@@ -260,5 +751,6 @@ async def get_availability(
             "start": working_start.isoformat(),
             "end": working_end.isoformat()
         },
-        "busy_slots": busy_slots
+        "busy_slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in busy],
+        "free_slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in free]
     }
@@ -0,0 +1,181 @@
+"""
+API endpoint for batching several API calls into one round trip
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from database import get_db, shared_session
+from auth import authenticated_user, get_current_user
+from models import User
+
+router = APIRouter()
+
+MAX_SUB_REQUESTS = 25
+ALLOWED_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+
+class SubRequest(BaseModel):
+    id: str
+    method: str = "GET"
+    url: str  # e.g. "/api/tickets/5/comments?limit=20"
+    body: Optional[Any] = None
+    depends_on: List[str] = Field(default_factory=list)
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+
+def plan_batches(requests: List[SubRequest]) -> List[List[SubRequest]]:
+    """
+    Split sub-requests into groups that run one after another
+
+    Consecutive GETs share a group and run concurrently; a GET that depends
+    on one in the current group starts a new group. Writes always run alone,
+    in the order given, so reads after a write see it.
+    """
+    groups: List[List[SubRequest]] = []
+    current: List[SubRequest] = []
+    for sub in requests:
+        is_read = sub.method.upper() == "GET"
+        blocked = any(dep in {s.id for s in current} for dep in sub.depends_on)
+        if current and (not is_read or blocked or current[0].method.upper() != "GET"):
+            groups.append(current)
+            current = []
+        current.append(sub)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _validate(requests: List[SubRequest]):
+    if not requests:
+        raise HTTPException(status_code=400, detail="No requests given")
+    if len(requests) > MAX_SUB_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SUB_REQUESTS} requests per batch")
+    seen = set()
+    for sub in requests:
+        if sub.id in seen:
+            raise HTTPException(status_code=400, detail=f"Duplicate request id: {sub.id}")
+        unknown = [dep for dep in sub.depends_on if dep not in seen]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Request {sub.id} depends on {', '.join(unknown)}, which must come before it"
+            )
+        seen.add(sub.id)
+        if sub.method.upper() not in ALLOWED_METHODS:
+            raise HTTPException(status_code=400, detail=f"Unsupported method: {sub.method}")
+        path = urlsplit(sub.url).path
+        if not path.startswith("/api/") or path.rstrip("/") == "/api/batch":
+            raise HTTPException(status_code=400, detail=f"Invalid url: {sub.url}")
+
+
+async def dispatch(request: Request, sub: SubRequest, db: Session) -> Dict[str, Any]:
+    """Run one sub-request through the app in-process and capture its response"""
+    url = urlsplit(sub.url)
+    body = json.dumps(sub.body).encode("utf-8") if sub.body is not None else b""
+    headers = [
+        (b"accept", b"application/json"),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]
+    authorization = request.headers.get("authorization")
+    if authorization:
+        headers.append((b"authorization", authorization.encode("latin-1")))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": "1.1",
+        "method": sub.method.upper(),
+        "scheme": request.url.scheme,
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": url.path,
+        "raw_path": url.path.encode("utf-8"),
+        "query_string": url.query.encode("latin-1"),
+        "headers": headers,
+    }
+
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status_code = 500
+    response_headers: Dict[str, str] = {}
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status_code, response_headers
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            response_headers = {
+                k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message.get("headers", [])
+            }
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception as e:
+        print(f"Batch sub-request {sub.id} failed: {str(e)}")
+        # Leave the shared session usable for the remaining sub-requests
+        db.rollback()
+        return {"id": sub.id, "status": 500, "body": {"detail": "Internal server error"}}
+
+    if status_code >= 400 and sub.method.upper() != "GET":
+        # A failed write may have left changes pending in the shared session;
+        # don't let the next sub-request's commit pick them up
+        db.rollback()
+
+    raw = b"".join(chunks)
+    if "json" in response_headers.get("content-type", "") and raw:
+        content = json.loads(raw)
+    else:
+        content = raw.decode("utf-8", errors="replace") if raw else None
+    result = {"id": sub.id, "status": status_code, "body": content}
+    if "etag" in response_headers:
+        result["etag"] = response_headers["etag"]
+    return result
+
+
+@router.post("")
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Run several API calls in one request
+
+    Sub-requests share this request's authentication and DB session.
+    Independent GETs run concurrently; see plan_batches for ordering.
+    """
+    _validate(batch.requests)
+
+    session_token = shared_session.set(db)
+    user_token = authenticated_user.set(current_user)
+    try:
+        results: Dict[str, Dict[str, Any]] = {}
+        for group in plan_batches(batch.requests):
+            for result in await asyncio.gather(*(dispatch(request, sub, db) for sub in group)):
+                results[result["id"]] = result
+    finally:
+        authenticated_user.reset(user_token)
+        shared_session.reset(session_token)
+
+    return {"responses": [results[sub.id] for sub in batch.requests]}
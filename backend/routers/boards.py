@@ -1,16 +1,26 @@
 """
 API endpoints for Kanban Boards
 """
-from fastapi import APIRouter, Depends, HTTPException
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 
 from database import get_db
-from auth import get_current_user
+from auth import get_current_user, user_from_token
 from models import User, Board, BoardColumn, BoardCard, Ticket
+from shared.etag import ResourceVersion, board_version
+from services.boards import board_snapshot, column_counts, rank_at
+from services.board_events import board_events
+from services.board_flow import (
+    DEFAULT_FLOW_DAYS, MAX_FLOW_DAYS, STAGES, flow_metrics, record_column_removal, record_move
+)
+from shared.ranking import evenly_spaced_ranks
 
 router = APIRouter()
 
@@ -30,8 +40,9 @@ class BoardUpdate(BaseModel):
 
 class ColumnCreate(BaseModel):
     name: str
-    position: int = 0
+    position: Optional[int] = None  # index among the board's columns; None appends
     wip_limit: Optional[int] = None
+    stage: str = "active"  # queue, active or done
     color: Optional[str] = None
 
 
@@ -39,12 +50,19 @@ class ColumnUpdate(BaseModel):
     name: Optional[str] = None
     position: Optional[int] = None
     wip_limit: Optional[int] = None
+    stage: Optional[str] = None
     color: Optional[str] = None
 
 
 class CardMove(BaseModel):
     column_id: int
-    position: int
+    position: Optional[int] = None  # index in the target column; None appends
+    version: Optional[int] = None  # card version the client last saw; stale moves get a 409
+
+
+def _check_stage(stage: Optional[str]):
+    if stage is not None and stage not in STAGES:
+        raise HTTPException(status_code=400, detail=f"stage must be one of: {', '.join(STAGES)}")
 
 
 @router.get("/")
@@ -60,6 +78,7 @@ async def get_boards(
         query = query.filter(Board.team_id == team_id)
     
     boards = query.all()
+    counts = column_counts(db, [board.id for board in boards])
     
     return {
         "boards": [
@@ -69,7 +88,7 @@ async def get_boards(
                 "description": board.description,
                 "team_id": board.team_id,
                 "created_by": board.created_by,
-                "columns_count": len(board.columns),
+                "columns_count": counts.get(board.id, 0),
                 "created_at": board.created_at.isoformat()
             }
             for board in boards
@@ -80,54 +99,110 @@ async def get_boards(
 @router.get("/{board_id}")
 async def get_board(
     board_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get board with columns and cards"""
-    board = db.query(Board).filter(Board.id == board_id).first()
-    
-    if not board:
+    version = board_version(db, board_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    columns_data = []
-    for column in board.columns:
-        cards = db.query(BoardCard, Ticket).join(
-            Ticket, BoardCard.ticket_id == Ticket.id
-        ).filter(
-            BoardCard.board_column_id == column.id
-        ).order_by(BoardCard.position).all()
-        
-        columns_data.append({
-            "id": column.id,
-            "name": column.name,
-            "position": column.position,
-            "wip_limit": column.wip_limit,
-            "color": column.color,
-            "cards": [
-                {
-                    "id": card.id,
-                    "position": card.position,
-                    "ticket": {
-                        "id": ticket.id,
-                        "ticket_number": ticket.ticket_number,
-                        "title": ticket.title,
-                        "status": ticket.status,
-                        "priority": ticket.priority,
-                        "assigned_to": ticket.assigned_to
-                    }
-                }
-                for card, ticket in cards
-            ]
-        })
-    
-    return {
-        "id": board.id,
-        "name": board.name,
-        "description": board.description,
-        "team_id": board.team_id,
-        "created_by": board.created_by,
-        "columns": columns_data
-    }
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    # parts[-1] is Board.version; a cached snapshot at that version needs no queries
+    snapshot = board_snapshot(db, board_id, version.parts[-1])
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+
+    return version.respond(snapshot)
+
+
+@router.get("/{board_id}/events")
+async def board_event_stream(
+    board_id: int,
+    request: Request,
+    since: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Server-sent stream of board changes, resumable with `since` or Last-Event-ID"""
+    version = board_version(db, board_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+    # The stream never touches the database; don't hold a connection for its lifetime
+    db.close()
+
+    async def stream():
+        async for evt in board_events.follow(board_id, since, version.parts[-1]):
+            if await request.is_disconnected():
+                break
+            if evt is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id = f"id: {evt['version']}\n" if evt["version"] is not None else ""
+            yield f"{event_id}event: {evt['type']}\ndata: {json.dumps(evt)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/{board_id}/flow")
+async def get_board_flow(
+    board_id: int,
+    request: Request,
+    days: int = Query(DEFAULT_FLOW_DAYS, ge=1, le=MAX_FLOW_DAYS),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cumulative flow, throughput, lead and cycle time from the card movement log"""
+    board = board_version(db, board_id)
+    if board is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+    # Rollups only change with moves, which advance Board.version
+    version = ResourceVersion("flow", board_id, board.parts[-1], days, datetime.utcnow().date())
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    columns = (
+        db.query(BoardColumn)
+        .filter(BoardColumn.board_id == board_id)
+        .order_by(BoardColumn.rank, BoardColumn.id)
+        .all()
+    )
+    return version.respond(flow_metrics(db, board_id, columns, days))
+
+
+@router.websocket("/{board_id}/ws")
+async def board_event_socket(
+    websocket: WebSocket,
+    board_id: int,
+    token: str = Query(...),
+    since: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """WebSocket stream of board changes; browsers can't set headers, so the JWT comes as `token`"""
+    user = user_from_token(token, db)
+    version = board_version(db, board_id) if user is not None else None
+    db.close()
+    if version is None:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    try:
+        async for evt in board_events.follow(board_id, since, version.parts[-1]):
+            await websocket.send_json(evt if evt is not None else {"type": "ping"})
+    except WebSocketDisconnect:
+        pass
 
 
 @router.post("/")
@@ -153,18 +228,21 @@ async def create_board(
     
     # Create default columns
     default_columns = [
-        {"name": "Backlog", "position": 0, "color": "#95A5A6"},
-        {"name": "To Do", "position": 1, "color": "#3498DB"},
-        {"name": "In Progress", "position": 2, "color": "#F39C12"},
-        {"name": "Testing", "position": 3, "color": "#9B59B6"},
-        {"name": "Done", "position": 4, "color": "#27AE60"}
+        {"name": "Backlog", "position": 0, "stage": "queue", "color": "#95A5A6"},
+        {"name": "To Do", "position": 1, "stage": "queue", "color": "#3498DB"},
+        {"name": "In Progress", "position": 2, "stage": "active", "color": "#F39C12"},
+        {"name": "Testing", "position": 3, "stage": "active", "color": "#9B59B6"},
+        {"name": "Done", "position": 4, "stage": "done", "color": "#27AE60"}
     ]
     
-    for col_data in default_columns:
+    ranks = evenly_spaced_ranks(len(default_columns))
+    for col_data, rank in zip(default_columns, ranks):
         column = BoardColumn(
             board_id=board.id,
             name=col_data["name"],
             position=col_data["position"],
+            rank=rank,
+            stage=col_data["stage"],
             color=col_data["color"]
         )
         db.add(column)
@@ -207,12 +285,15 @@ async def create_column(
     
     if not board:
         raise HTTPException(status_code=404, detail="Board not found")
+    _check_stage(column_data.stage)
     
     column = BoardColumn(
         board_id=board_id,
         name=column_data.name,
-        position=column_data.position,
+        position=column_data.position or 0,
+        rank=rank_at(db, BoardColumn, board_id, column_data.position),
         wip_limit=column_data.wip_limit,
+        stage=column_data.stage,
         color=column_data.color
     )
     
@@ -236,7 +317,12 @@ async def update_column(
     if not column:
         raise HTTPException(status_code=404, detail="Column not found")
     
-    for key, value in column_data.dict(exclude_unset=True).items():
+    updates = column_data.dict(exclude_unset=True)
+    _check_stage(updates.get("stage"))
+    if updates.get("position") is not None:
+        column.rank = rank_at(db, BoardColumn, column.board_id, updates["position"], exclude_id=column.id)
+    
+    for key, value in updates.items():
         setattr(column, key, value)
     
     db.commit()
@@ -257,6 +343,7 @@ async def delete_column(
         raise HTTPException(status_code=404, detail="Column not found")
     
     # Delete all cards in column
+    record_column_removal(db, column, current_user.id)
     db.query(BoardCard).filter(BoardCard.board_column_id == column_id).delete()
     db.delete(column)
     db.commit()
@@ -296,18 +383,14 @@ async def add_card(
     if existing:
         raise HTTPException(status_code=400, detail="Ticket already on this board")
     
-    # Get position
-    max_position = db.query(func.max(BoardCard.position)).filter(
-        BoardCard.board_column_id == column_id
-    ).scalar() or -1
-    
     card = BoardCard(
         board_column_id=column_id,
         ticket_id=ticket_id,
-        position=max_position + 1
+        rank=rank_at(db, BoardCard, column_id)
     )
     
     db.add(card)
+    record_move(db, card, None, column, current_user.id)
     db.commit()
     
     return {"message": "Card added to board"}
@@ -325,31 +408,30 @@ async def move_card(
     
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
+    if move_data.version is not None and move_data.version != card.version:
+        raise HTTPException(status_code=409, detail="Card was changed by someone else")
+    source = card.column
+    target = source if source is not None and source.id == move_data.column_id else (
+        db.query(BoardColumn).filter(BoardColumn.id == move_data.column_id).first()
+    )
+    if not target:
+        raise HTTPException(status_code=404, detail="Column not found")
     
-    old_column_id = card.board_column_id
-    old_position = card.position
-    
-    # Update card
-    card.board_column_id = move_data.column_id
-    card.position = move_data.position
-    
-    # Reorder cards in old column if changed
-    if old_column_id != move_data.column_id:
-        db.query(BoardCard).filter(
-            BoardCard.board_column_id == old_column_id,
-            BoardCard.position > old_position
-        ).update({BoardCard.position: BoardCard.position - 1})
-    
-    # Reorder cards in new column
-    db.query(BoardCard).filter(
-        BoardCard.board_column_id == move_data.column_id,
-        BoardCard.id != card_id,
-        BoardCard.position >= move_data.position
-    ).update({BoardCard.position: BoardCard.position + 1})
-    
-    db.commit()
+    try:
+        # Only the moved card is written: it takes a rank between its new neighbours
+        card.rank = rank_at(db, BoardCard, move_data.column_id, move_data.position, exclude_id=card.id)
+        card.board_column_id = move_data.column_id
+        if move_data.position is not None:
+            card.position = move_data.position
+        # Checks the target's WIP limit; a no-op when reordering within a column
+        record_move(db, card, source, target, current_user.id)
+        # The UPDATE is conditional on the version read above (BoardCard.version_id_col)
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Card was changed by someone else")
     
-    return {"message": "Card moved"}
+    return {"message": "Card moved", "version": card.version}
 
 
 @router.delete("/cards/{card_id}")
@@ -364,6 +446,7 @@ async def remove_card(
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
     
+    record_move(db, card, card.column, None, current_user.id)
     db.delete(card)
     db.commit()
     
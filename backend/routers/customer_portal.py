@@ -1,7 +1,7 @@
 """
 API endpoints for Customer Portal
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -11,9 +11,12 @@ from database import get_db
 from auth import get_current_user
 from models import (
     User, Ticket, TicketComment, TicketTemplate, CustomerSatisfaction,
-    Attachment, TicketTag, TicketDependency, CustomField, CustomFieldValue,
-    Mention
+    Attachment, TicketDependency, Mention
 )
+from services.tickets import (
+    PORTAL_DETAIL_SERIALIZER, PORTAL_INCLUDES, load_ticket, parse_includes, serialize_ticket
+)
+from shared.etag import ticket_version
 
 router = APIRouter()
 
@@ -73,74 +76,31 @@ async def get_my_tickets(
 @router.get("/tickets/{ticket_id}")
 async def get_ticket(
     ticket_id: int,
+    request: Request,
+    include: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(PORTAL_INCLUDES)}"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get ticket details (customer can only see their own)"""
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
-    
-    if not ticket:
+    includes = parse_includes(include, PORTAL_INCLUDES)
+    # Customers never see internal notes, so they get their own representation
+    public_only = current_user.role == "user"
+
+    submitter_id = db.query(Ticket.submitter_id).filter(Ticket.id == ticket_id).first()
+    if submitter_id is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    
+
     # Check permissions
-    if current_user.role == "user" and ticket.submitter_id != current_user.id:
+    if public_only and submitter_id[0] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this ticket")
-    
-    # Get comments (exclude internal notes for customers)
-    comments_query = db.query(TicketComment).filter(
-        TicketComment.ticket_id == ticket_id
-    )
-    
-    if current_user.role == "user":
-        comments_query = comments_query.filter(TicketComment.is_internal == False)
-    
-    comments = comments_query.order_by(TicketComment.created_at).all()
-    
-    # Get tags
-    tags = db.query(TicketTag).filter(TicketTag.ticket_id == ticket_id).all()
-    
-    # Get custom field values
-    custom_values = db.query(CustomFieldValue, CustomField).join(
-        CustomField, CustomFieldValue.custom_field_id == CustomField.id
-    ).filter(
-        CustomFieldValue.ticket_id == ticket_id
-    ).all()
-    
-    return {
-        "id": ticket.id,
-        "ticket_number": ticket.ticket_number,
-        "title": ticket.title,
-        "description": ticket.description,
-        "status": ticket.status,
-        "priority": ticket.priority,
-        "category": ticket.category,
-        "submitter_id": ticket.submitter_id,
-        "assigned_to": ticket.assigned_to,
-        "sla_due_date": ticket.sla_due_date.isoformat() if ticket.sla_due_date else None,
-        "resolution": ticket.resolution,
-        "created_at": ticket.created_at.isoformat(),
-        "updated_at": ticket.updated_at.isoformat(),
-        "resolved_at": ticket.resolved_at.isoformat() if ticket.resolved_at else None,
-        "comments": [
-            {
-                "id": comment.id,
-                "user_id": comment.user_id,
-                "comment": comment.comment,
-                "is_internal": comment.is_internal,
-                "created_at": comment.created_at.isoformat()
-            }
-            for comment in comments
-        ],
-        "tags": [tag.tag_name for tag in tags],
-        "custom_fields": [
-            {
-                "field_name": field.name,
-                "field_type": field.field_type,
-                "value": value.value
-            }
-            for value, field in custom_values
-        ]
-    }
+
+    version = ticket_version(db, ticket_id, includes, scope=("portal", public_only))
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    ticket = load_ticket(db, ticket_id, includes, public_only=public_only)
+    return version.respond(serialize_ticket(ticket, includes, PORTAL_DETAIL_SERIALIZER))
 
 
 @router.post("/tickets")
@@ -150,7 +110,7 @@ async def create_ticket(
     current_user: User = Depends(get_current_user)
 ):
     """Create a new ticket"""
-    from routers.ticketing import generate_ticket_number, calculate_sla_due_date
+    from routers.ticketing import generate_ticket_number, apply_sla
     
     ticket = Ticket(
         ticket_number=generate_ticket_number(db),
@@ -159,8 +119,9 @@ async def create_ticket(
         priority=ticket_data.priority,
         category=ticket_data.category,
         submitter_id=current_user.id,
-        sla_due_date=calculate_sla_due_date(ticket_data.priority)
+        created_at=datetime.utcnow()
     )
+    apply_sla(db, ticket)
     
     db.add(ticket)
     db.commit()
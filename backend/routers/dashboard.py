@@ -1,7 +1,7 @@
 """
 API endpoints for Dashboard (Access Center stats)
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
@@ -12,16 +12,31 @@ from models import (
     User, Ticket, KnowledgeArticle, MonitoredService, 
     Alert, TicketStatus, TicketPriority
 )
+from shared.etag import table_version
+from shared.response_cache import cached_response
+
+STATS_TABLES = (
+    Ticket.__tablename__, KnowledgeArticle.__tablename__,
+    MonitoredService.__tablename__, Alert.__tablename__
+)
+ACTIVITY_TABLES = (Ticket.__tablename__, Alert.__tablename__)
 
 router = APIRouter()
 
 
 @router.get("/stats")
+@cached_response(*STATS_TABLES, per_user=True)
 async def get_dashboard_stats(
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get comprehensive dashboard statistics for Access Center"""
+    # Per user (assigned_to_me) and per day (today / this week counts)
+    version = table_version(*STATS_TABLES, scope=(current_user.id, datetime.utcnow().date()))
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
     
     # Ticket statistics
     total_tickets = db.query(Ticket).count()
@@ -73,7 +88,7 @@ async def get_dashboard_stats(
         health_score -= (services_warning * 5)
         health_score = max(0, min(100, health_score))
     
-    return {
+    return version.respond({
         "tickets": {
             "total": total_tickets,
             "open": open_tickets,
@@ -100,16 +115,22 @@ async def get_dashboard_stats(
             "critical": critical_alerts
         },
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 
 @router.get("/recent-activity")
+@cached_response(*ACTIVITY_TABLES)
 async def get_recent_activity(
+    request: Request,
     limit: int = 10,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get recent activity across all systems"""
+    version = table_version(*ACTIVITY_TABLES, scope=limit)
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
     
     # Recent tickets
     recent_tickets = db.query(Ticket).order_by(
@@ -144,4 +165,4 @@ async def get_recent_activity(
     # Sort by timestamp
     activities.sort(key=lambda x: x["timestamp"], reverse=True)
     
-    return {"activities": activities[:limit]}
+    return version.respond({"activities": activities[:limit]})
@@ -2,14 +2,25 @@
 API endpoints for Knowledge Base system
 Uses advanced router patterns to eliminate duplicate CRUD code
 """
+from fastapi import Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, select, update, exists
 from typing import Optional, List
 from pydantic import BaseModel
+from datetime import datetime
 
+from database import get_db
+from auth import get_current_user
 from shared.advanced_router import create_advanced_router
 from shared.crud import CRUDBase
+from shared.serializers import ModelSerializer, FastJSONResponse, parse_fields
+from shared.counting import paged_with_total, COUNT_CACHED, COUNT_NONE
+from shared.etag import ResourceVersion
+from shared.response_cache import cached_response
 from models import (
-    KnowledgeArticle, KnowledgeCategory, 
-    ArticleVersion, ArticleFavorite, ArticleComment
+    User, Ticket, KnowledgeArticle, KnowledgeCategory, 
+    ArticleVersion, ArticleFavorite, ArticleComment,
+    ArticleCoAuthor, ArticleWorkflowStep, ArticleTicketLink
 )
 
 
@@ -41,11 +52,46 @@ class ArticleUpdate(BaseModel):
 
 class CommentCreate(BaseModel):
     comment: str
+    parent_comment_id: Optional[int] = None
 
 
 # Create CRUD operations
 article_crud = CRUDBase(KnowledgeArticle)
 
+
+def build_article(db: Session, article: ArticleCreate, current_user: User) -> KnowledgeArticle:
+    """A new article with its initial version and workflow steps, added to the session"""
+    article_data = article.dict()
+    workflow_steps = article_data.pop('workflow_steps', None)
+    
+    new_article = KnowledgeArticle(
+        **article_data,
+        author_id=current_user.id
+    )
+    db.add(new_article)
+    db.flush()
+    
+    # Create initial version
+    initial_version = ArticleVersion(
+        article_id=new_article.id,
+        version=1,
+        title=new_article.title,
+        content=new_article.content,
+        changed_by=current_user.id,
+        change_description="Initial version"
+    )
+    db.add(initial_version)
+    
+    # Create workflow steps if provided
+    if workflow_steps and article.article_type == 'workflow':
+        for step_data in workflow_steps:
+            step = ArticleWorkflowStep(
+                article_id=new_article.id,
+                **step_data
+            )
+            db.add(step)
+    return new_article
+
 # Custom endpoints for knowledge-specific functionality
 async def search_articles(query: str, db):
     """Custom endpoint for full-text search"""
@@ -73,9 +119,9 @@ router = create_advanced_router(
     custom_endpoints=custom_endpoints,
     enable_search=True,
     enable_filters=True,
-    enable_export=True
+    enable_export=True,
+    build_item=build_article
 )
-    parent_comment_id: Optional[int] = None
 
 
 class CoAuthorCreate(BaseModel):
@@ -109,6 +155,7 @@ class CategoryCreate(BaseModel):
 
 # Categories
 @router.get("/categories")
+@cached_response(KnowledgeCategory.__tablename__, KnowledgeArticle.__tablename__)
 async def get_categories(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -143,6 +190,20 @@ async def create_category(
 
 
 # Articles
+ARTICLE_LIST_SERIALIZER = ModelSerializer(
+    KnowledgeArticle,
+    [
+        "id", "title", "summary", "category_id", "author_id", "tags", "article_type",
+        "itil_process", "version", "views", "is_published", "is_draft",
+        "created_at", "updated_at"
+    ],
+    aliases={"views": "view_count"},
+    extra=[("category", KnowledgeCategory.name)],
+    computed={"author": lambda row: f"User {row.author_id}" if row.author_id else "Unknown"},
+    depends={"author": ["author_id"]}
+)
+
+
 @router.get("/articles")
 async def get_articles(
     category_id: Optional[int] = None,
@@ -151,15 +212,25 @@ async def get_articles(
     search: Optional[str] = None,
     published_only: bool = True,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get articles with optional filtering"""
-    query = db.query(KnowledgeArticle).options(
-        joinedload(KnowledgeArticle.category)
-
-    )
+    """Get articles with optional filtering, newest first (pass next_cursor to page on)"""
+    serializer = ARTICLE_LIST_SERIALIZER
+    requested = parse_fields(fields, serializer.available_fields())
+    if requested:
+        serializer = serializer.subset(requested, hidden=("created_at", "id"))
+    
+    # Plain column tuples with the category name joined in the same SELECT
+    query = db.query(*serializer.columns)
+    if "category" in serializer.fields:
+        query = query.outerjoin(
+            KnowledgeCategory, KnowledgeArticle.category_id == KnowledgeCategory.id
+        )
     
     if published_only:
         query = query.filter(KnowledgeArticle.is_published == True)
@@ -183,64 +254,77 @@ async def get_articles(
             )
         )
     
-    total = query.count()
-    articles = query.order_by(KnowledgeArticle.created_at.desc()).offset(skip).limit(limit).all()
+    articles, next_cursor, total = paged_with_total(
+        query,
+        [KnowledgeArticle.created_at, KnowledgeArticle.id],
+        lambda article: (article.created_at, article.id),
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        strategy=COUNT_CACHED if include_total else COUNT_NONE
+    )
     
-    return {
+    return FastJSONResponse({
         "total": total,
-        "articles": [
-            {
-                "id": article.id,
-                "title": article.title,
-                "summary": article.summary,
-                "category_id": article.category_id,
-                "category": article.category.name if article.category else None,
-                "author_id": article.author_id,
-                "author": f"User {article.author_id}" if article.author_id else "Unknown",
-                "tags": article.tags,
-                "article_type": article.article_type,
-                "itil_process": article.itil_process,
-                "version": article.version,
-                "views": article.view_count,
-                "is_published": article.is_published,
-                "is_draft": article.is_draft,
-                "created_at": article.created_at.isoformat(),
-                "updated_at": article.updated_at.isoformat()
-            }
-            for article in articles
-        ]
-    }
+        "next_cursor": next_cursor,
+        "articles": serializer.many(articles)
+    })
 
 
 @router.get("/articles/{article_id}")
 async def get_article(
     article_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific article with full details"""
-    article = db.query(KnowledgeArticle).filter(KnowledgeArticle.id == article_id).first()
-    
-    if not article:
+    # Version: the article row, its category name and this user's favorite flag.
+    # view_count is left out, otherwise every read would invalidate every copy.
+    row = db.execute(
+        select(
+            KnowledgeArticle.updated_at,
+            KnowledgeCategory.name,
+            exists().where(
+                ArticleFavorite.article_id == article_id,
+                ArticleFavorite.user_id == current_user.id
+            )
+        )
+        .outerjoin(KnowledgeCategory, KnowledgeCategory.id == KnowledgeArticle.category_id)
+        .where(KnowledgeArticle.id == article_id)
+    ).first()
+
+    if row is None:
         raise HTTPException(status_code=404, detail="Article not found")
-    
-    # Increment view count
-    article.view_count += 1
+    updated_at, category_name, is_favorited = row
+
+    # Increment view count without touching updated_at. Issued on the raw
+    # connection so it doesn't count as a write to knowledge_articles: no
+    # cached response depends on view counts, and views are the hottest write.
+    articles = KnowledgeArticle.__table__
+    db.connection().execute(
+        update(articles)
+        .where(articles.c.id == article_id)
+        .values(view_count=articles.c.view_count + 1, updated_at=articles.c.updated_at)
+    )
     db.commit()
-    
-    # Check if favorited by current user
-    is_favorited = db.query(ArticleFavorite).filter(
-        ArticleFavorite.article_id == article_id,
-        ArticleFavorite.user_id == current_user.id
-    ).first() is not None
-    
-    return {
+
+    version = ResourceVersion(
+        "article", article_id, updated_at, category_name, is_favorited, last_modified=updated_at
+    )
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    article = db.query(KnowledgeArticle).filter(KnowledgeArticle.id == article_id).first()
+
+    return version.respond({
         "id": article.id,
         "title": article.title,
         "content": article.content,
         "summary": article.summary,
         "category_id": article.category_id,
-        "category": article.category.name if article.category else None,
+        "category": category_name,
         "author_id": article.author_id,
         "author_name": f"User {article.author_id}" if article.author_id else "Unknown",
         "tags": article.tags,
@@ -253,7 +337,7 @@ async def get_article(
         "is_favorited": is_favorited,
         "created_at": article.created_at.isoformat(),
         "updated_at": article.updated_at.isoformat()
-    }
+    })
 
 
 @router.post("/articles")
@@ -263,37 +347,7 @@ async def create_article(
     current_user: User = Depends(get_current_user)
 ):
     """Create a new knowledge article"""
-    article_data = article.dict()
-    workflow_steps = article_data.pop('workflow_steps', None)
-    
-    new_article = KnowledgeArticle(
-        **article_data,
-        author_id=current_user.id
-    )
-    db.add(new_article)
-    db.commit()
-    db.refresh(new_article)
-    
-    # Create initial version
-    initial_version = ArticleVersion(
-        article_id=new_article.id,
-        version=1,
-        title=new_article.title,
-        content=new_article.content,
-        changed_by=current_user.id,
-        change_description="Initial version"
-    )
-    db.add(initial_version)
-    
-    # Create workflow steps if provided
-    if workflow_steps and article.article_type == 'workflow':
-        for step_data in workflow_steps:
-            step = ArticleWorkflowStep(
-                article_id=new_article.id,
-                **step_data
-            )
-            db.add(step)
-    
+    new_article = build_article(db, article, current_user)
     db.commit()
     
     return {"message": "Article created", "article_id": new_article.id}
@@ -1,9 +1,10 @@
 """
 API endpoints for Monitoring Dashboard system
 """
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, or_
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
@@ -12,8 +13,13 @@ from database import get_db
 from auth import get_current_user
 from models import (
     User, MonitoredService, Alert, ServiceMetric, 
-    SLA, DashboardWidget
+    SLA, DashboardWidget, ServiceStatusSpan, AlertIncident, ServiceDependency
 )
+from services.uptime import record_transitions, compute_uptime, evaluate_sla
+from services.alerting import alert_pipeline
+from services.anomaly import anomaly_detector
+from shared.pagination import keyset_page
+from shared.serializers import ModelSerializer, FastJSONResponse
 
 router = APIRouter()
 
@@ -23,6 +29,7 @@ class ServiceCreate(BaseModel):
     name: str
     type: str
     url: Optional[str] = None
+    check_interval: int = 60
     description: Optional[str] = None
 
 
@@ -33,6 +40,10 @@ class AlertCreate(BaseModel):
     description: Optional[str] = None
 
 
+class DependencyCreate(BaseModel):
+    depends_on_service_id: int
+
+
 class MetricCreate(BaseModel):
     service_id: int
     metric_name: str
@@ -78,6 +89,7 @@ async def get_services(
                 "last_check": service.last_check.isoformat() if service.last_check else None,
                 "response_time": service.response_time,
                 "uptime_percentage": service.uptime_percentage,
+                "check_interval": service.check_interval,
                 "description": service.description,
                 "created_at": service.created_at.isoformat()
             }
@@ -171,8 +183,11 @@ async def update_service_status(
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
     
+    now = datetime.utcnow()
+    record_transitions(db, [(service_id, status, now)])
+    
     service.status = status
-    service.last_check = datetime.utcnow()
+    service.last_check = now
     
     if response_time is not None:
         service.response_time = response_time
@@ -182,18 +197,166 @@ async def update_service_status(
     return {"message": "Service status updated"}
 
 
+@router.get("/services/{service_id}/uptime")
+async def get_service_uptime(
+    service_id: int,
+    hours: int = 24 * 30,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get uptime over the last N hours from the status history"""
+    service = db.query(MonitoredService).filter(MonitoredService.id == service_id).first()
+    
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+    
+    end = datetime.utcnow()
+    start = end - timedelta(hours=hours)
+    
+    return {
+        "service_id": service_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "uptime_percentage": compute_uptime(db, service_id, start, end)
+    }
+
+
+@router.get("/services/{service_id}/history")
+async def get_service_history(
+    service_id: int,
+    hours: int = 24,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get status spans overlapping the last N hours"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    
+    spans = db.query(ServiceStatusSpan).filter(
+        ServiceStatusSpan.service_id == service_id,
+        or_(ServiceStatusSpan.ended_at.is_(None), ServiceStatusSpan.ended_at >= since)
+    ).order_by(ServiceStatusSpan.started_at.asc()).all()
+    
+    return {
+        "service_id": service_id,
+        "spans": [
+            {
+                "status": span.status,
+                "started_at": span.started_at.isoformat(),
+                "ended_at": span.ended_at.isoformat() if span.ended_at else None
+            }
+            for span in spans
+        ]
+    }
+
+
+@router.get("/services/{service_id}/dependencies")
+async def get_service_dependencies(
+    service_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the services a service depends on"""
+    dependencies = db.query(ServiceDependency, MonitoredService).join(
+        MonitoredService, ServiceDependency.depends_on_service_id == MonitoredService.id
+    ).filter(ServiceDependency.service_id == service_id).all()
+    
+    return {
+        "dependencies": [
+            {
+                "id": dep.id,
+                "depends_on": {
+                    "id": service.id,
+                    "name": service.name,
+                    "status": service.status
+                }
+            }
+            for dep, service in dependencies
+        ]
+    }
+
+
+@router.post("/services/{service_id}/dependencies")
+async def add_service_dependency(
+    service_id: int,
+    dependency: DependencyCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Declare that a service depends on another (used for alert correlation)"""
+    if service_id == dependency.depends_on_service_id:
+        raise HTTPException(status_code=400, detail="A service cannot depend on itself")
+    
+    found = db.query(func.count(MonitoredService.id)).filter(
+        MonitoredService.id.in_([service_id, dependency.depends_on_service_id])
+    ).scalar()
+    if found != 2:
+        raise HTTPException(status_code=404, detail="Service not found")
+    
+    existing = db.query(ServiceDependency).filter(
+        ServiceDependency.service_id == service_id,
+        ServiceDependency.depends_on_service_id == dependency.depends_on_service_id
+    ).first()
+    
+    if existing:
+        raise HTTPException(status_code=400, detail="Dependency already exists")
+    
+    new_dependency = ServiceDependency(
+        service_id=service_id,
+        depends_on_service_id=dependency.depends_on_service_id
+    )
+    db.add(new_dependency)
+    db.commit()
+    alert_pipeline.graph.invalidate()
+    
+    return {"message": "Dependency added", "dependency_id": new_dependency.id}
+
+
+@router.delete("/services/dependencies/{dependency_id}")
+async def remove_service_dependency(
+    dependency_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Remove a service dependency"""
+    dependency = db.query(ServiceDependency).filter(ServiceDependency.id == dependency_id).first()
+    
+    if not dependency:
+        raise HTTPException(status_code=404, detail="Dependency not found")
+    
+    db.delete(dependency)
+    db.commit()
+    alert_pipeline.graph.invalidate()
+    
+    return {"message": "Dependency removed"}
+
+
 # Alerts
+ALERT_LIST_SERIALIZER = ModelSerializer(
+    Alert,
+    [
+        "id", "service_id", "severity", "title", "description", "status",
+        "occurrence_count", "last_seen_at", "is_flapping", "incident_id",
+        "acknowledged_by", "acknowledged_at", "resolved_at", "created_at"
+    ],
+    extra=[("service_name", MonitoredService.name)]
+)
+
+
 @router.get("/alerts")
 async def get_alerts(
     status: Optional[str] = None,
     severity: Optional[str] = None,
     service_id: Optional[int] = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get alerts with optional filtering"""
-    query = db.query(Alert)
+    """Get alerts with optional filtering, newest first (pass next_cursor to page on)"""
+    # Plain column tuples with the service name from the same query
+    query = db.query(*ALERT_LIST_SERIALIZER.columns).outerjoin(
+        MonitoredService, Alert.service_id == MonitoredService.id
+    )
     
     if status:
         query = query.filter(Alert.status == status)
@@ -204,26 +367,18 @@ async def get_alerts(
     if service_id:
         query = query.filter(Alert.service_id == service_id)
     
-    alerts = query.order_by(Alert.created_at.desc()).limit(limit).all()
+    rows, next_cursor = keyset_page(
+        query,
+        [Alert.created_at, Alert.id],
+        lambda row: (row.created_at, row.id),
+        cursor=cursor,
+        limit=limit
+    )
     
-    return {
-        "alerts": [
-            {
-                "id": alert.id,
-                "service_id": alert.service_id,
-                "service_name": alert.service.name if alert.service else None,
-                "severity": alert.severity,
-                "title": alert.title,
-                "description": alert.description,
-                "status": alert.status,
-                "acknowledged_by": alert.acknowledged_by,
-                "acknowledged_at": alert.acknowledged_at.isoformat() if alert.acknowledged_at else None,
-                "resolved_at": alert.resolved_at.isoformat() if alert.resolved_at else None,
-                "created_at": alert.created_at.isoformat()
-            }
-            for alert in alerts
-        ]
-    }
+    return FastJSONResponse({
+        "next_cursor": next_cursor,
+        "alerts": ALERT_LIST_SERIALIZER.many(rows)
+    })
 
 
 @router.post("/alerts")
@@ -232,12 +387,21 @@ async def create_alert(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Create a new alert"""
-    new_alert = Alert(**alert.dict())
-    db.add(new_alert)
+    """Raise an alert (repeats fold into the open alert with the same fingerprint)"""
+    new_alert, outcome = alert_pipeline.ingest(
+        db,
+        service_id=alert.service_id,
+        severity=alert.severity,
+        title=alert.title,
+        description=alert.description
+    )
     db.commit()
-    db.refresh(new_alert)
-    return {"message": "Alert created", "alert_id": new_alert.id}
+    return {
+        "message": f"Alert {outcome}",
+        "alert_id": new_alert.id,
+        "occurrence_count": new_alert.occurrence_count,
+        "incident_id": new_alert.incident_id
+    }
 
 
 @router.put("/alerts/{alert_id}/acknowledge")
@@ -272,13 +436,84 @@ async def resolve_alert(
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
-    alert.status = "resolved"
-    alert.resolved_at = datetime.utcnow()
+    alert_pipeline.resolve(db, alert)
     db.commit()
     
     return {"message": "Alert resolved"}
 
 
+# Incidents
+@router.get("/incidents")
+async def get_incidents(
+    status: Optional[str] = "open",
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get correlated alert incidents"""
+    query = db.query(AlertIncident)
+    
+    if status:
+        query = query.filter(AlertIncident.status == status)
+    
+    incidents = query.order_by(AlertIncident.last_seen_at.desc()).limit(limit).all()
+    
+    return {
+        "incidents": [
+            {
+                "id": incident.id,
+                "root_service_id": incident.root_service_id,
+                "title": incident.title,
+                "severity": incident.severity,
+                "status": incident.status,
+                "alert_count": incident.alert_count,
+                "created_at": incident.created_at.isoformat(),
+                "last_seen_at": incident.last_seen_at.isoformat() if incident.last_seen_at else None,
+                "resolved_at": incident.resolved_at.isoformat() if incident.resolved_at else None
+            }
+            for incident in incidents
+        ]
+    }
+
+
+@router.get("/incidents/{incident_id}")
+async def get_incident(
+    incident_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get an incident with its grouped alerts"""
+    incident = db.query(AlertIncident).filter(AlertIncident.id == incident_id).first()
+    
+    if not incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    
+    alerts = db.query(Alert).filter(Alert.incident_id == incident_id).order_by(Alert.created_at.asc()).all()
+    
+    return {
+        "incident": {
+            "id": incident.id,
+            "root_service_id": incident.root_service_id,
+            "title": incident.title,
+            "severity": incident.severity,
+            "status": incident.status,
+            "created_at": incident.created_at.isoformat()
+        },
+        "alerts": [
+            {
+                "id": a.id,
+                "service_id": a.service_id,
+                "severity": a.severity,
+                "title": a.title,
+                "status": a.status,
+                "occurrence_count": a.occurrence_count,
+                "created_at": a.created_at.isoformat()
+            }
+            for a in alerts
+        ]
+    }
+
+
 # Metrics
 @router.post("/metrics")
 async def add_metric(
@@ -326,33 +561,62 @@ async def get_service_metrics(
     return {"metrics": grouped_metrics}
 
 
-# SLA Management
-@router.get("/sla")
-async def get_slas(
+@router.post("/anomalies/run")
+async def run_anomaly_detection(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all SLA configurations"""
-    slas = db.query(SLA).all()
+    """Run anomaly detection now instead of waiting for the next scheduled pass"""
+    if current_user.role not in ["admin", "technician"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Detection is CPU-bound NumPy work; keep it off the event loop
+    loop = asyncio.get_running_loop()
+    anomalies = await loop.run_in_executor(None, anomaly_detector.run_once, db)
     
     return {
-        "slas": [
+        "anomalies": [
             {
-                "id": sla.id,
-                "service_id": sla.service_id,
-                "name": sla.name,
-                "target_uptime": sla.target_uptime,
-                "current_uptime": sla.current_uptime,
-                "response_time_target": sla.response_time_target,
-                "status": sla.status,
-                "start_date": sla.start_date.isoformat(),
-                "end_date": sla.end_date.isoformat() if sla.end_date else None
+                "service_id": a.service_id,
+                "metric_name": a.metric_name,
+                "value": a.value,
+                "baseline": a.baseline,
+                "score": a.score,
+                "severity": a.severity
             }
-            for sla in slas
+            for a in anomalies
         ]
     }
 
 
+# SLA Management
+@router.get("/sla")
+async def get_slas(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get all SLA configurations with live uptime from the status history"""
+    slas = db.query(SLA).all()
+    now = datetime.utcnow()
+    
+    results = []
+    for sla in slas:
+        live = evaluate_sla(db, sla, now)
+        results.append({
+            "id": sla.id,
+            "service_id": sla.service_id,
+            "name": sla.name,
+            "target_uptime": sla.target_uptime,
+            "current_uptime": live["current_uptime"],
+            "response_time_target": sla.response_time_target,
+            "status": live["status"],
+            "start_date": sla.start_date.isoformat(),
+            "end_date": sla.end_date.isoformat() if sla.end_date else None
+        })
+    
+    return {"slas": results}
+
+
 # Custom Widgets
 @router.get("/widgets")
 async def get_user_widgets(
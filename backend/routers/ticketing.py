@@ -2,15 +2,29 @@
 API endpoints for Ticketing System
 Uses advanced router patterns to eliminate duplicate CRUD code
 """
-from typing import Optional, List
+from fastapi import Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, or_
+from typing import Optional, List, Dict
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, date
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import json
 
+from database import get_db
+from auth import get_current_user
 from shared.advanced_router import create_advanced_router
 from shared.crud import CRUDBase
+from shared.serializers import ModelSerializer, FastJSONResponse, parse_fields
+from shared.counting import paged_with_total, COUNT_EXACT, COUNT_NONE
+from shared.etag import ticket_version
+from shared.response_cache import cached_response
+from services.tickets import TICKET_INCLUDES, load_ticket, parse_includes, serialize_ticket
+from services.sla import DEFAULT_WORKING_HOURS, parse_working_hours, sla_calculator
 from models import (
-    Ticket, TicketComment, TimeEntry, TicketTemplate,
-    TicketStatus, TicketPriority, TicketTag
+    User, Ticket, TicketComment, TimeEntry, TicketTemplate,
+    TicketStatus, TicketPriority, TicketTag, TicketDependency,
+    CustomField, CustomFieldValue, SLAPolicy, AutomationRule, BusinessCalendar, CalendarHoliday
 )
 
 
@@ -48,6 +62,24 @@ class TimeEntryCreate(BaseModel):
 # Create CRUD operations
 ticket_crud = CRUDBase(Ticket)
 
+
+def build_ticket(db: Session, ticket: TicketCreate, current_user: User) -> Ticket:
+    """A new ticket from a create request: numbered, SLA applied, added to the session"""
+    new_ticket = Ticket(
+        ticket_number=generate_ticket_number(db),
+        title=ticket.title,
+        description=ticket.description,
+        priority=ticket.priority,
+        category=ticket.category,
+        company_id=ticket.company_id,
+        submitter_id=current_user.id,
+        status=TicketStatus.NEW.value,
+        created_at=datetime.utcnow()
+    )
+    apply_sla(db, new_ticket)
+    db.add(new_ticket)
+    return new_ticket
+
 # Custom endpoints for ticketing-specific functionality
 async def get_ticket_stats(db):
     """Custom endpoint for ticket statistics"""
@@ -75,7 +107,10 @@ router = create_advanced_router(
     custom_endpoints=custom_endpoints,
     enable_search=True,
     enable_filters=True,
-    enable_export=True
+    enable_export=True,
+    enable_list=False,
+    enable_crud=False,
+    build_item=build_ticket
 )
 
 
@@ -99,19 +134,22 @@ def generate_ticket_number(db: Session) -> str:
     return f"{today.strftime('%Y%m%d')}-{count + 1:04d}"
 
 
-def calculate_sla_due_date(priority: str) -> datetime:
-    """Calculate SLA due date based on priority"""
-    hours_map = {
-        TicketPriority.CRITICAL.value: 4,
-        TicketPriority.HIGH.value: 8,
-        TicketPriority.MEDIUM.value: 24,
-        TicketPriority.LOW.value: 72
-    }
-    hours = hours_map.get(priority, 24)
-    return datetime.utcnow() + timedelta(hours=hours)
+def apply_sla(db: Session, ticket: Ticket):
+    """Set the ticket's SLA policy and business-hours due dates"""
+    try:
+        sla_calculator.assign(db, ticket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # Tickets
+TICKET_LIST_SERIALIZER = ModelSerializer(Ticket, [
+    "id", "ticket_number", "title", "status", "priority", "category",
+    "submitter_id", "assigned_to", "response_due_date", "sla_due_date", "sla_state", "time_spent_minutes",
+    "created_at", "updated_at"
+])
+
+
 @router.get("/")
 async def get_tickets(
     status: Optional[str] = None,
@@ -120,12 +158,21 @@ async def get_tickets(
     category: Optional[str] = None,
     search: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get tickets with optional filtering"""
-    query = db.query(Ticket)
+    """Get tickets with optional filtering, newest first (pass next_cursor to page on)"""
+    serializer = TICKET_LIST_SERIALIZER
+    requested = parse_fields(fields, serializer.available_fields())
+    if requested:
+        serializer = serializer.subset(requested, hidden=("created_at", "id"))
+    
+    # Plain column tuples - no ORM identity map or instrumentation per row
+    query = db.query(*serializer.columns)
     
     if status:
         query = query.filter(Ticket.status == status)
@@ -149,94 +196,45 @@ async def get_tickets(
             )
         )
     
-    total = query.count()
-    tickets = query.order_by(Ticket.created_at.desc()).offset(skip).limit(limit).all()
+    tickets, next_cursor, total = paged_with_total(
+        query,
+        [Ticket.created_at, Ticket.id],
+        lambda ticket: (ticket.created_at, ticket.id),
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        strategy=COUNT_EXACT if include_total else COUNT_NONE
+    )
     
-    return {
+    return FastJSONResponse({
         "total": total,
-        "tickets": [
-            {
-                "id": ticket.id,
-                "ticket_number": ticket.ticket_number,
-                "title": ticket.title,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "category": ticket.category,
-                "submitter_id": ticket.submitter_id,
-                "assigned_to": ticket.assigned_to,
-                "sla_due_date": ticket.sla_due_date.isoformat() if ticket.sla_due_date else None,
-                "time_spent_minutes": ticket.time_spent_minutes,
-                "created_at": ticket.created_at.isoformat(),
-                "updated_at": ticket.updated_at.isoformat()
-            }
-            for ticket in tickets
-        ]
-    }
+        "next_cursor": next_cursor,
+        "tickets": serializer.many(tickets)
+    })
 
 
-@router.get("/{ticket_id}")
+@router.get("/{ticket_id:int}")
 async def get_ticket(
     ticket_id: int,
+    request: Request,
+    include: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(TICKET_INCLUDES)}"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get detailed ticket information"""
-    ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
-    
+    """Get detailed ticket information with its child collections"""
+    includes = parse_includes(include)
+    version = ticket_version(db, ticket_id, includes)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    not_modified = version.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    ticket = load_ticket(db, ticket_id, includes)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    
-    # Get comments
-    comments = db.query(TicketComment).filter(
-        TicketComment.ticket_id == ticket_id
-    ).order_by(TicketComment.created_at.asc()).all()
-    
-    # Get time entries
-    time_entries = db.query(TimeEntry).filter(
-        TimeEntry.ticket_id == ticket_id
-    ).all()
-    
-    return {
-        "ticket": {
-            "id": ticket.id,
-            "ticket_number": ticket.ticket_number,
-            "title": ticket.title,
-            "description": ticket.description,
-            "status": ticket.status,
-            "priority": ticket.priority,
-            "category": ticket.category,
-            "submitter_id": ticket.submitter_id,
-            "assigned_to": ticket.assigned_to,
-            "sla_due_date": ticket.sla_due_date.isoformat() if ticket.sla_due_date else None,
-            "resolution": ticket.resolution,
-            "time_spent_minutes": ticket.time_spent_minutes,
-            "created_at": ticket.created_at.isoformat(),
-            "updated_at": ticket.updated_at.isoformat(),
-            "resolved_at": ticket.resolved_at.isoformat() if ticket.resolved_at else None,
-            "closed_at": ticket.closed_at.isoformat() if ticket.closed_at else None
-        },
-        "comments": [
-            {
-                "id": c.id,
-                "user_id": c.user_id,
-                "comment": c.comment,
-                "is_internal": c.is_internal,
-                "created_at": c.created_at.isoformat()
-            }
-            for c in comments
-        ],
-        "time_entries": [
-            {
-                "id": t.id,
-                "user_id": t.user_id,
-                "minutes": t.minutes,
-                "description": t.description,
-                "billable": t.billable,
-                "created_at": t.created_at.isoformat()
-            }
-            for t in time_entries
-        ]
-    }
+
+    return version.respond(serialize_ticket(ticket, includes))
 
 
 @router.post("/")
@@ -246,21 +244,7 @@ async def create_ticket(
     current_user: User = Depends(get_current_user)
 ):
     """Create a new ticket"""
-    ticket_number = generate_ticket_number(db)
-    sla_due_date = calculate_sla_due_date(ticket.priority)
-    
-    new_ticket = Ticket(
-        ticket_number=ticket_number,
-        title=ticket.title,
-        description=ticket.description,
-        priority=ticket.priority,
-        category=ticket.category,
-        submitter_id=current_user.id,
-        sla_due_date=sla_due_date,
-        status=TicketStatus.NEW.value
-    )
-    
-    db.add(new_ticket)
+    new_ticket = build_ticket(db, ticket, current_user)
     db.commit()
     db.refresh(new_ticket)
     
@@ -271,7 +255,7 @@ async def create_ticket(
     }
 
 
-@router.put("/{ticket_id}")
+@router.put("/{ticket_id:int}")
 async def update_ticket(
     ticket_id: int,
     ticket_update: TicketUpdate,
@@ -294,20 +278,22 @@ async def update_ticket(
         elif new_status == TicketStatus.CLOSED.value and not ticket.closed_at:
             ticket.closed_at = datetime.utcnow()
     
-    # Update priority and recalculate SLA if changed
-    if "priority" in update_data and update_data["priority"] != ticket.priority:
-        ticket.sla_due_date = calculate_sla_due_date(update_data["priority"])
+    priority_changed = "priority" in update_data and update_data["priority"] != ticket.priority
     
     for key, value in update_data.items():
         setattr(ticket, key, value)
     
+    # Recalculate SLA from the new priority's policy
+    if priority_changed:
+        apply_sla(db, ticket)
+    
     ticket.updated_at = datetime.utcnow()
     db.commit()
     
     return {"message": "Ticket updated"}
 
 
-@router.delete("/{ticket_id}")
+@router.delete("/{ticket_id:int}")
 async def delete_ticket(
     ticket_id: int,
     db: Session = Depends(get_db),
@@ -388,6 +374,7 @@ async def add_time_entry(
 
 # Templates
 @router.get("/templates/list")
+@cached_response(TicketTemplate.__tablename__)
 async def get_templates(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -442,7 +429,6 @@ async def create_ticket_from_template(
         raise HTTPException(status_code=404, detail="Template not found")
     
     ticket_number = generate_ticket_number(db)
-    sla_due_date = calculate_sla_due_date(template.default_priority)
     
     new_ticket = Ticket(
         ticket_number=ticket_number,
@@ -451,9 +437,10 @@ async def create_ticket_from_template(
         priority=template.default_priority,
         category=template.category,
         submitter_id=current_user.id,
-        sla_due_date=sla_due_date,
-        status=TicketStatus.NEW.value
+        status=TicketStatus.NEW.value,
+        created_at=datetime.utcnow()
     )
+    apply_sla(db, new_ticket)
     
     db.add(new_ticket)
     db.commit()
@@ -698,6 +685,7 @@ async def set_custom_field_value(
 
 # SLA Policies
 @router.get("/sla-policies")
+@cached_response(SLAPolicy.__tablename__)
 async def get_sla_policies(
     is_active: Optional[bool] = True,
     db: Session = Depends(get_db),
@@ -727,6 +715,254 @@ async def get_sla_policies(
     }
 
 
+class SLAPolicyCreate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    priority: str
+    response_time_hours: int
+    resolution_time_hours: int
+    is_active: bool = True
+
+
+class SLAPolicyUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[str] = None
+    response_time_hours: Optional[int] = None
+    resolution_time_hours: Optional[int] = None
+    is_active: Optional[bool] = None
+
+
+def _require_admin(current_user: User):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+
+def _validate_policy(data: dict):
+    if "priority" in data and data["priority"] not in [p.value for p in TicketPriority]:
+        raise HTTPException(status_code=400, detail="Invalid priority")
+    for key in ("response_time_hours", "resolution_time_hours"):
+        if key in data and (data[key] is None or data[key] <= 0):
+            raise HTTPException(status_code=400, detail=f"{key} must be positive")
+
+
+def _recalculate_sla(db: Session, **scope) -> int:
+    """
+    Flush a policy or calendar change, recompute open tickets' due dates and
+    commit both together; nothing is saved if the recalculation fails
+    """
+    try:
+        db.flush()
+        updated = sla_calculator.recalculate(db, **scope)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    return updated
+
+
+@router.post("/sla-policies")
+async def create_sla_policy(
+    policy: SLAPolicyCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create an SLA policy and apply it to open tickets of its priority"""
+    _require_admin(current_user)
+    _validate_policy(policy.model_dump())
+    
+    new_policy = SLAPolicy(**policy.model_dump())
+    db.add(new_policy)
+    
+    updated = _recalculate_sla(db, priorities=[new_policy.priority])
+    return {"message": "SLA policy created", "policy_id": new_policy.id, "tickets_updated": updated}
+
+
+@router.put("/sla-policies/{policy_id}")
+async def update_sla_policy(
+    policy_id: int,
+    policy_update: SLAPolicyUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Update an SLA policy and recalculate the open tickets it covers"""
+    _require_admin(current_user)
+    policy = db.query(SLAPolicy).filter(SLAPolicy.id == policy_id).first()
+    if not policy:
+        raise HTTPException(status_code=404, detail="SLA policy not found")
+    
+    update_data = policy_update.model_dump(exclude_unset=True)
+    _validate_policy(update_data)
+    priorities = {policy.priority, update_data.get("priority", policy.priority)}
+    for key, value in update_data.items():
+        setattr(policy, key, value)
+    
+    updated = _recalculate_sla(db, priorities=priorities)
+    return {"message": "SLA policy updated", "tickets_updated": updated}
+
+
+# Business Calendars
+class BusinessCalendarCreate(BaseModel):
+    name: str
+    company_id: Optional[int] = None
+    timezone: str = "UTC"
+    working_hours: Optional[Dict[str, List[List[str]]]] = None
+    is_active: bool = True
+
+
+class BusinessCalendarUpdate(BaseModel):
+    name: Optional[str] = None
+    company_id: Optional[int] = None
+    timezone: Optional[str] = None
+    working_hours: Optional[Dict[str, List[List[str]]]] = None
+    is_active: Optional[bool] = None
+
+
+class HolidayCreate(BaseModel):
+    date: date
+    name: Optional[str] = None
+
+
+def _calendar_values(data: dict) -> dict:
+    """Validate calendar fields and store working hours as JSON"""
+    if "timezone" in data:
+        try:
+            ZoneInfo(data["timezone"] or "UTC")
+        except (ValueError, ZoneInfoNotFoundError):
+            raise HTTPException(status_code=400, detail="Unknown timezone")
+    if "working_hours" in data:
+        try:
+            parse_working_hours(data["working_hours"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if data["working_hours"] is not None:
+            data["working_hours"] = json.dumps(data["working_hours"])
+    return data
+
+
+def _calendar_dict(calendar: BusinessCalendar) -> dict:
+    return {
+        "id": calendar.id,
+        "name": calendar.name,
+        "company_id": calendar.company_id,
+        "timezone": calendar.timezone,
+        "working_hours": json.loads(calendar.working_hours) if calendar.working_hours else DEFAULT_WORKING_HOURS,
+        "is_active": calendar.is_active,
+        "holidays": [
+            {"id": h.id, "date": h.date.isoformat(), "name": h.name}
+            for h in sorted(calendar.holidays, key=lambda h: h.date)
+        ]
+    }
+
+
+def _calendar_scope(*company_ids: Optional[int]) -> dict:
+    # The default calendar covers every company without its own
+    return {} if None in company_ids else {"company_ids": list(company_ids)}
+
+
+def _get_calendar(db: Session, calendar_id: int) -> BusinessCalendar:
+    calendar = db.query(BusinessCalendar).filter(BusinessCalendar.id == calendar_id).first()
+    if not calendar:
+        raise HTTPException(status_code=404, detail="Business calendar not found")
+    return calendar
+
+
+@router.get("/business-calendars")
+async def get_business_calendars(
+    company_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get business calendars with their holidays"""
+    query = db.query(BusinessCalendar).options(selectinload(BusinessCalendar.holidays))
+    if company_id is not None:
+        query = query.filter(BusinessCalendar.company_id == company_id)
+    
+    return {"calendars": [_calendar_dict(c) for c in query.order_by(BusinessCalendar.id).all()]}
+
+
+@router.post("/business-calendars")
+async def create_business_calendar(
+    calendar: BusinessCalendarCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create a business calendar (company_id None: the default) and recalculate SLAs"""
+    _require_admin(current_user)
+    new_calendar = BusinessCalendar(**_calendar_values(calendar.model_dump()))
+    db.add(new_calendar)
+    
+    updated = _recalculate_sla(db, **_calendar_scope(new_calendar.company_id))
+    return {"message": "Business calendar created", "calendar_id": new_calendar.id, "tickets_updated": updated}
+
+
+@router.put("/business-calendars/{calendar_id}")
+async def update_business_calendar(
+    calendar_id: int,
+    calendar_update: BusinessCalendarUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Update a business calendar and recalculate SLAs"""
+    _require_admin(current_user)
+    calendar = _get_calendar(db, calendar_id)
+    
+    update_data = _calendar_values(calendar_update.model_dump(exclude_unset=True))
+    companies = {calendar.company_id, update_data.get("company_id", calendar.company_id)}
+    for key, value in update_data.items():
+        setattr(calendar, key, value)
+    
+    updated = _recalculate_sla(db, **_calendar_scope(*companies))
+    return {"message": "Business calendar updated", "tickets_updated": updated}
+
+
+@router.post("/business-calendars/{calendar_id}/holidays")
+async def add_holiday(
+    calendar_id: int,
+    holiday: HolidayCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Add a holiday to a business calendar and recalculate SLAs"""
+    _require_admin(current_user)
+    calendar = _get_calendar(db, calendar_id)
+    if db.query(CalendarHoliday).filter(
+        CalendarHoliday.calendar_id == calendar_id, CalendarHoliday.date == holiday.date
+    ).first():
+        raise HTTPException(status_code=400, detail="Holiday already exists")
+    
+    new_holiday = CalendarHoliday(calendar_id=calendar_id, date=holiday.date, name=holiday.name)
+    db.add(new_holiday)
+    
+    updated = _recalculate_sla(db, **_calendar_scope(calendar.company_id))
+    return {"message": "Holiday added", "holiday_id": new_holiday.id, "tickets_updated": updated}
+
+
+@router.delete("/business-calendars/{calendar_id}/holidays/{holiday_id}")
+async def remove_holiday(
+    calendar_id: int,
+    holiday_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Remove a holiday from a business calendar and recalculate SLAs"""
+    _require_admin(current_user)
+    calendar = _get_calendar(db, calendar_id)
+    holiday = db.query(CalendarHoliday).filter(
+        CalendarHoliday.id == holiday_id, CalendarHoliday.calendar_id == calendar_id
+    ).first()
+    if not holiday:
+        raise HTTPException(status_code=404, detail="Holiday not found")
+    
+    db.delete(holiday)
+    
+    updated = _recalculate_sla(db, **_calendar_scope(calendar.company_id))
+    return {"message": "Holiday removed", "tickets_updated": updated}
+
+
 # Automation Rules
 @router.get("/automation-rules")
 async def get_automation_rules(
@@ -0,0 +1,327 @@
+"""
+Alert pipeline: deduplication, flap suppression and incident correlation
+Every alert raised by the API or by built-in detectors goes through here
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Alert, AlertIncident, ServiceDependency
+
+OPEN_ALERT_STATUSES = ("active", "acknowledged")
+SEVERITY_RANK = {"info": 0, "warning": 1, "critical": 2}
+
+# Flap detection (percent state change over the last N transitions)
+FLAP_HISTORY_SIZE = 21
+FLAP_HIGH_THRESHOLD = 0.5  # start flapping above this change ratio
+FLAP_LOW_THRESHOLD = 0.25  # stop flapping below this change ratio
+FLAP_MIN_OBSERVATIONS = 5  # never call a key flapping on less history than this
+FLAP_TRACKED_KEYS = 10000
+# A resolved alert refired within this window is reopened instead of duplicated
+REOPEN_WINDOW_MINUTES = 30
+
+# Correlation
+INCIDENT_WINDOW_MINUTES = 15
+DEPENDENCY_GRAPH_TTL_SECONDS = 60
+
+
+def alert_fingerprint(service_id: Optional[int], severity: str, title: str) -> str:
+    """Stable identity of an alert: same service, severity and title fold together"""
+    key = f"{service_id or 0}|{severity.strip().lower()}|{' '.join(title.lower().split())}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class FlapDetector:
+    """
+    Weighted state-change ratio with hysteresis
+
+    Recent changes weigh more than old ones. A key starts flapping when the
+    ratio rises above the high threshold and only stops once it falls below
+    the low one, so it doesn't toggle at the boundary.
+    """
+
+    def __init__(
+        self,
+        history: int = FLAP_HISTORY_SIZE,
+        high: float = FLAP_HIGH_THRESHOLD,
+        low: float = FLAP_LOW_THRESHOLD,
+        max_keys: int = FLAP_TRACKED_KEYS,
+    ):
+        self.history = history
+        self.high = high
+        self.low = low
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, deque]" = OrderedDict()
+        self._flapping: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, firing: bool) -> bool:
+        """Record a firing/cleared observation and return whether the key is flapping"""
+        with self._lock:
+            states = self._states.get(key)
+            if states is None:
+                states = deque(maxlen=self.history)
+                self._states[key] = states
+                if len(self._states) > self.max_keys:
+                    oldest, _ = self._states.popitem(last=False)
+                    self._flapping.pop(oldest, None)
+            else:
+                self._states.move_to_end(key)
+            states.append(firing)
+
+            ratio = self.change_ratio(states)
+            flapping = self._flapping.get(key, False)
+            if flapping and ratio < self.low:
+                flapping = False
+            elif not flapping and ratio > self.high and len(states) >= FLAP_MIN_OBSERVATIONS:
+                flapping = True
+            self._flapping[key] = flapping
+            return flapping
+
+    def is_flapping(self, key: str) -> bool:
+        return self._flapping.get(key, False)
+
+    @staticmethod
+    def change_ratio(states) -> float:
+        """Weighted share of consecutive observations that differ (0.8 oldest .. 1.2 newest)"""
+        n = len(states)
+        if n < 2:
+            return 0.0
+        values = list(states)
+        steps = n - 1
+        weighted = total = 0.0
+        for i in range(1, n):
+            weight = 0.8 + 0.4 * (i - 1) / max(1, steps - 1)
+            total += weight
+            if values[i] != values[i - 1]:
+                weighted += weight
+        return weighted / total
+
+
+class DependencyGraph:
+    """In-memory service dependency graph, reloaded from the database on a TTL"""
+
+    def __init__(self, ttl: float = DEPENDENCY_GRAPH_TTL_SECONDS):
+        self.ttl = ttl
+        self._upstream: Dict[int, Set[int]] = {}
+        self._downstream: Dict[int, Set[int]] = {}
+        self._related: Dict[int, Set[int]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def _ensure_loaded(self, db: Session):
+        if time.monotonic() - self._loaded_at < self.ttl:
+            return
+        edges = db.query(ServiceDependency.service_id, ServiceDependency.depends_on_service_id).all()
+        upstream: Dict[int, Set[int]] = {}
+        downstream: Dict[int, Set[int]] = {}
+        for service_id, depends_on in edges:
+            upstream.setdefault(service_id, set()).add(depends_on)
+            downstream.setdefault(depends_on, set()).add(service_id)
+        with self._lock:
+            self._upstream = upstream
+            self._downstream = downstream
+            self._related = {}
+            self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _closure(start: int, edges: Dict[int, Set[int]]) -> Set[int]:
+        seen: Set[int] = set()
+        stack = [start]
+        while stack:
+            for nxt in edges.get(stack.pop(), ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    def related(self, db: Session, service_id: int) -> Set[int]:
+        """Every service upstream or downstream of service_id, plus itself"""
+        self._ensure_loaded(db)
+        with self._lock:
+            cached = self._related.get(service_id)
+            if cached is None:
+                cached = (
+                    self._closure(service_id, self._upstream)
+                    | self._closure(service_id, self._downstream)
+                    | {service_id}
+                )
+                self._related[service_id] = cached
+            return cached
+
+    def depends_on(self, db: Session, service_id: int, other_id: int) -> bool:
+        """True if service_id (transitively) depends on other_id"""
+        self._ensure_loaded(db)
+        return other_id in self._closure(service_id, self._upstream)
+
+
+class AlertPipeline:
+    """
+    Folds incoming alerts into existing ones and groups related alerts
+
+    Lookups go through the (fingerprint, status) and (status, root_service_id)
+    indexes, so ingesting an alert never scans the alerts table. Flap state
+    is kept per process.
+    """
+
+    def __init__(self, flap_detector: Optional[FlapDetector] = None, graph: Optional[DependencyGraph] = None):
+        self.flaps = flap_detector or FlapDetector()
+        self.graph = graph or DependencyGraph()
+
+    def ingest(
+        self,
+        db: Session,
+        *,
+        service_id: Optional[int],
+        severity: str,
+        title: str,
+        description: Optional[str] = None,
+        now: Optional[datetime] = None
+    ) -> Tuple[Alert, str]:
+        """
+        Raise an alert; returns the alert row and what happened to it:
+        "created", "deduplicated" or "reopened". Does not commit.
+
+        Opening an alert is flushed in a savepoint: if another request opened
+        the same fingerprint first (ux_alerts_open_fingerprint), this one
+        deduplicates into it instead.
+        """
+        now = now or datetime.utcnow()
+        fingerprint = alert_fingerprint(service_id, severity, title)
+
+        existing = self._open_alert(db, fingerprint)
+        if existing is not None:
+            return self._deduplicate(existing, description, now), "deduplicated"
+
+        flapping = self.flaps.record(fingerprint, True)
+
+        recent = db.query(Alert).filter(
+            Alert.fingerprint == fingerprint,
+            Alert.status == "resolved",
+            Alert.resolved_at >= now - timedelta(minutes=REOPEN_WINDOW_MINUTES)
+        ).order_by(Alert.resolved_at.desc()).first()
+
+        try:
+            with db.begin_nested():
+                if recent is not None and flapping:
+                    # Flapping: keep one alert open instead of a new row per bounce
+                    recent.status = "active"
+                    recent.resolved_at = None
+                    recent.is_flapping = True
+                    recent.occurrence_count = (recent.occurrence_count or 1) + 1
+                    recent.last_seen_at = now
+                    if description:
+                        recent.description = description
+                    self._attach_incident(db, recent, now)
+                    db.flush()
+                    return recent, "reopened"
+
+                alert = Alert(
+                    service_id=service_id,
+                    severity=severity,
+                    title=title,
+                    description=description,
+                    status="active",
+                    fingerprint=fingerprint,
+                    occurrence_count=1,
+                    last_seen_at=now,
+                    is_flapping=flapping,
+                    created_at=now
+                )
+                db.add(alert)
+                self._attach_incident(db, alert, now)
+                db.flush()
+                return alert, "created"
+        except IntegrityError:
+            existing = self._open_alert(db, fingerprint)
+            if existing is None:
+                raise
+            # Opened by another request since the lookup above
+            return self._deduplicate(existing, description, now), "deduplicated"
+
+    def _open_alert(self, db: Session, fingerprint: str) -> Optional[Alert]:
+        return db.query(Alert).filter(
+            Alert.fingerprint == fingerprint,
+            Alert.status.in_(OPEN_ALERT_STATUSES)
+        ).first()
+
+    def _deduplicate(self, existing: Alert, description: Optional[str], now: datetime) -> Alert:
+        # Still firing - the state did not change, so flap history is untouched
+        existing.occurrence_count = (existing.occurrence_count or 1) + 1
+        existing.last_seen_at = now
+        if description:
+            existing.description = description
+        self._touch_incident(existing, now)
+        return existing
+
+    def resolve(self, db: Session, alert: Alert, now: Optional[datetime] = None) -> Alert:
+        """Resolve an alert, feed the flap detector and close its incident when empty"""
+        now = now or datetime.utcnow()
+        alert.status = "resolved"
+        alert.resolved_at = now
+        if alert.fingerprint:
+            alert.is_flapping = self.flaps.record(alert.fingerprint, False)
+
+        incident = alert.incident
+        if incident is not None and incident.status == "open":
+            still_open = db.query(Alert.id).filter(
+                Alert.incident_id == incident.id,
+                Alert.id != alert.id,
+                Alert.status.in_(OPEN_ALERT_STATUSES)
+            ).first()
+            if still_open is None:
+                incident.status = "resolved"
+                incident.resolved_at = now
+        return alert
+
+    def _touch_incident(self, alert: Alert, now: datetime):
+        if alert.incident is not None:
+            alert.incident.last_seen_at = now
+
+    def _attach_incident(self, db: Session, alert: Alert, now: datetime):
+        """Join an open incident of a dependent service or start a new one"""
+        if alert.service_id is None:
+            return
+
+        related = self.graph.related(db, alert.service_id)
+        incident = db.query(AlertIncident).filter(
+            AlertIncident.status == "open",
+            AlertIncident.root_service_id.in_(related),
+            AlertIncident.last_seen_at >= now - timedelta(minutes=INCIDENT_WINDOW_MINUTES)
+        ).order_by(AlertIncident.created_at.asc()).first()
+
+        if incident is None:
+            incident = AlertIncident(
+                root_service_id=alert.service_id,
+                title=alert.title,
+                severity=alert.severity,
+                status="open",
+                alert_count=0,
+                created_at=now,
+                last_seen_at=now
+            )
+            db.add(incident)
+        elif self.graph.depends_on(db, incident.root_service_id, alert.service_id):
+            # The new alert is upstream of the current root - it is the likelier cause
+            incident.root_service_id = alert.service_id
+            incident.title = alert.title
+
+        if SEVERITY_RANK.get(alert.severity, 0) > SEVERITY_RANK.get(incident.severity, 0):
+            incident.severity = alert.severity
+        if alert.incident is not incident:
+            incident.alert_count = (incident.alert_count or 0) + 1
+        incident.last_seen_at = now
+        alert.incident = incident
+
+
+# Shared pipeline instance
+alert_pipeline = AlertPipeline()
@@ -0,0 +1,478 @@
+"""
+Anomaly detection over service metrics
+Metrics are rolled up by the database into a (series x bucket) matrix and
+scored with a rolling z-score, an EWMA forecast and a seasonal baseline, all
+as whole-array NumPy operations. Anomalies are raised through the alert
+pipeline.
+"""
+import asyncio
+import threading
+import warnings
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Alert, MonitoredService, ServiceMetric
+from services.alerting import OPEN_ALERT_STATUSES, alert_fingerprint, alert_pipeline
+from services.leases import Lease
+
+BUCKET_SECONDS = 900  # 15-minute rollups
+LOOKBACK_DAYS = 7
+DETECTION_INTERVAL_SECONDS = 300
+MIN_STD_RATIO = 0.01  # scale floor relative to the baseline, stops flat series alerting on noise
+MAD_TO_STD = 1.4826
+EWMA_CHUNK_EXPONENT = 300.0  # keeps decay ** -k well inside float64 range
+TITLE_PREFIX = "Anomalous "
+
+
+@dataclass(frozen=True)
+class DetectorConfig:
+    """Tuning for one MonitoredService.type"""
+    window: int = 24  # buckets in the rolling z-score window
+    z_threshold: float = 3.0
+    ewma_alpha: float = 0.2
+    ewma_threshold: float = 3.0
+    season_length: int = 96  # buckets per season (one day of 15-minute buckets)
+    seasonal_threshold: float = 3.5
+    votes_required: int = 2  # detectors that must agree
+    min_history: int = 12  # populated buckets needed before a series is judged
+    direction: str = "up"  # "up" flags only increases, "both" flags either way
+    critical_factor: float = 2.0  # score / threshold at which severity becomes critical
+    metrics: Optional[Tuple[str, ...]] = None  # None means every metric of the service
+
+
+DEFAULT_PROFILE = DetectorConfig()
+DETECTOR_PROFILES: Dict[str, DetectorConfig] = {
+    "server": DetectorConfig(),
+    "application": DetectorConfig(z_threshold=3.5, ewma_alpha=0.3),
+    "network": DetectorConfig(direction="both", ewma_alpha=0.1, seasonal_threshold=4.0),
+    "database": DetectorConfig(window=48, seasonal_threshold=4.0),
+}
+
+
+@dataclass
+class Anomaly:
+    service_id: int
+    metric_name: str
+    value: float
+    baseline: float
+    score: float
+    severity: str
+
+
+def bucketize(
+    service_ids: np.ndarray,
+    metric_names: np.ndarray,
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    start: datetime,
+    n_buckets: int,
+    bucket_seconds: int = BUCKET_SECONDS
+) -> Tuple[List[Tuple[int, str]], np.ndarray]:
+    """
+    Average raw samples into a (series, bucket) matrix
+
+    Returns the (service_id, metric_name) key of each row and the matrix,
+    with NaN where a bucket has no samples.
+    """
+    if len(values) == 0:
+        return [], np.empty((0, n_buckets))
+
+    epoch = timestamps.astype("datetime64[s]").astype(np.int64)
+    start_epoch = int(np.datetime64(start, "s").astype(np.int64))
+    offsets = (epoch - start_epoch) // bucket_seconds
+    keep = (offsets >= 0) & (offsets < n_buckets)
+    if not keep.any():
+        return [], np.empty((0, n_buckets))
+
+    offsets = offsets[keep]
+    services = service_ids[keep].astype(np.int64)
+    names, name_idx = np.unique(metric_names[keep], return_inverse=True)
+    combos, series_idx = np.unique(services * len(names) + name_idx, return_inverse=True)
+
+    size = len(combos) * n_buckets
+    flat = series_idx * n_buckets + offsets
+    sums = np.bincount(flat, weights=values[keep].astype(np.float64), minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = (sums / counts).reshape(len(combos), n_buckets)
+
+    keys = [(int(c // len(names)), str(names[c % len(names)])) for c in combos]
+    return keys, matrix
+
+
+def _epoch_seconds(column, dialect: str):
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", column), Integer)
+    return cast(func.extract("epoch", column), Integer)
+
+
+def fill_gaps(matrix: np.ndarray) -> np.ndarray:
+    """Forward-fill NaN buckets; leading gaps take the first observed value"""
+    rows, cols = matrix.shape
+    missing = np.isnan(matrix)
+    idx = np.where(~missing, np.arange(cols), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = matrix[np.arange(rows)[:, None], idx]
+
+    first = np.argmax(~missing, axis=1)
+    lead = matrix[np.arange(rows), first]
+    return np.where(np.isnan(filled), lead[:, None], filled)
+
+
+def ewma(matrix: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponentially weighted moving average along each row
+
+    Uses the closed form y_t = d^t (d*y_-1 + a * sum_j d^-j x_j) evaluated with
+    cumsum, in chunks short enough that d^-j cannot overflow.
+    """
+    decay = 1.0 - alpha
+    rows, cols = matrix.shape
+    out = np.empty_like(matrix, dtype=np.float64)
+    if cols == 0:
+        return out
+
+    chunk = max(1, int(EWMA_CHUNK_EXPONENT / -np.log(decay)))
+    prev = matrix[:, 0].astype(np.float64)
+    for start in range(0, cols, chunk):
+        block = matrix[:, start:start + chunk]
+        k = np.arange(block.shape[1])
+        acc = np.cumsum(block * decay ** -k, axis=1)
+        out[:, start:start + block.shape[1]] = decay ** k * (decay * prev[:, None] + alpha * acc)
+        prev = out[:, start + block.shape[1] - 1]
+    return out
+
+
+def _scale_floor(scale: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+    return np.maximum(np.nan_to_num(scale), MIN_STD_RATIO * np.abs(np.nan_to_num(baseline)) + 1e-9)
+
+
+def score_latest(matrix: np.ndarray, config: DetectorConfig) -> Dict[str, np.ndarray]:
+    """
+    Score the last bucket of every row against its history
+
+    Returns per-row arrays: value, baseline, zscore, ewma, seasonal and the
+    number of populated history buckets.
+    """
+    rows, cols = matrix.shape
+    latest = matrix[:, -1]
+    history = matrix[:, :-1]
+
+    # Rolling z-score over the trailing window
+    window = history[:, -config.window:]
+    with warnings.catch_warnings():
+        # Rows without any samples in the window legitimately produce NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(window, axis=1)
+        std = np.nanstd(window, axis=1)
+    zscore = (latest - mean) / _scale_floor(std, mean)
+
+    # EWMA one-step forecast and EWMA of squared residuals
+    filled = fill_gaps(matrix)
+    ewma_score = np.full(rows, np.nan)
+    if cols >= 3:
+        level = ewma(filled, config.ewma_alpha)
+        residuals = filled[:, 1:] - level[:, :-1]
+        variance = ewma(residuals ** 2, config.ewma_alpha)
+        ewma_score = residuals[:, -1] / _scale_floor(np.sqrt(variance[:, -2]), level[:, -2])
+
+    # Seasonal baseline: median of the same bucket in previous seasons
+    seasonal_score = np.full(rows, np.nan)
+    baseline = mean
+    lags = np.arange(cols - 1 - config.season_length, -1, -config.season_length)
+    if len(lags) >= 2:
+        past = matrix[:, lags]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            seasonal = np.nanmedian(past, axis=1)
+            mad = np.nanmedian(np.abs(past - seasonal[:, None]), axis=1) * MAD_TO_STD
+        seasonal_score = (latest - seasonal) / _scale_floor(mad, seasonal)
+        baseline = np.where(np.isnan(seasonal), mean, seasonal)
+
+    return {
+        "value": latest,
+        "baseline": baseline,
+        "zscore": zscore,
+        "ewma": ewma_score,
+        "seasonal": seasonal_score,
+        "history": np.sum(~np.isnan(history), axis=1),
+    }
+
+
+def evaluate(matrix: np.ndarray, config: DetectorConfig) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """Vote across detectors; returns (anomalous mask, severity ratio, scores)"""
+    scores = score_latest(matrix, config)
+    thresholds = {
+        "zscore": config.z_threshold,
+        "ewma": config.ewma_threshold,
+        "seasonal": config.seasonal_threshold,
+    }
+
+    votes = np.zeros(matrix.shape[0], dtype=np.int64)
+    ratio = np.zeros(matrix.shape[0])
+    for name, threshold in thresholds.items():
+        score = np.nan_to_num(scores[name], nan=0.0, posinf=0.0, neginf=0.0)
+        signed = score if config.direction == "up" else np.abs(score)
+        votes += signed > threshold
+        ratio = np.maximum(ratio, signed / threshold)
+
+    anomalous = (
+        (votes >= config.votes_required)
+        & (scores["history"] >= config.min_history)
+        & ~np.isnan(scores["value"])
+    )
+    return anomalous, ratio, scores
+
+
+class AnomalyDetector:
+    """
+    Periodic detector that raises and clears anomaly alerts
+
+    With a `lease`, only the process holding it raises and resolves alerts;
+    the others still answer on-demand runs but leave the alerts alone.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        *,
+        profiles: Optional[Dict[str, DetectorConfig]] = None,
+        interval: float = DETECTION_INTERVAL_SECONDS,
+        bucket_seconds: int = BUCKET_SECONDS,
+        lookback_days: int = LOOKBACK_DAYS,
+        lease: Optional[Lease] = None
+    ):
+        self.session_factory = session_factory
+        self.lease = lease
+        self.profiles = profiles if profiles is not None else DETECTOR_PROFILES
+        self.interval = interval
+        self.bucket_seconds = bucket_seconds
+        self.lookback_days = lookback_days
+        # Fingerprints of the anomaly alerts this detector holds open; None until read back from the database
+        self._raised: Optional[Dict[str, Tuple[int, str]]] = None
+        self._lock = threading.Lock()  # one pass at a time, scheduled or on demand
+        self._leader = lease is None
+        self._tasks: List[asyncio.Task] = []
+
+    def profile_for(self, service_type: Optional[str]) -> DetectorConfig:
+        return self.profiles.get(service_type or "", DEFAULT_PROFILE)
+
+    def _load(self, db: Session, start: datetime, end: datetime):
+        """
+        Per-bucket averages of every series in [start, end), computed by the
+        database so only the rollups (at most series x buckets rows) come back;
+        each is timestamped with its bucket start
+        """
+        start_epoch = int((start - datetime(1970, 1, 1)).total_seconds())
+        offset = _epoch_seconds(ServiceMetric.timestamp, db.get_bind().dialect.name) - start_epoch
+        bucket = (offset // self.bucket_seconds).label("bucket")
+        rows = db.query(
+            ServiceMetric.service_id,
+            ServiceMetric.metric_name,
+            bucket,
+            func.avg(ServiceMetric.value)
+        ).filter(
+            ServiceMetric.timestamp >= start,
+            ServiceMetric.timestamp < end
+        ).group_by(
+            ServiceMetric.service_id, ServiceMetric.metric_name, bucket
+        ).all()
+        types = dict(db.query(MonitoredService.id, MonitoredService.type).all())
+
+        if not rows:
+            empty = np.array([])
+            return empty, empty, empty, empty, types
+        service_ids, names, buckets, values = zip(*rows)
+        offsets = np.asarray(buckets, dtype=np.int64) * np.timedelta64(self.bucket_seconds, "s")
+        return (
+            np.asarray(service_ids, dtype=np.int64),
+            np.asarray(names, dtype=str),
+            np.datetime64(start, "s") + offsets,
+            np.asarray(values, dtype=np.float64),
+            types,
+        )
+
+    def detect(self, db: Session, now: Optional[datetime] = None) -> List[Anomaly]:
+        """Score the most recent complete bucket of every series"""
+        now = now or datetime.utcnow()
+        epoch = int((now - datetime(1970, 1, 1)).total_seconds())
+        end = datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % self.bucket_seconds)
+        n_buckets = int(self.lookback_days * 86400 // self.bucket_seconds)
+        start = end - timedelta(seconds=n_buckets * self.bucket_seconds)
+
+        service_ids, names, timestamps, values, types = self._load(db, start, end)
+        keys, matrix = bucketize(service_ids, names, timestamps, values, start, n_buckets, self.bucket_seconds)
+
+        # Group rows by detector profile so each group is scored in one pass
+        groups: Dict[DetectorConfig, List[int]] = {}
+        for row, (service_id, metric_name) in enumerate(keys):
+            config = self.profile_for(types.get(service_id))
+            if config.metrics is None or metric_name in config.metrics:
+                groups.setdefault(config, []).append(row)
+
+        anomalies = []
+        for config, rows in groups.items():
+            anomalous, ratio, scores = evaluate(matrix[rows], config)
+            for i in np.flatnonzero(anomalous):
+                service_id, metric_name = keys[rows[i]]
+                anomalies.append(Anomaly(
+                    service_id=service_id,
+                    metric_name=metric_name,
+                    value=float(scores["value"][i]),
+                    baseline=float(scores["baseline"][i]),
+                    score=float(ratio[i]),
+                    severity="critical" if ratio[i] >= config.critical_factor else "warning"
+                ))
+        return anomalies
+
+    def _open_anomalies(self, db: Session) -> Dict[str, Tuple[int, str]]:
+        """
+        Anomaly alerts still open from earlier runs, so a restart can still clear them
+
+        Matched on the fingerprints this detector would compute for the
+        services' known metrics, so user alerts that merely share the title
+        prefix are left alone.
+        """
+        service_ids = [
+            service_id for (service_id,) in db.query(Alert.service_id).filter(
+                Alert.service_id.isnot(None),
+                Alert.title.startswith(TITLE_PREFIX),
+                Alert.status.in_(OPEN_ALERT_STATUSES)
+            ).distinct()
+        ]
+        if not service_ids:
+            return {}
+        expected = {}
+        for service_id, metric_name in db.query(
+            ServiceMetric.service_id, ServiceMetric.metric_name
+        ).filter(ServiceMetric.service_id.in_(service_ids)).distinct():
+            for severity in ("warning", "critical"):
+                fingerprint = alert_fingerprint(service_id, severity, f"{TITLE_PREFIX}{metric_name}")
+                expected[fingerprint] = (service_id, metric_name)
+        return {
+            fingerprint: expected[fingerprint]
+            for (fingerprint,) in db.query(Alert.fingerprint).filter(
+                Alert.fingerprint.in_(list(expected)),
+                Alert.status.in_(OPEN_ALERT_STATUSES)
+            )
+        }
+
+    def restore(self, db: Optional[Session] = None):
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            with self._lock:
+                self._raised = self._open_anomalies(db)
+        finally:
+            if own_session:
+                db.close()
+
+    def run_once(self, db: Optional[Session] = None) -> List[Anomaly]:
+        """
+        Detect, raise alerts for new anomalies and resolve cleared ones;
+        without the lease only detects
+        """
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            if not self._leader:
+                return self.detect(db)
+            with self._lock:
+                return self._run(db)
+        finally:
+            if own_session:
+                db.close()
+
+    def _run(self, db: Session) -> List[Anomaly]:
+        try:
+            if self._raised is None:
+                self._raised = self._open_anomalies(db)
+            anomalies = self.detect(db)
+            firing: Dict[str, Tuple[int, str]] = {}
+            for anomaly in anomalies:
+                title = f"{TITLE_PREFIX}{anomaly.metric_name}"
+                alert_pipeline.ingest(
+                    db,
+                    service_id=anomaly.service_id,
+                    severity=anomaly.severity,
+                    title=title,
+                    description=(
+                        f"{anomaly.metric_name} is {anomaly.value:.2f} against a baseline of "
+                        f"{anomaly.baseline:.2f} ({anomaly.score:.1f}x threshold)"
+                    )
+                )
+                firing[alert_fingerprint(anomaly.service_id, anomaly.severity, title)] = (
+                    anomaly.service_id, anomaly.metric_name
+                )
+
+            cleared = [fp for fp in self._raised if fp not in firing]
+            if cleared:
+                for alert in db.query(Alert).filter(
+                    Alert.fingerprint.in_(cleared),
+                    Alert.status.in_(OPEN_ALERT_STATUSES)
+                ):
+                    alert_pipeline.resolve(db, alert)
+            self._raised = firing
+
+            db.commit()
+            return anomalies
+        except Exception:
+            db.rollback()
+            raise
+
+    # ----- background loop -----
+
+    async def start(self):
+        if self._tasks:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.restore)
+        self._tasks = [asyncio.create_task(self._loop())]
+        if self.lease is not None:
+            self._tasks.append(asyncio.create_task(self._lease_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.lease is not None and self._leader:
+            self._leader = False
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.lease.release)
+            except Exception as e:
+                print(f"Anomaly detector lease release failed: {str(e)}")
+
+    async def _lease_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                leader = await loop.run_in_executor(None, self.lease.acquire)
+            except Exception as e:
+                print(f"Anomaly detector lease renewal failed: {str(e)}")
+                leader = False
+            if leader != self._leader:
+                self._raised = None  # the previous holder's alerts are read back on the next pass
+            self._leader = leader
+            await asyncio.sleep(self.lease.renew_interval)
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._leader:
+                continue
+            try:
+                await loop.run_in_executor(None, self.run_once)
+            except Exception as e:
+                print(f"Anomaly detection failed: {str(e)}")
+
+
+# Shared detector instance started by the application; the lease keeps it to one uvicorn worker
+anomaly_detector = AnomalyDetector(lease=Lease("anomaly_detector"))
@@ -0,0 +1,399 @@
+"""
+Technician availability
+Each technician's booked intervals are kept as sorted arrays (starts, ends and
+a running max of ends), so overlap checks and free-slot search are binary
+searches instead of queries. Recurring series ride along with each timeline
+and are expanded only for the window being checked. Timelines are loaded
+lazily and kept current from committed appointment writes.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import event
+from sqlalchemy import select
+from sqlalchemy.orm import Session, attributes, selectinload
+
+from models import Appointment, AppointmentException, AppointmentSeries
+from services.recurrence import Series, occurrence_key
+
+BLOCKING_STATUSES = ("scheduled", "confirmed")
+WORKDAY_START_HOUR = 9
+WORKDAY_END_HOUR = 17
+# Timelines cover this much history; older windows are read straight from the table
+HISTORY_DAYS = 7
+# Writes made by other processes are only seen on reload; bound the staleness
+TIMELINE_TTL_SECONDS = 60
+# How far ahead a new or changed series is checked for double bookings
+SERIES_CHECK_DAYS = 366
+
+Interval = Tuple[datetime, datetime]
+
+_PENDING_KEY = "availability_changes"
+_RESET_KEY = "availability_reset"
+_STALE_KEY = "availability_stale"
+_SERIES_TABLES = (AppointmentSeries.__tablename__, AppointmentException.__tablename__)
+
+
+class Timeline:
+    """One technician's booked intervals, in start order, from `floor` on, plus their series"""
+
+    __slots__ = ("starts", "ends", "ids", "max_ends", "series", "floor", "loaded_at")
+
+    def __init__(self, rows: Iterable[Tuple[int, datetime, datetime]], floor: datetime,
+                 series: Sequence[Series] = ()):
+        rows = sorted(rows, key=lambda row: (row[1], row[0]))
+        self.ids = [row[0] for row in rows]
+        self.starts = [row[1] for row in rows]
+        self.ends = [row[2] for row in rows]
+        self.max_ends: List[datetime] = []
+        self.series = list(series)
+        self.floor = floor
+        self.loaded_at = time.monotonic()
+        self._rebuild_max(0)
+
+    def _rebuild_max(self, index: int):
+        # max_ends[i] = latest end among the first i + 1 intervals; non-decreasing,
+        # so "first interval that could reach past t" is a bisect
+        del self.max_ends[index:]
+        running = self.max_ends[-1] if self.max_ends else None
+        for end in self.ends[index:]:
+            running = end if running is None or end > running else running
+            self.max_ends.append(running)
+
+    def add(self, appointment_id: int, start: datetime, end: datetime):
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.ids.insert(index, appointment_id)
+        self._rebuild_max(index)
+
+    def remove(self, appointment_id: int) -> bool:
+        try:
+            index = self.ids.index(appointment_id)
+        except ValueError:
+            return False
+        del self.starts[index], self.ends[index], self.ids[index]
+        self._rebuild_max(index)
+        return True
+
+    def _span(self, start: datetime, end: datetime) -> range:
+        # Intervals that may overlap [start, end): from the first whose running
+        # max end passes start, up to the last that starts before end
+        return range(bisect_right(self.max_ends, start), bisect_left(self.starts, end))
+
+    def _occurrences(self, start: datetime, end: datetime, exclude_series: Optional[int] = None):
+        for series in self.series:
+            if series.id == exclude_series:
+                continue
+            for original, s, e, status in series.occurrences(start, end):
+                if status in BLOCKING_STATUSES:
+                    yield occurrence_key(series.id, original), s, e
+
+    def conflicts(self, start: datetime, end: datetime, exclude_id: Union[int, str, None] = None,
+                  exclude_series: Optional[int] = None) -> List[Union[int, str]]:
+        """Appointment ids and occurrence keys overlapping [start, end)"""
+        found: List[Union[int, str]] = [
+            self.ids[i] for i in self._span(start, end)
+            if self.ends[i] > start and self.ids[i] != exclude_id
+        ]
+        found.extend(key for key, s, e in self._occurrences(start, end, exclude_series) if key != exclude_id)
+        return found
+
+    def busy(self, start: datetime, end: datetime) -> List[Interval]:
+        """Merged booked intervals clipped to [start, end)"""
+        intervals = [(self.starts[i], self.ends[i]) for i in self._span(start, end) if self.ends[i] > start]
+        if self.series:
+            intervals.extend((s, e) for key, s, e in self._occurrences(start, end))
+            intervals.sort()
+        merged: List[List[datetime]] = []
+        for interval_start, interval_end in intervals:
+            s, e = max(interval_start, start), min(interval_end, end)
+            if merged and s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        return [(s, e) for s, e in merged]
+
+
+def as_naive_utc(value: datetime) -> datetime:
+    """Appointment times are stored as naive UTC; accept aware input too"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def working_windows(start: datetime, end: datetime) -> List[Interval]:
+    """Working-hour stretches of each day inside [start, end)"""
+    windows = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        s = max(start, day.replace(hour=WORKDAY_START_HOUR))
+        e = min(end, day.replace(hour=WORKDAY_END_HOUR))
+        if s < e:
+            windows.append((s, e))
+        day += timedelta(days=1)
+    return windows
+
+
+def subtract(windows: Sequence[Interval], busy: Sequence[Interval], min_length: timedelta) -> List[Interval]:
+    """Non-empty parts of `windows` not covered by `busy` (both sorted), at least min_length long"""
+    free, i = [], 0
+    for w_start, w_end in windows:
+        cursor = w_start
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < w_end:
+            if busy[j][0] > cursor and busy[j][0] - cursor >= min_length:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if w_end > cursor and w_end - cursor >= min_length:
+            free.append((cursor, w_end))
+    return free
+
+
+class AvailabilityIndex:
+    """Per-technician timelines shared by the appointment endpoints"""
+
+    def __init__(self, ttl: float = TIMELINE_TTL_SECONDS):
+        self.ttl = ttl
+        self._timelines: Dict[int, Timeline] = {}
+        self._lock = threading.RLock()
+
+    def _floor(self) -> datetime:
+        return (datetime.utcnow() - timedelta(days=HISTORY_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def timelines(self, db: Session, technician_ids: Iterable[int],
+                  since: Optional[datetime] = None) -> Dict[int, Timeline]:
+        """Timelines covering `since` onwards, loading any missing ones in one query"""
+        floor = self._floor()
+        wanted = list(dict.fromkeys(technician_ids))
+        if since is not None and since < floor:
+            # Older than what's kept: a throwaway timeline for this window only
+            return self._load(db, wanted, since)
+
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for tech in wanted:
+                timeline = self._timelines.get(tech)
+                if timeline is not None and now - timeline.loaded_at < self.ttl and timeline.floor <= floor:
+                    found[tech] = timeline
+        missing = [tech for tech in wanted if tech not in found]
+        if missing:
+            loaded = self._load(db, missing, floor)
+            with self._lock:
+                self._timelines.update(loaded)
+            found.update(loaded)
+        return found
+
+    def _load(self, db: Session, technician_ids: List[int], floor: datetime,
+              until: Optional[datetime] = None) -> Dict[int, Timeline]:
+        rows: Dict[int, list] = {tech: [] for tech in technician_ids}
+        # Uses ix_appointments_technician_start
+        query = db.query(
+            Appointment.id, Appointment.technician_id, Appointment.start_time, Appointment.end_time
+        ).filter(
+            Appointment.technician_id.in_(technician_ids),
+            Appointment.start_time >= floor - timedelta(days=1),
+            Appointment.status.in_(BLOCKING_STATUSES)
+        )
+        if until is not None:
+            query = query.filter(Appointment.start_time < until)
+        for appt_id, tech, start, end in query:
+            rows[tech].append((appt_id, start, end))
+        series: Dict[int, List[Series]] = {tech: [] for tech in technician_ids}
+        for row in db.execute(
+            select(AppointmentSeries)
+            .options(selectinload(AppointmentSeries.exceptions))
+            .where(
+                AppointmentSeries.technician_id.in_(technician_ids),
+                AppointmentSeries.status.in_(BLOCKING_STATUSES),
+                (AppointmentSeries.ends_at.is_(None)) | (AppointmentSeries.ends_at > floor)
+            )
+        ).scalars():
+            series[row.technician_id].append(Series.from_row(row))
+        return {tech: Timeline(tech_rows, floor, series[tech]) for tech, tech_rows in rows.items()}
+
+    # ----- queries -----
+
+    def _timeline(self, db: Session, technician_id: int, start: datetime, end: datetime, fresh: bool) -> Timeline:
+        if fresh:
+            # Read through the caller's transaction and keep nothing: shared
+            # timelines can lag writes committed by other workers
+            return self._load(db, [technician_id], start, end)[technician_id]
+        return self.timelines(db, [technician_id], start)[technician_id]
+
+    def conflicts(self, db: Session, technician_id: int, start: datetime, end: datetime,
+                  exclude_id: Union[int, str, None] = None, exclude_series: Optional[int] = None,
+                  fresh: bool = False) -> List[Union[int, str]]:
+        """
+        Ids of booked appointments (and keys of series occurrences) overlapping
+        [start, end); `fresh` checks the database instead of the shared
+        timeline, for the final check before a write commits
+        """
+        timeline = self._timeline(db, technician_id, start, end, fresh)
+        with self._lock:
+            return timeline.conflicts(start, end, exclude_id, exclude_series)
+
+    def is_free(self, db: Session, technician_id: int, start: datetime, end: datetime,
+                exclude_id: Union[int, str, None] = None, exclude_series: Optional[int] = None,
+                fresh: bool = False) -> bool:
+        return not self.conflicts(db, technician_id, start, end, exclude_id, exclude_series, fresh)
+
+    def series_conflicts(self, db: Session, technician_id: int, series: Series,
+                         exclude_series: Optional[int] = None, limit: int = 10,
+                         fresh: bool = False) -> List[Interval]:
+        """
+        Occurrences of `series` that would double-book the technician
+
+        Checked up to SERIES_CHECK_DAYS ahead, one binary search per
+        occurrence against the loaded timeline; nothing is materialized.
+        """
+        start = series.recurrence.dtstart
+        horizon = max(start, datetime.utcnow()) + timedelta(days=SERIES_CHECK_DAYS)
+        timeline = self._timeline(db, technician_id, start, horizon, fresh)
+        clashes = []
+        with self._lock:
+            for original, s, e, status in series.occurrences(start, horizon):
+                if status in BLOCKING_STATUSES and timeline.conflicts(s, e, exclude_series=exclude_series):
+                    clashes.append((s, e))
+                    if len(clashes) >= limit:
+                        break
+        return clashes
+
+    def busy(self, db: Session, technician_id: int, start: datetime, end: datetime) -> List[Interval]:
+        timeline = self.timelines(db, [technician_id], start)[technician_id]
+        with self._lock:
+            return timeline.busy(start, end)
+
+    def free_slots(self, db: Session, technician_id: int, start: datetime, end: datetime,
+                   min_duration: timedelta = timedelta(0)) -> List[Interval]:
+        """Unbooked working-hour stretches in [start, end), each at least min_duration"""
+        return subtract(working_windows(start, end), self.busy(db, technician_id, start, end), min_duration)
+
+    def first_available(
+        self,
+        db: Session,
+        technician_ids: Sequence[int],
+        start: datetime,
+        end: datetime,
+        duration: Optional[timedelta] = None
+    ) -> Optional[Tuple[int, datetime, datetime]]:
+        """
+        Earliest (technician, start, end) that fits
+
+        Without a duration the slot is exactly [start, end), working hours or
+        not; with one, the earliest working-hour slot of that length inside
+        the window. Ties go to the technician listed first.
+        """
+        timelines = self.timelines(db, technician_ids, start)
+        best = None
+        with self._lock:
+            for tech in technician_ids:
+                timeline = timelines[tech]
+                if duration is None:
+                    if not timeline.conflicts(start, end):
+                        return tech, start, end
+                    continue
+                free = subtract(working_windows(start, end), timeline.busy(start, end), duration)
+                if free and (best is None or free[0][0] < best[1]):
+                    best = (tech, free[0][0], free[0][0] + duration)
+        return best
+
+    # ----- write tracking -----
+
+    def apply(self, changes: Iterable[Tuple[int, Optional[int], Optional[int], Optional[Interval]]]):
+        """Apply committed (appointment, old technician, new technician, new interval) changes"""
+        with self._lock:
+            for appt_id, old_tech, new_tech, interval in changes:
+                for tech in {old_tech, new_tech} - {None}:
+                    timeline = self._timelines.get(tech)
+                    if timeline is not None:
+                        timeline.remove(appt_id)
+                timeline = self._timelines.get(new_tech) if interval is not None else None
+                if timeline is not None:
+                    timeline.add(appt_id, *interval)
+
+    def invalidate(self, technician_ids: Iterable[Optional[int]]):
+        """Drop timelines so they reload on next use (series changes)"""
+        with self._lock:
+            for tech in technician_ids:
+                self._timelines.pop(tech, None)
+
+    def clear(self):
+        with self._lock:
+            self._timelines.clear()
+
+
+# Shared index for the process
+availability = AvailabilityIndex()
+
+
+def _previous(obj, key: str):
+    history = attributes.get_history(obj, key)
+    return history.deleted[0] if history.deleted else getattr(obj, key)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_appointment_changes(session, flush_context):
+    changes = []
+    stale = set()
+    exception_series = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, AppointmentSeries):
+            stale.update({_previous(obj, "technician_id"), obj.technician_id})
+            continue
+        if isinstance(obj, AppointmentException):
+            exception_series.add(_previous(obj, "series_id"))
+            continue
+        if not isinstance(obj, Appointment):
+            continue
+        blocking = obj not in session.deleted and obj.status in BLOCKING_STATUSES
+        changes.append((
+            obj.id,
+            None if obj in session.new else _previous(obj, "technician_id"),
+            obj.technician_id,
+            (obj.start_time, obj.end_time) if blocking else None
+        ))
+    if changes:
+        session.info.setdefault(_PENDING_KEY, []).extend(changes)
+    if exception_series:
+        stale.update(session.connection().execute(
+            select(AppointmentSeries.technician_id).where(AppointmentSeries.id.in_(list(exception_series)))
+        ).scalars())
+    if stale:
+        session.info.setdefault(_STALE_KEY, set()).update(stale - {None})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_writes(orm_execute_state):
+    # Statement-level writes don't say which rows they hit
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in (Appointment.__tablename__,) + _SERIES_TABLES:
+            orm_execute_state.session.info[_RESET_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_appointment_changes(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    stale = session.info.pop(_STALE_KEY, None)
+    if session.info.pop(_RESET_KEY, False):
+        availability.clear()
+        return
+    if changes:
+        availability.apply(changes)
+    if stale:
+        availability.invalidate(stale)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_appointment_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_STALE_KEY, None)
+    session.info.pop(_RESET_KEY, None)
@@ -0,0 +1,295 @@
+"""
+Per-board change streams
+Card, column and ticket changes are turned into small deltas at flush time
+and published after commit, tagged with the Board.version they produced, so
+open boards apply them instead of re-fetching the whole snapshot
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+
+from models import Board, BoardCard, BoardColumn, Ticket
+# Its after_flush listener bumps Board.version; ours must be registered after it
+import shared.etag
+
+# Recent events kept per board so a reconnecting client can catch up
+EVENT_BUFFER_SIZE = 256
+# Keep collecting this long after the last subscriber leaves, for reconnects
+RESUME_WINDOW_SECONDS = 120
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+
+# Ticket fields shown on a card
+CARD_TICKET_FIELDS = ("ticket_number", "title", "status", "priority", "assigned_to")
+COLUMN_FIELDS = ("name", "rank", "wip_limit", "stage", "color")
+
+_PENDING_KEY = "board_events"
+_RESYNC_KEY = "board_events_resync"
+
+
+class BoardEventHub:
+    """
+    In-process fan-out of board events to subscriber queues
+
+    Events are published from whichever thread committed; delivery always
+    happens on the subscriber's event loop. A subscriber that falls behind
+    gets a single resync event instead of an unbounded backlog.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.buffer_size = buffer_size
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._recent: Dict[int, deque] = {}
+        self._last_seen = 0.0
+        self._lock = threading.Lock()
+
+    def listening(self) -> bool:
+        """True while anyone is subscribed, or left recently enough to resume"""
+        return bool(self._subscribers) or time.monotonic() - self._last_seen < RESUME_WINDOW_SECONDS
+
+    def subscribe(self, board_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(board_id, set()).add((asyncio.get_running_loop(), queue))
+            self._last_seen = time.monotonic()
+        return queue
+
+    def unsubscribe(self, board_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(board_id, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(board_id, None)
+            self._last_seen = time.monotonic()
+
+    def replay(self, board_id: int, since: int, current: int) -> Optional[List[Dict[str, Any]]]:
+        """Buffered events after `since`; None when some of them are no longer buffered"""
+        if since >= current:
+            return []
+        with self._lock:
+            recent = list(self._recent.get(board_id, ()))
+        # Versions can advance by more than one per commit, so only an event
+        # at since + 1 proves nothing in between was dropped
+        if not recent or recent[0]["version"] > since + 1:
+            return None
+        return [evt for evt in recent if evt["version"] > since]
+
+    def publish(self, board_id: int, evt: Dict[str, Any]):
+        with self._lock:
+            if evt["type"] == "resync":
+                # History before an unexplained change can't be replayed
+                self._recent.pop(board_id, None)
+            else:
+                self._recent.setdefault(board_id, deque(maxlen=self.buffer_size)).append(evt)
+            subscribers = list(self._subscribers.get(board_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, evt)
+            except RuntimeError:
+                pass  # subscriber's loop already closed
+
+    def publish_resync(self, board_ids=None):
+        """Tell subscribers to re-fetch; None means every subscribed board"""
+        with self._lock:
+            targets = set(self._subscribers) | set(self._recent) if board_ids is None else set(board_ids)
+        for board_id in targets:
+            self.publish(board_id, {"type": "resync", "board_id": board_id, "version": None})
+
+    def forget(self):
+        with self._lock:
+            self._recent.clear()
+
+    async def follow(self, board_id: int, since: Optional[int], current: int) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Events for one subscriber, starting after version `since`
+
+        `current` is the board version read just before subscribing; with no
+        `since` the stream starts there. Yields None every HEARTBEAT_SECONDS
+        of silence so the transport can keep the connection alive.
+        """
+        queue = self.subscribe(board_id)
+        try:
+            last = current if since is None else since
+            backlog = self.replay(board_id, last, current)
+            if backlog is None:
+                yield {"type": "resync", "board_id": board_id, "version": current}
+                last = current
+            for evt in backlog or ():
+                last = max(last, evt["version"])
+                yield evt
+            while True:
+                try:
+                    evt = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if evt["version"] is not None:
+                    if evt["version"] <= last:
+                        continue  # already replayed
+                    last = evt["version"]
+                yield evt
+        finally:
+            self.unsubscribe(board_id, queue)
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, evt: Dict[str, Any]):
+        try:
+            queue.put_nowait(evt)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync", "board_id": evt["board_id"], "version": None})
+
+
+# Shared hub for the process
+board_events = BoardEventHub()
+
+
+# ----- change capture -----
+
+def _changed(obj, *keys: str) -> bool:
+    return any(attributes.get_history(obj, key).has_changes() for key in keys)
+
+
+def _previous(obj, key: str):
+    history = attributes.get_history(obj, key)
+    return history.deleted[0] if history.deleted else getattr(obj, key)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_board_changes(session, flush_context):
+    if not board_events.listening():
+        board_events.forget()
+        return
+
+    changes: List[Tuple[Optional[int], Optional[int], Dict[str, Any]]] = []  # (board, column, change)
+    added_tickets: Set[int] = set()
+    updated_tickets: Dict[int, Dict[str, Any]] = {}
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, BoardCard):
+            if obj in session.deleted:
+                column_id = _previous(obj, "board_column_id")
+                changes.append((None, column_id, {
+                    "type": "card_removed", "card_id": obj.id, "column_id": column_id
+                }))
+            elif obj in session.new:
+                added_tickets.add(obj.ticket_id)
+                changes.append((None, obj.board_column_id, {
+                    "type": "card_added", "card_id": obj.id, "column_id": obj.board_column_id,
+                    "rank": obj.rank, "version": obj.version, "ticket_id": obj.ticket_id
+                }))
+            elif _changed(obj, "board_column_id", "rank"):
+                change = {
+                    "type": "card_moved", "card_id": obj.id,
+                    "from_column_id": _previous(obj, "board_column_id"),
+                    "column_id": obj.board_column_id, "rank": obj.rank, "version": obj.version
+                }
+                changes.append((None, obj.board_column_id, change))
+                if change["from_column_id"] != obj.board_column_id:
+                    # Lets a subscriber of the old column's board drop the card too
+                    changes.append((None, change["from_column_id"], change))
+        elif isinstance(obj, BoardColumn):
+            board_id = _previous(obj, "board_id")
+            if obj in session.deleted:
+                changes.append((board_id, None, {"type": "column_removed", "column_id": obj.id}))
+            elif obj in session.new or _changed(obj, *COLUMN_FIELDS):
+                column = {"id": obj.id, **{key: getattr(obj, key) for key in COLUMN_FIELDS}}
+                changes.append((board_id, None, {"type": "column_updated", "column": column}))
+        elif isinstance(obj, Board) and obj not in session.new and obj not in session.deleted:
+            if _changed(obj, "name", "description", "is_active"):
+                changes.append((obj.id, None, {
+                    "type": "board_updated", "name": obj.name,
+                    "description": obj.description, "is_active": obj.is_active
+                }))
+        elif isinstance(obj, Ticket) and obj not in session.new and obj not in session.deleted:
+            fields = {key: getattr(obj, key) for key in CARD_TICKET_FIELDS if _changed(obj, key)}
+            if fields:
+                updated_tickets[obj.id] = fields
+
+    if not changes and not updated_tickets:
+        return
+
+    connection = session.connection()
+    column_ids = {column_id for board_id, column_id, change in changes if board_id is None}
+    column_boards = dict(connection.execute(
+        select(BoardColumn.id, BoardColumn.board_id).where(BoardColumn.id.in_(list(column_ids)))
+    ).all()) if column_ids else {}
+
+    by_board: Dict[int, List[Dict[str, Any]]] = {}
+    for board_id, column_id, change in changes:
+        board_id = board_id if board_id is not None else column_boards.get(column_id)
+        board_changes = by_board.setdefault(board_id, []) if board_id is not None else None
+        # A card moved between columns of one board is listed once
+        if board_changes is not None and not any(existing is change for existing in board_changes):
+            board_changes.append(change)
+
+    if added_tickets:
+        summaries = {
+            row.id: {"id": row.id, **{key: getattr(row, key) for key in CARD_TICKET_FIELDS}}
+            for row in connection.execute(
+                select(Ticket.id, *[getattr(Ticket, key) for key in CARD_TICKET_FIELDS])
+                .where(Ticket.id.in_(list(added_tickets)))
+            )
+        }
+        for board_changes in by_board.values():
+            for change in board_changes:
+                if change["type"] == "card_added":
+                    change["ticket"] = summaries.get(change.pop("ticket_id"))
+
+    if updated_tickets:
+        for board_id, card_id, ticket_id in connection.execute(
+            select(BoardColumn.board_id, BoardCard.id, BoardCard.ticket_id)
+            .join(BoardCard, BoardCard.board_column_id == BoardColumn.id)
+            .where(BoardCard.ticket_id.in_(list(updated_tickets)))
+        ):
+            by_board.setdefault(board_id, []).append({
+                "type": "ticket_updated", "card_id": card_id, "ticket_id": ticket_id,
+                **updated_tickets[ticket_id]
+            })
+
+    if not by_board:
+        return
+    versions = dict(connection.execute(
+        select(Board.id, Board.version).where(Board.id.in_(list(by_board)))
+    ).all())
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for board_id, board_changes in by_board.items():
+        entry = pending.setdefault(board_id, {"version": None, "changes": []})
+        entry["version"] = versions.get(board_id, entry["version"])
+        entry["changes"].extend(board_changes)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_writes(orm_execute_state):
+    # Statement-level ticket writes (CRUDBase bulk ops) don't say which rows they hit
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if getattr(table, "name", None) == Ticket.__tablename__:
+        orm_execute_state.session.info[_RESYNC_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_board_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    resync = session.info.pop(_RESYNC_KEY, False)
+    if resync:
+        board_events.publish_resync()
+    for board_id, entry in (pending or {}).items():
+        board_events.publish(board_id, {
+            "type": "changes", "board_id": board_id,
+            "version": entry["version"], "changes": entry["changes"]
+        })
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_board_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_RESYNC_KEY, None)
@@ -0,0 +1,256 @@
+"""
+Kanban flow: WIP limits, the card movement log and flow metrics
+Column card counts are maintained on every move, so WIP checks are a single
+conditional UPDATE; each move also updates per-column daily rollups, from
+which cumulative flow and throughput are read without scanning the log
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import BoardCard, BoardCardMovement, BoardColumn, BoardFlowDaily
+
+STAGES = ("queue", "active", "done")
+DEFAULT_FLOW_DAYS = 30
+MAX_FLOW_DAYS = 365
+
+
+def _claim_slot(db: Session, column: BoardColumn):
+    """Count a card into the column unless that would break its WIP limit"""
+    claimed = db.execute(
+        update(BoardColumn)
+        .where(BoardColumn.id == column.id)
+        .where((BoardColumn.wip_limit.is_(None)) | (BoardColumn.card_count < BoardColumn.wip_limit))
+        .values(card_count=BoardColumn.card_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        # Nothing of this request may be committed by a later flush
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=f"WIP limit of {column.wip_limit} reached for column '{column.name}'"
+        )
+
+
+def _bump_daily(db: Session, column_id: int, board_id: int, day: date, card_count: int, **increments):
+    values = {"card_count": card_count}
+    values.update({key: getattr(BoardFlowDaily, key) + amount for key, amount in increments.items()})
+    updated = db.execute(
+        update(BoardFlowDaily)
+        .where(BoardFlowDaily.board_id == board_id, BoardFlowDaily.column_id == column_id,
+               BoardFlowDaily.day == day)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if updated:
+        return
+    try:
+        with db.begin_nested():
+            db.add(BoardFlowDaily(board_id=board_id, column_id=column_id, day=day,
+                                  card_count=card_count, **increments))
+    except IntegrityError:
+        # Another request created today's row first
+        _bump_daily(db, column_id, board_id, day, card_count, **increments)
+
+
+def record_move(
+    db: Session,
+    card: BoardCard,
+    source: Optional[BoardColumn],
+    target: Optional[BoardColumn],
+    user_id: Optional[int] = None,
+    now: Optional[datetime] = None
+) -> Optional[BoardCardMovement]:
+    """
+    Account for a card entering `target` and/or leaving `source`
+
+    Enforces the target's WIP limit (409, with the transaction rolled back),
+    keeps column counts, lead/cycle timestamps and daily rollups current, and
+    appends to the movement log. Reordering within a column is not a move.
+    """
+    if source is None and target is None:
+        return None
+    if source is not None and target is not None and source.id == target.id:
+        return None
+    now = now or datetime.utcnow()
+
+    if target is not None:
+        _claim_slot(db, target)
+    if source is not None:
+        db.execute(
+            update(BoardColumn)
+            .where(BoardColumn.id == source.id)
+            .values(card_count=BoardColumn.card_count - 1)
+            .execution_options(synchronize_session=False)
+        )
+    if source is None and card.entered_at is None:
+        card.entered_at = now
+    if card.id is None:
+        db.flush()
+
+    lead = cycle = None
+    if target is not None:
+        if target.stage == "active" and card.started_at is None:
+            card.started_at = now
+        if target.stage == "done" and (source is None or source.stage != "done"):
+            lead = (now - card.entered_at).total_seconds() / 60 if card.entered_at else None
+            cycle = (now - card.started_at).total_seconds() / 60 if card.started_at else None
+
+    movement = BoardCardMovement(
+        board_id=(target or source).board_id,
+        card_id=card.id,
+        ticket_id=card.ticket_id,
+        from_column_id=source.id if source is not None else None,
+        to_column_id=target.id if target is not None else None,
+        moved_by=user_id,
+        moved_at=now,
+        lead_minutes=lead,
+        cycle_minutes=cycle
+    )
+    db.add(movement)
+
+    columns = [column for column in (source, target) if column is not None]
+    counts = dict(db.execute(
+        select(BoardColumn.id, BoardColumn.card_count).where(BoardColumn.id.in_([c.id for c in columns]))
+    ).all())
+    for column in columns:
+        increments = {}
+        if column is target:
+            increments["entered"] = 1
+            if lead is not None:
+                increments.update(completed=1, lead_minutes_total=lead)
+                if cycle is not None:
+                    increments.update(cycle_minutes_total=cycle, cycle_completed=1)
+        _bump_daily(db, column.id, column.board_id, now.date(), counts.get(column.id, 0), **increments)
+    return movement
+
+
+def record_column_removal(db: Session, column: BoardColumn, user_id: Optional[int] = None):
+    """Log the removal of every card in a column that is being deleted, in one insert"""
+    now = datetime.utcnow()
+    cards = db.execute(
+        select(BoardCard.id, BoardCard.ticket_id).where(BoardCard.board_column_id == column.id)
+    ).all()
+    if cards:
+        db.add_all([
+            BoardCardMovement(board_id=column.board_id, card_id=card.id, ticket_id=card.ticket_id,
+                              from_column_id=column.id, moved_by=user_id, moved_at=now)
+            for card in cards
+        ])
+    _bump_daily(db, column.id, column.board_id, now.date(), 0)
+
+
+def reconcile_card_counts(db: Session) -> int:
+    """Re-derive every column's card_count from its cards (repairs drift and pre-existing boards)"""
+    actual = (
+        select(func.count(BoardCard.id))
+        .where(BoardCard.board_column_id == BoardColumn.id)
+        .scalar_subquery()
+    )
+    return db.execute(
+        update(BoardColumn)
+        .where(BoardColumn.card_count != actual)
+        .values(card_count=actual)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _hours(minutes: Optional[float]) -> Optional[float]:
+    return round(minutes / 60, 2) if minutes is not None else None
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "average_hours": _hours(sum(values) / len(values)) if values else None,
+        "p50_hours": _hours(_percentile(values, 0.5)),
+        "p85_hours": _hours(_percentile(values, 0.85))
+    }
+
+
+def flow_metrics(db: Session, board_id: int, columns: Sequence[BoardColumn], days: int = DEFAULT_FLOW_DAYS,
+                 today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Cumulative flow, throughput, lead and cycle time over the last `days`
+
+    Reads the daily rollups inside the window (plus each column's last row
+    before it, to carry counts forward) and only the completions in the
+    window from the log.
+    """
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+
+    # Each column's count going into the window
+    before = (
+        select(BoardFlowDaily.column_id, func.max(BoardFlowDaily.day).label("day"))
+        .where(BoardFlowDaily.board_id == board_id, BoardFlowDaily.day < start)
+        .group_by(BoardFlowDaily.column_id)
+        .subquery()
+    )
+    carried = dict(db.execute(
+        select(BoardFlowDaily.column_id, BoardFlowDaily.card_count)
+        .join(before, (BoardFlowDaily.column_id == before.c.column_id) & (BoardFlowDaily.day == before.c.day))
+        .where(BoardFlowDaily.board_id == board_id)
+    ).all())
+    rows = db.execute(
+        select(BoardFlowDaily)
+        .where(BoardFlowDaily.board_id == board_id, BoardFlowDaily.day >= start)
+        .order_by(BoardFlowDaily.day)
+    ).scalars().all()
+
+    by_day: Dict[date, List[BoardFlowDaily]] = {}
+    for row in rows:
+        by_day.setdefault(row.day, []).append(row)
+
+    # A column no move ever touched still holds the cards it has now
+    touched = carried.keys() | {row.column_id for row in rows}
+    counts = {
+        column.id: carried.get(column.id, 0) if column.id in touched else column.card_count
+        for column in columns
+    }
+    cumulative_flow, throughput = [], []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        completed = 0
+        for row in by_day.get(day, ()):
+            if row.column_id in counts:
+                counts[row.column_id] = row.card_count
+            completed += row.completed
+        cumulative_flow.append({"date": day.isoformat(), "counts": {str(k): v for k, v in counts.items()}})
+        throughput.append({"date": day.isoformat(), "completed": completed})
+
+    completions = db.execute(
+        select(BoardCardMovement.lead_minutes, BoardCardMovement.cycle_minutes)
+        .where(
+            BoardCardMovement.board_id == board_id,
+            BoardCardMovement.moved_at >= datetime.combine(start, datetime.min.time()),
+            BoardCardMovement.lead_minutes.isnot(None)
+        )
+    ).all()
+
+    return {
+        "board_id": board_id,
+        "from": start.isoformat(),
+        "to": today.isoformat(),
+        "columns": [
+            {"id": column.id, "name": column.name, "stage": column.stage,
+             "card_count": column.card_count, "wip_limit": column.wip_limit}
+            for column in columns
+        ],
+        "cumulative_flow": cumulative_flow,
+        "throughput": throughput,
+        "lead_time": _summary([row.lead_minutes for row in completions]),
+        "cycle_time": _summary([row.cycle_minutes for row in completions if row.cycle_minutes is not None])
+    }
@@ -0,0 +1,282 @@
+"""
+Kanban board snapshots and column/card ordering
+A board's columns, cards and ticket summaries are read in two queries and
+grouped in one pass; snapshots are cached per Board.version, which every
+card move and ticket update advances. Columns and cards are ordered by rank
+keys, so a move writes only the row that moved.
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from sqlalchemy import distinct, func, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Board, BoardCard, BoardColumn, Ticket
+from shared.cache import TTLCache
+from services.board_flow import reconcile_card_counts
+from shared.ranking import evenly_spaced_ranks, rank_between
+
+# Short-lived: entries are keyed by version, so the TTL only bounds memory
+SNAPSHOT_TTL_SECONDS = 30
+SNAPSHOT_MAX_BOARDS = 256
+# Keys grow by about one character per few inserts at the same spot
+REBALANCE_LENGTH = 12
+REBALANCE_INTERVAL_SECONDS = 600
+
+snapshot_cache = TTLCache(ttl=SNAPSHOT_TTL_SECONDS, max_entries=SNAPSHOT_MAX_BOARDS)
+
+Ranked = Union[BoardColumn, BoardCard]
+
+
+def _parent(model) -> Any:
+    # Rows are ranked among their siblings: columns per board, cards per column
+    return BoardColumn.board_id if model is BoardColumn else BoardCard.board_column_id
+
+
+def _ordering(model) -> tuple:
+    # Unranked (legacy) rows sort last, in their old position order
+    return (model.rank.is_(None), model.rank, model.position, model.id)
+
+
+def _load_snapshot(db: Session, board_id: int) -> Optional[Dict[str, Any]]:
+    # Query 1: the board and its columns
+    rows = db.execute(
+        select(
+            Board.id, Board.name, Board.description, Board.team_id, Board.created_by, Board.version,
+            BoardColumn.id.label("column_id"), BoardColumn.name.label("column_name"), BoardColumn.rank,
+            BoardColumn.wip_limit, BoardColumn.card_count, BoardColumn.stage, BoardColumn.color
+        )
+        .outerjoin(BoardColumn, BoardColumn.board_id == Board.id)
+        .where(Board.id == board_id)
+        .order_by(*_ordering(BoardColumn))
+    ).all()
+    if not rows:
+        return None
+
+    first = rows[0]
+    columns: List[Dict[str, Any]] = []
+    by_column: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        if row.column_id is None:
+            continue
+        cards: List[Dict[str, Any]] = []
+        by_column[row.column_id] = cards
+        columns.append({
+            "id": row.column_id,
+            "name": row.column_name,
+            "position": len(columns),
+            "rank": row.rank,
+            "wip_limit": row.wip_limit,
+            "card_count": row.card_count,
+            "stage": row.stage,
+            "color": row.color,
+            "cards": cards
+        })
+
+    # Query 2: every card on the board with its ticket summary, already in
+    # column order, appended to its column in one pass
+    if by_column:
+        cards = db.execute(
+            select(
+                BoardCard.id, BoardCard.board_column_id, BoardCard.rank, BoardCard.version,
+                Ticket.id.label("ticket_id"), Ticket.ticket_number, Ticket.title,
+                Ticket.status, Ticket.priority, Ticket.assigned_to
+            )
+            .join(Ticket, BoardCard.ticket_id == Ticket.id)
+            .where(BoardCard.board_column_id.in_(list(by_column)))
+            .order_by(BoardCard.board_column_id, *_ordering(BoardCard))
+        ).all()
+        for card in cards:
+            siblings = by_column[card.board_column_id]
+            siblings.append({
+                "id": card.id,
+                "position": len(siblings),
+                "rank": card.rank,
+                "version": card.version,
+                "ticket": {
+                    "id": card.ticket_id,
+                    "ticket_number": card.ticket_number,
+                    "title": card.title,
+                    "status": card.status,
+                    "priority": card.priority,
+                    "assigned_to": card.assigned_to
+                }
+            })
+
+    return {
+        "id": first.id,
+        "name": first.name,
+        "description": first.description,
+        "team_id": first.team_id,
+        "created_by": first.created_by,
+        "version": first.version,
+        "columns": columns
+    }
+
+
+def board_snapshot(db: Session, board_id: int, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Board with columns, cards and ticket summaries; None if it doesn't exist
+
+    Pass the Board.version already read (e.g. for the ETag) to serve a
+    cached snapshot with no further queries. Snapshots are shared between
+    callers and must not be mutated.
+    """
+    if version is not None:
+        cached = snapshot_cache.get((board_id, version), ())
+        if cached is not None:
+            return cached
+
+    snapshot = _load_snapshot(db, board_id)
+    if snapshot is not None:
+        # Keyed by the version the rows were read at, which may be newer
+        snapshot_cache.set((board_id, snapshot["version"]), (), snapshot)
+    return snapshot
+
+
+def column_counts(db: Session, board_ids: List[int]) -> Dict[int, int]:
+    """Number of columns per board, in one grouped query"""
+    if not board_ids:
+        return {}
+    rows = db.execute(
+        select(BoardColumn.board_id, func.count(BoardColumn.id))
+        .where(BoardColumn.board_id.in_(board_ids))
+        .group_by(BoardColumn.board_id)
+    ).all()
+    return {board_id: count for board_id, count in rows}
+
+
+def rebalance(db: Session, model, parent_id: int) -> int:
+    """Respace the ranks of every column of a board (or card of a column); returns the row count"""
+    rows = db.query(model).filter(_parent(model) == parent_id).order_by(*_ordering(model)).all()
+    for index, (row, rank) in enumerate(zip(rows, evenly_spaced_ranks(len(rows)))):
+        row.rank = rank
+        row.position = index
+    db.flush()
+    return len(rows)
+
+
+def rank_at(db: Session, model, parent_id: int, position: Optional[int] = None,
+            exclude_id: Optional[int] = None) -> str:
+    """
+    Rank that places a row at index `position` among its siblings
+
+    position None (or past the end) appends. Only the two neighbouring keys
+    are read; if they are missing or collide, the siblings are rebalanced
+    and the lookup retried once.
+    """
+    for attempt in range(2):
+        siblings = db.query(model.rank).filter(_parent(model) == parent_id)
+        if exclude_id is not None:
+            siblings = siblings.filter(model.id != exclude_id)
+
+        lo = hi = None
+        ranked = True
+        appending = position is None
+        if not appending:
+            position = max(position, 0)
+            keys = [
+                row.rank for row in siblings.order_by(*_ordering(model))
+                .offset(max(position - 1, 0)).limit(2 if position else 1)
+            ]
+            if position == 0:
+                hi = keys[0] if keys else None
+                ranked = not keys or hi is not None
+            elif keys:
+                lo = keys[0]
+                hi = keys[1] if len(keys) > 1 else None
+                ranked = None not in keys
+            else:
+                appending = True
+        if appending:
+            # Both are seeks on the (parent, rank) index; no count of the siblings
+            lo = siblings.with_entities(func.max(model.rank)).scalar()
+            ranked = siblings.filter(model.rank.is_(None)).first() is None
+
+        if ranked:
+            try:
+                return rank_between(lo, hi)
+            except ValueError:
+                pass  # duplicate neighbours
+        if attempt == 0:
+            rebalance(db, model, parent_id)
+    raise ValueError(f"Could not rank {model.__name__} under {parent_id}")
+
+
+class RankRebalancer:
+    """
+    Periodic board upkeep: respaces siblings whose rank keys grew long,
+    collided or were never set, and corrects drifted column card counts
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        *,
+        interval: float = REBALANCE_INTERVAL_SECONDS,
+        max_length: int = REBALANCE_LENGTH
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_length = max_length
+        self._task: Optional[asyncio.Task] = None
+
+    def needs_rebalance(self, db: Session, model) -> List[int]:
+        """Parents with an over-long, duplicate or missing rank among their rows"""
+        parent = _parent(model)
+        return db.execute(
+            select(parent)
+            .where(parent.isnot(None))
+            .group_by(parent)
+            .having(or_(
+                func.max(func.length(model.rank)) > self.max_length,
+                func.count(model.rank) < func.count(),
+                func.count(distinct(model.rank)) < func.count(model.rank)
+            ))
+        ).scalars().all()
+
+    def run_once(self, db: Optional[Session] = None) -> int:
+        """Rebalance every parent that needs it and fix card counts; returns how many were rebalanced"""
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            rebalanced = 0
+            for model in (BoardColumn, BoardCard):
+                for parent_id in self.needs_rebalance(db, model):
+                    rebalance(db, model, parent_id)
+                    rebalanced += 1
+            reconcile_card_counts(db)
+            db.commit()
+            return rebalanced
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+    # ----- background loop -----
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.run_once)
+            except Exception as e:
+                print(f"Rank rebalancing failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+# Shared rebalancer started by the application
+rank_rebalancer = RankRebalancer()
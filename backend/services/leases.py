@@ -0,0 +1,82 @@
+"""
+Database leases for background workers that must run in one process only
+With several uvicorn workers (or hosts) each process starts every worker;
+a lease lets exactly one of them do the work while the others stand by
+and take over once the holder stops renewing.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import WorkerLease
+
+LEASE_TTL_SECONDS = 30
+
+
+class Lease:
+    """
+    A named lease held by at most one process at a time
+
+    Taking or renewing it is a single conditional UPDATE (only if this
+    process holds it or it has expired), or an INSERT the first time the
+    name is used, so two processes can never both succeed.
+    """
+
+    def __init__(self, name: str, session_factory: Callable = SessionLocal, *, ttl: float = LEASE_TTL_SECONDS):
+        self.name = name
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @property
+    def renew_interval(self) -> float:
+        # Renew well before expiry so one slow round does not hand the lease over
+        return self.ttl / 3
+
+    def acquire(self) -> bool:
+        """Take or renew the lease; True if this process holds it now"""
+        now = datetime.utcnow()
+        table = WorkerLease.__table__
+        db = self.session_factory()
+        try:
+            taken = db.execute(
+                update(table)
+                .where(table.c.name == self.name, (table.c.owner == self.owner) | (table.c.expires_at < now))
+                .values(owner=self.owner, expires_at=now + timedelta(seconds=self.ttl))
+            ).rowcount == 1
+            if not taken:
+                try:
+                    db.execute(insert(table).values(
+                        name=self.name, owner=self.owner, expires_at=now + timedelta(seconds=self.ttl)
+                    ))
+                except IntegrityError:
+                    db.rollback()
+                    return False  # held by another process
+                taken = True
+            db.commit()
+            return taken
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def release(self):
+        """Give the lease up now so a standby process can take over without waiting for expiry"""
+        table = WorkerLease.__table__
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(table)
+                .where(table.c.name == self.name, table.c.owner == self.owner)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,37 @@
+"""
+Outgoing notifications
+Workers hand batches of messages (anything with a `subject` and a list of
+`recipients`) to a Notifier; swap the notifier to change the channel.
+"""
+from abc import ABC, abstractmethod
+from typing import List, TypeVar
+
+Message = TypeVar("Message")
+
+
+class Notifier(ABC):
+    """Delivers messages; assign an instance to a worker's `notifier`"""
+
+    @abstractmethod
+    def send(self, messages: List[Message]) -> List[Message]:
+        """Deliver a batch and return the messages that went out"""
+
+
+class LogNotifier(Notifier):
+    """Prints messages; the default until a real channel is configured"""
+
+    def send(self, messages: List[Message]) -> List[Message]:
+        for message in messages:
+            print(f"{message.subject} -> {', '.join(message.recipients) or 'no recipients'}")
+        return messages
+
+
+class MemoryNotifier(Notifier):
+    """Keeps sent messages in a list (local sink for tests and development)"""
+
+    def __init__(self):
+        self.sent: List[Message] = []
+
+    def send(self, messages: List[Message]) -> List[Message]:
+        self.sent.extend(messages)
+        return messages
@@ -0,0 +1,453 @@
+"""
+Active health-check prober for monitored services
+Runs inside the API worker and keeps MonitoredService status, response time
+and last check current without relying on external agents
+"""
+import asyncio
+import heapq
+import random
+import socket
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import bindparam, insert, update
+
+from database import SessionLocal
+from models import MonitoredService, ServiceMetric
+from services.leases import Lease
+from services.uptime import record_transitions
+from shared.cache import mark_written
+
+# Prober configuration
+DEFAULT_INTERVAL_SECONDS = 60
+MIN_INTERVAL_SECONDS = 5
+PROBE_TIMEOUT_SECONDS = 10.0
+MAX_CONCURRENT_PROBES = 200
+JITTER_RATIO = 0.1
+SLOW_RESPONSE_MS = 2000.0  # responses slower than this are reported as "warning"
+FLUSH_INTERVAL_SECONDS = 2.0
+FLUSH_BATCH_SIZE = 500
+RELOAD_INTERVAL_SECONDS = 60
+
+
+@dataclass
+class ProbeTarget:
+    """A service to check, resolved from its URL"""
+    service_id: int
+    kind: str  # http, tcp, dns
+    url: str
+    host: str
+    port: Optional[int]
+    interval: float
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of a single check"""
+    service_id: int
+    status: str  # up, down, warning
+    response_time: Optional[float]  # milliseconds
+    checked_at: datetime
+    error: Optional[str] = None
+
+
+def parse_target(service_id: int, url: Optional[str], interval: Optional[int] = None) -> Optional[ProbeTarget]:
+    """
+    Build a probe target from a service URL
+
+    http(s)://host/path -> HTTP GET
+    tcp://host:port or host:port -> TCP connect
+    dns://hostname -> DNS resolution
+    """
+    if not url:
+        return None
+
+    interval = max(MIN_INTERVAL_SECONDS, interval or DEFAULT_INTERVAL_SECONDS)
+    raw = url.strip()
+    if "://" not in raw:
+        raw = f"tcp://{raw}" if ":" in raw else f"dns://{raw}"
+
+    parts = urlsplit(raw)
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if not host:
+        return None
+
+    if scheme in ("http", "https"):
+        return ProbeTarget(service_id, "http", raw, host, parts.port, interval)
+    if scheme == "tcp":
+        if not parts.port:
+            return None
+        return ProbeTarget(service_id, "tcp", raw, host, parts.port, interval)
+    if scheme == "dns":
+        return ProbeTarget(service_id, "dns", raw, host, None, interval)
+    return None
+
+
+class HealthProber:
+    """
+    Asyncio scheduler that checks every service on its own interval
+
+    Due checks are kept in a min-heap keyed by next run time, so scheduling
+    costs O(log n) per check no matter how many services a worker owns.
+    A global semaphore caps in-flight probes, one shared HTTP client reuses
+    keep-alive connections per host, and results are written in batches.
+    With a `lease`, only the process holding it probes; the others keep
+    their registry loaded and take over when the holder goes away.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        *,
+        client: Optional[httpx.AsyncClient] = None,
+        max_concurrency: int = MAX_CONCURRENT_PROBES,
+        timeout: float = PROBE_TIMEOUT_SECONDS,
+        jitter: float = JITTER_RATIO,
+        slow_response_ms: float = SLOW_RESPONSE_MS,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        batch_size: int = FLUSH_BATCH_SIZE,
+        reload_interval: float = RELOAD_INTERVAL_SECONDS,
+        lease: Optional[Lease] = None,
+    ):
+        self.session_factory = session_factory
+        self.lease = lease
+        self.timeout = timeout
+        self.jitter = jitter
+        self.slow_response_ms = slow_response_ms
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.reload_interval = reload_interval
+        self.max_concurrency = max_concurrency
+
+        self._client = client
+        self._owns_client = client is None
+        self._targets: Dict[int, ProbeTarget] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._due: Dict[int, float] = {}
+        self._last_status: Dict[int, str] = {}
+        self._pending: List[ProbeResult] = []
+        self._leader = lease is None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: set = set()
+        self._running = False
+
+    # ----- lifecycle -----
+
+    async def start(self):
+        """Load services and start the scheduler, writer and reload loops"""
+        if self._running:
+            return
+        self._running = True
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+        await self.reload()
+        self._tasks = [
+            asyncio.create_task(self._schedule_loop()),
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._reload_loop()),
+        ]
+        if self.lease is not None:
+            self._tasks.append(asyncio.create_task(self._lease_loop()))
+
+    async def stop(self):
+        """Cancel background loops and flush anything still buffered"""
+        if not self._running:
+            return
+        self._running = False
+        for task in self._tasks + list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._inflight, return_exceptions=True)
+        self._tasks = []
+        self._inflight.clear()
+        await self.flush()
+        if self.lease is not None and self._leader:
+            self._leader = False
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.lease.release)
+            except Exception as e:
+                print(f"Health prober lease release failed: {str(e)}")
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ----- service registry -----
+
+    def _load_targets(self) -> List[ProbeTarget]:
+        db = self.session_factory()
+        try:
+            rows = db.query(
+                MonitoredService.id,
+                MonitoredService.url,
+                MonitoredService.check_interval,
+            ).all()
+        finally:
+            db.close()
+
+        targets = []
+        for service_id, url, interval in rows:
+            target = parse_target(service_id, url, interval)
+            if target:
+                targets.append(target)
+        return targets
+
+    async def reload(self):
+        """Sync the in-memory registry with the monitored_services table"""
+        loop = asyncio.get_running_loop()
+        targets = await loop.run_in_executor(None, self._load_targets)
+
+        fresh = {target.service_id: target for target in targets}
+        now = time.monotonic()
+        for service_id, target in fresh.items():
+            if service_id not in self._due:
+                # Spread first checks across one interval to avoid a thundering herd
+                self._push(service_id, now + random.uniform(0, target.interval))
+        for service_id in list(self._due):
+            if service_id not in fresh:
+                # Stale heap entries are skipped when they surface
+                del self._due[service_id]
+                self._last_status.pop(service_id, None)
+        self._targets = fresh
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _push(self, service_id: int, due: float):
+        self._due[service_id] = due
+        heapq.heappush(self._heap, (due, service_id))
+
+    def _next_run(self, target: ProbeTarget, now: float) -> float:
+        spread = target.interval * self.jitter
+        return now + target.interval + random.uniform(-spread, spread)
+
+    # ----- loops -----
+
+    async def _schedule_loop(self):
+        while self._running:
+            now = time.monotonic()
+            while self._leader and self._heap and self._heap[0][0] <= now:
+                due, service_id = heapq.heappop(self._heap)
+                target = self._targets.get(service_id)
+                if target is None or self._due.get(service_id) != due:
+                    # Service was removed or rescheduled since this entry was pushed
+                    continue
+                self._push(service_id, self._next_run(target, now))
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._run_probe(target))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+            delay = self._heap[0][0] - time.monotonic() if self._heap and self._leader else self.reload_interval
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_probe(self, target: ProbeTarget):
+        try:
+            result = await self.check(target)
+            self.record(result)
+        finally:
+            self._semaphore.release()
+
+    async def _flush_loop(self):
+        while self._running:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _lease_loop(self):
+        loop = asyncio.get_running_loop()
+        while self._running:
+            try:
+                leader = await loop.run_in_executor(None, self.lease.acquire)
+            except Exception as e:
+                print(f"Health prober lease renewal failed: {str(e)}")
+                leader = False
+            if leader and not self._leader:
+                # Taking over: spread the first checks out again rather than firing every overdue one
+                now = time.monotonic()
+                for service_id, target in self._targets.items():
+                    self._push(service_id, now + random.uniform(0, target.interval))
+                self._wakeup.set()
+            self._leader = leader
+            await asyncio.sleep(self.lease.renew_interval)
+
+    async def _reload_loop(self):
+        while self._running:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"Health prober reload failed: {str(e)}")
+
+    # ----- probes -----
+
+    async def check(self, target: ProbeTarget) -> ProbeResult:
+        """Run one check for a target and classify the outcome"""
+        started = time.perf_counter()
+        status, error = "up", None
+        try:
+            if target.kind == "http":
+                status = await self.probe_http(target.url)
+            elif target.kind == "tcp":
+                await self.probe_tcp(target.host, target.port)
+            else:
+                await self.probe_dns(target.host)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            status, error = "down", "timeout"
+        except (OSError, httpx.HTTPError) as e:
+            status, error = "down", str(e) or e.__class__.__name__
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if status == "up" and elapsed_ms > self.slow_response_ms:
+            status = "warning"
+
+        return ProbeResult(
+            service_id=target.service_id,
+            status=status,
+            response_time=round(elapsed_ms, 2) if status != "down" else None,
+            checked_at=datetime.utcnow(),
+            error=error,
+        )
+
+    async def probe_http(self, url: str) -> str:
+        """GET the URL over the shared keep-alive client"""
+        response = await self._client.get(url, timeout=self.timeout)
+        if response.status_code >= 500:
+            return "down"
+        if response.status_code >= 400:
+            return "warning"
+        return "up"
+
+    async def probe_tcp(self, host: str, port: int):
+        """Open and immediately close a TCP connection"""
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=self.timeout)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    async def probe_dns(self, host: str):
+        """Resolve a hostname through the loop's resolver"""
+        loop = asyncio.get_running_loop()
+        await asyncio.wait_for(
+            loop.getaddrinfo(host, None, type=socket.SOCK_STREAM),
+            timeout=self.timeout,
+        )
+
+    # ----- result batching -----
+
+    def record(self, result: ProbeResult):
+        """Buffer a result for the next batched write"""
+        self._pending.append(result)
+        if len(self._pending) >= self.batch_size:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        """Write buffered results to the database in one transaction"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        # One batch at a time, so each sees the statuses the previous one wrote
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            statuses: Dict[int, str] = {}
+            transitions = []
+            for result in batch:
+                previous = statuses.get(result.service_id, self._last_status.get(result.service_id))
+                if previous != result.status:
+                    transitions.append((result.service_id, result.status, result.checked_at))
+                statuses[result.service_id] = result.status
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write_batch, batch, transitions)
+            except Exception as e:
+                # Statuses stay as last written, so the next batch records these transitions again
+                print(f"Health prober flush failed: {str(e)}")
+                return
+            self._last_status.update(statuses)
+
+    def _write_batch(self, batch: List[ProbeResult], transitions: List[Tuple[int, str, datetime]]):
+        # Keep only the latest result per service for the status row
+        latest: Dict[int, ProbeResult] = {}
+        for result in batch:
+            latest[result.service_id] = result
+
+        service_table = MonitoredService.__table__
+        status_stmt = (
+            update(service_table)
+            .where(service_table.c.id == bindparam("_service_id"))
+            .values(
+                status=bindparam("_status"),
+                last_check=bindparam("_checked_at"),
+                response_time=bindparam("_response_time"),
+            )
+        )
+        status_rows = [
+            {
+                "_service_id": r.service_id,
+                "_status": r.status,
+                "_checked_at": r.checked_at,
+                "_response_time": r.response_time,
+            }
+            for r in latest.values()
+        ]
+        metric_rows = [
+            {
+                "service_id": r.service_id,
+                "metric_name": "response_time",
+                "value": r.response_time,
+                "unit": "ms",
+                "timestamp": r.checked_at,
+            }
+            for r in batch
+            if r.response_time is not None
+        ]
+
+        db = self.session_factory()
+        try:
+            current = dict(
+                db.query(MonitoredService.id, MonitoredService.status)
+                .filter(MonitoredService.id.in_(latest))
+            )
+            # Most batches only refresh last_check and response_time. Run on the
+            # connection so that doesn't count as a write to monitored_services,
+            # which would drop cached responses (dashboard stats) every flush;
+            # only real status changes do
+            db.connection().execute(status_stmt, status_rows)
+            if any(current[service_id] != r.status for service_id, r in latest.items() if service_id in current):
+                mark_written(db, [service_table.name])
+            if metric_rows:
+                db.execute(insert(ServiceMetric.__table__), metric_rows)
+            if transitions:
+                record_transitions(db, transitions)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# Shared prober instance started by the application; the lease keeps it to one uvicorn worker
+prober = HealthProber(lease=Lease("health_prober"))
@@ -0,0 +1,206 @@
+"""
+Recurring appointment rules
+A subset of iCalendar RRULE (FREQ=DAILY/WEEKLY/MONTHLY with INTERVAL, COUNT,
+UNTIL and BYDAY), expanded only for the window being asked about: daily and
+weekly rules jump straight to the first period that can reach the window.
+"""
+import math
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+MAX_COUNT = 10_000
+
+# A changed or cancelled occurrence; None fields keep the series' value
+Override = namedtuple("Override", ["status", "start_time", "end_time"])
+# original_start identifies the occurrence even after it has been moved
+Occurrence = Tuple[datetime, datetime, datetime, str]  # original_start, start, end, status
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.rstrip("Z")  # times are naive UTC throughout
+    for fmt in ("%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        # A bare date includes that whole day
+        return parsed if "T" in value else parsed + timedelta(days=1, microseconds=-1)
+    raise ValueError(f"Invalid UNTIL: {value}")
+
+
+def _add_months(day: date, months: int) -> Optional[date]:
+    """Same day-of-month `months` later, or None when that month is too short"""
+    month = day.month - 1 + months
+    try:
+        return day.replace(year=day.year + month // 12, month=month % 12 + 1)
+    except ValueError:
+        return None
+
+
+class Recurrence:
+    """Occurrence starts of one rule, anchored at dtstart (its first occurrence)"""
+
+    def __init__(self, rule: str, dtstart: datetime, duration: timedelta):
+        parts = {}
+        for part in rule.strip().removeprefix("RRULE:").split(";"):
+            key, sep, value = part.partition("=")
+            if not sep or not value:
+                raise ValueError(f"Invalid rule part: {part!r}")
+            parts[key.strip().upper()] = value.strip().upper()
+        unknown = set(parts) - {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY"}
+        if unknown:
+            raise ValueError(f"Unsupported rule parts: {', '.join(sorted(unknown))}")
+
+        self.freq = parts.get("FREQ")
+        if self.freq not in FREQUENCIES:
+            raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+        try:
+            self.interval = int(parts.get("INTERVAL", 1))
+            self.count = int(parts["COUNT"]) if "COUNT" in parts else None
+        except ValueError:
+            raise ValueError("INTERVAL and COUNT must be integers")
+        if self.interval < 1 or (self.count is not None and not 1 <= self.count <= MAX_COUNT):
+            raise ValueError(f"INTERVAL must be positive and COUNT between 1 and {MAX_COUNT}")
+        if self.count is not None and "UNTIL" in parts:
+            raise ValueError("COUNT and UNTIL cannot be combined")
+        self.until = _parse_until(parts["UNTIL"]) if "UNTIL" in parts else None
+        if duration <= timedelta(0):
+            raise ValueError("Occurrences must have a positive duration")
+
+        byday = []
+        for day in parts.get("BYDAY", "").split(",") if "BYDAY" in parts else ():
+            if day not in WEEKDAYS:
+                raise ValueError(f"Invalid BYDAY value: {day}")
+            byday.append(WEEKDAYS.index(day))
+        if byday and self.freq == "MONTHLY":
+            raise ValueError("BYDAY is only supported with DAILY and WEEKLY")
+        if byday and self.freq == "DAILY" and self.interval != 1:
+            raise ValueError("BYDAY with DAILY requires INTERVAL=1")
+
+        self.rule = rule
+        self.dtstart = dtstart
+        self.duration = duration
+        self._time = dtstart - datetime.combine(dtstart.date(), datetime.min.time())
+        if self.freq == "MONTHLY":
+            self._base = dtstart.date()
+            self._offsets = [0]
+            self._period_days = None
+            if not any(_add_months(self._base, k * self.interval) for k in range(12)):
+                raise ValueError("Rule never occurs")
+        else:
+            # Every period (a day, or a week from Monday) repeats the same day offsets;
+            # DAILY with BYDAY is the same as WEEKLY on those days
+            weekly = self.freq == "WEEKLY" or bool(byday)
+            self._base = dtstart.date() - timedelta(days=dtstart.weekday()) if weekly else dtstart.date()
+            self._offsets = sorted(set(byday)) if byday else [dtstart.weekday() if weekly else 0]
+            self._period_days = 7 * self.interval if weekly else self.interval
+            self._first = [s for s in self._starts(0) if s >= dtstart]
+
+    def _starts(self, k: int) -> List[datetime]:
+        if self._period_days is None:
+            day = _add_months(self._base, k * self.interval)
+            return [datetime.combine(day, datetime.min.time()) + self._time] if day else []
+        first = self._base + timedelta(days=k * self._period_days)
+        return [datetime.combine(first + timedelta(days=o), datetime.min.time()) + self._time for o in self._offsets]
+
+    def _period_start(self, k: int) -> datetime:
+        if self._period_days is None:
+            month = self._base.month - 1 + k * self.interval
+            return datetime(self._base.year + month // 12, month % 12 + 1, 1)
+        return datetime.combine(self._base + timedelta(days=k * self._period_days), datetime.min.time())
+
+    def _seek(self, lower: datetime) -> Tuple[int, int]:
+        """(period, index of its first occurrence) to start from so nothing after `lower` is skipped"""
+        if self._period_days is None:
+            if self.count is not None:
+                return 0, 0  # skipped months make the index unknowable without walking
+            months = (lower.year - self._base.year) * 12 + lower.month - self._base.month
+            return max(0, months // self.interval - 1), 0
+        days = (lower - self._period_start(0)).total_seconds() / 86400
+        k = max(0, math.floor((days - self._offsets[-1] - 1) / self._period_days))
+        return k, 0 if k == 0 else len(self._first) + (k - 1) * len(self._offsets)
+
+    def occurrences(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[datetime]:
+        """Starts of occurrences overlapping [start, end); unbounded when end is None"""
+        lower = start - self.duration if start is not None else None
+        k, index = self._seek(lower) if lower is not None else (0, 0)
+        while True:
+            if end is not None and self._period_start(k) >= end:
+                return
+            for s in self._starts(k):
+                if s < self.dtstart:
+                    continue
+                if (self.count is not None and index >= self.count) or (self.until is not None and s > self.until):
+                    return
+                if end is not None and s >= end:
+                    return
+                index += 1
+                if lower is None or s > lower:
+                    yield s
+            k += 1
+
+    def includes(self, value: datetime) -> bool:
+        """Whether an occurrence starts exactly at `value`"""
+        return any(s == value for s in self.occurrences(value, value + timedelta(microseconds=1)))
+
+    def last_end(self) -> Optional[datetime]:
+        """End of the final occurrence (an upper bound under UNTIL); None if the rule never ends"""
+        if self.until is not None:
+            return max(self.until, self.dtstart) + self.duration
+        if self.count is None:
+            return None
+        if self._period_days is None:
+            last = None
+            for last in self.occurrences():
+                pass
+            return last + self.duration
+        if self.count <= len(self._first):
+            return self._first[self.count - 1] + self.duration
+        rest = self.count - len(self._first) - 1
+        return self._starts(1 + rest // len(self._offsets))[rest % len(self._offsets)] + self.duration
+
+
+class Series:
+    """A recurring appointment with its exceptions, as plain data"""
+
+    __slots__ = ("id", "status", "recurrence", "overrides")
+
+    def __init__(self, series_id: int, status: str, recurrence: Recurrence, overrides: Dict[datetime, Override]):
+        self.id = series_id
+        self.status = status
+        self.recurrence = recurrence
+        self.overrides = overrides
+
+    @classmethod
+    def from_row(cls, row) -> "Series":
+        """From an AppointmentSeries row with its exceptions loaded"""
+        return cls(
+            row.id,
+            row.status,
+            Recurrence(row.rrule, row.start_time, row.end_time - row.start_time),
+            {e.original_start: Override(e.status, e.start_time, e.end_time) for e in row.exceptions}
+        )
+
+    def occurrences(self, start: datetime, end: datetime) -> List[Occurrence]:
+        """Occurrences overlapping [start, end) in start order, with exceptions applied"""
+        duration = self.recurrence.duration
+        found = [
+            (original, original, original + duration, self.status)
+            for original in self.recurrence.occurrences(start, end)
+            if original not in self.overrides
+        ]
+        for original, override in self.overrides.items():
+            s = override.start_time or original
+            e = override.end_time or s + duration
+            if s < end and e > start:
+                found.append((original, s, e, override.status or self.status))
+        found.sort(key=lambda occurrence: occurrence[1])
+        return found
+
+
+def occurrence_key(series_id: int, original_start: datetime) -> str:
+    """Stable reference to one occurrence, e.g. "12@2026-03-02T09:00:00" """
+    return f"{series_id}@{original_start.isoformat()}"
@@ -0,0 +1,480 @@
+"""
+Appointment reminders
+Upcoming reminders sit in a min-heap keyed by due time, loaded from an indexed
+query over the next day and kept current from committed appointment writes,
+so the worker sleeps until the next one is due instead of polling the table.
+Due reminders go out in batches through a pluggable notifier.
+"""
+import asyncio
+import heapq
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session, selectinload
+
+from database import SessionLocal
+from models import Appointment, AppointmentException, AppointmentSeries, User
+from services.availability import BLOCKING_STATUSES
+from services.notifications import LogNotifier, Notifier
+from services.recurrence import Series
+
+REMINDER_LEAD_MINUTES = 60
+# Reminders due this far ahead are held in memory; later ones come in on reload
+REMINDER_HORIZON_HOURS = 24
+RELOAD_INTERVAL_SECONDS = 3600
+REMINDER_BATCH_SIZE = 100
+RETRY_DELAY_SECONDS = 300
+
+# ("appointment", id) or ("series", series_id, original_start)
+ReminderKey = Tuple
+
+_PENDING_KEY = "reminder_changes"
+_RELOAD_KEY = "reminder_reload"
+
+
+@dataclass
+class Reminder:
+    key: ReminderKey
+    title: str
+    start_time: datetime
+    end_time: datetime
+    location: Optional[str] = None
+    meeting_link: Optional[str] = None
+    recipients: List[str] = field(default_factory=list)  # customer and technician emails
+    exception_id: Optional[int] = None  # a series occurrence's exception row, marked on its own
+
+    @property
+    def subject(self) -> str:
+        return f"Reminder: {self.title} at {self.start_time.isoformat()}"
+
+
+class ReminderDispatcher:
+    """
+    Sends each appointment's reminder REMINDER_LEAD_MINUTES before it starts
+
+    One-off appointments and changed series occurrences (exception rows) are
+    marked with reminder_sent; unmodified occurrences, which start in rule
+    order, advance AppointmentSeries.reminded_through. A batch is claimed by
+    setting these before it goes out, so only one API worker sends each
+    reminder, and released again if sending fails. Heap entries made stale by later changes are skipped when they
+    surface, as in the health prober.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        *,
+        notifier: Optional[Notifier] = None,
+        lead: timedelta = timedelta(minutes=REMINDER_LEAD_MINUTES),
+        horizon: timedelta = timedelta(hours=REMINDER_HORIZON_HOURS),
+        reload_interval: float = RELOAD_INTERVAL_SECONDS,
+        batch_size: int = REMINDER_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.notifier = notifier or LogNotifier()
+        self.lead = lead
+        self.horizon = horizon
+        self.reload_interval = reload_interval
+        self.batch_size = batch_size
+
+        self._heap: List[Tuple[datetime, ReminderKey]] = []
+        self._due: Dict[ReminderKey, datetime] = {}
+        self._lock = threading.Lock()
+        self._reload_requested = False
+        self._loading = False
+        self._applied_while_loading: List[Tuple[int, Optional[datetime], bool]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ----- heap -----
+
+    def _push(self, key: ReminderKey, due: datetime):
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def _pop_due(self, now: datetime) -> List[ReminderKey]:
+        keys = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(keys) < self.batch_size:
+                due, key = heapq.heappop(self._heap)
+                if self._due.get(key) != due:
+                    continue  # rescheduled, cancelled or already sent since this entry was pushed
+                del self._due[key]
+                keys.append(key)
+        return keys
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._due)
+
+    # ----- loading -----
+
+    def load(self, db: Session, now: Optional[datetime] = None) -> Dict[ReminderKey, datetime]:
+        """Reminders due before now + horizon that haven't gone out"""
+        now = now or datetime.utcnow()
+        latest_start = now + self.horizon + self.lead
+        due: Dict[ReminderKey, datetime] = {}
+        # Uses ix_appointments_reminder_start
+        for appt_id, start in db.query(Appointment.id, Appointment.start_time).filter(
+            Appointment.reminder_sent == False,
+            Appointment.start_time > now,
+            Appointment.start_time <= latest_start,
+            Appointment.status.in_(BLOCKING_STATUSES)
+        ):
+            due[("appointment", appt_id)] = start - self.lead
+
+        for row in db.execute(
+            select(AppointmentSeries)
+            .options(selectinload(AppointmentSeries.exceptions))
+            .where(
+                AppointmentSeries.status.in_(BLOCKING_STATUSES),
+                AppointmentSeries.start_time <= latest_start,
+                (AppointmentSeries.ends_at.is_(None)) | (AppointmentSeries.ends_at > now)
+            )
+        ).scalars():
+            exceptions = {e.original_start: e for e in row.exceptions}
+            for original, start, end, status in Series.from_row(row).occurrences(now, latest_start):
+                if status not in BLOCKING_STATUSES or start <= now or start > latest_start:
+                    continue
+                if _occurrence_reminded(row, exceptions.get(original), original):
+                    continue
+                due[("series", row.id, original)] = start - self.lead
+        return due
+
+    def reload(self, db: Optional[Session] = None, now: Optional[datetime] = None):
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            self._reload_requested = False
+            with self._lock:
+                self._loading = True
+                self._applied_while_loading = []
+            due = self.load(db, now)
+            with self._lock:
+                self._loading = False
+                missed = self._applied_while_loading
+                self._due = dict(due)
+                self._heap = [(when, key) for key, when in due.items()]
+                heapq.heapify(self._heap)
+            # Writes committed after the query ran would otherwise be lost until the next reload
+            self.apply(missed)
+        finally:
+            self._loading = False
+            if own_session:
+                db.close()
+
+    def apply(self, changes: Iterable[Tuple[int, Optional[datetime], bool]]):
+        """Reschedule committed (appointment id, start time or None if gone, needs reminder) changes"""
+        now = datetime.utcnow()
+        limit = now + self.horizon
+        with self._lock:
+            if self._loading:
+                self._applied_while_loading.extend(changes)
+            for appt_id, start, wanted in changes:
+                key = ("appointment", appt_id)
+                due = start - self.lead if wanted and start is not None and start > now else None
+                if due is not None and due <= limit:
+                    if self._due.get(key) != due:
+                        self._push(key, due)
+                else:
+                    self._due.pop(key, None)
+        self._wake()
+
+    def request_reload(self):
+        """Series changed: their occurrences are recomputed on the next pass"""
+        self._reload_requested = True
+        self._wake()
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    # ----- sending -----
+
+    def _build(self, db: Session, keys: List[ReminderKey]
+               ) -> Tuple[List[Reminder], Dict[int, Optional[datetime]]]:
+        """
+        Reminders for keys that still need one, re-checked against the
+        database, and the reminded_through each series was read with
+        """
+        appt_ids = [key[1] for key in keys if key[0] == "appointment"]
+        series_keys = [key for key in keys if key[0] == "series"]
+        reminders: List[Reminder] = []
+        users: Dict[int, List[int]] = {}
+        marks: Dict[int, Optional[datetime]] = {}
+
+        if appt_ids:
+            for appt in db.query(Appointment).filter(
+                Appointment.id.in_(appt_ids),
+                Appointment.reminder_sent == False,
+                Appointment.status.in_(BLOCKING_STATUSES)
+            ):
+                reminders.append(Reminder(("appointment", appt.id), appt.title, appt.start_time, appt.end_time,
+                                          appt.location, appt.meeting_link))
+                users[len(reminders) - 1] = [appt.customer_id, appt.technician_id]
+
+        if series_keys:
+            rows = {
+                row.id: row for row in db.query(AppointmentSeries)
+                .options(selectinload(AppointmentSeries.exceptions))
+                .filter(AppointmentSeries.id.in_({key[1] for key in series_keys}),
+                        AppointmentSeries.status.in_(BLOCKING_STATUSES))
+            }
+            for key in series_keys:
+                row = rows.get(key[1])
+                if row is None:
+                    continue
+                marks[row.id] = row.reminded_through
+                exception = next((e for e in row.exceptions if e.original_start == key[2]), None)
+                if _occurrence_reminded(row, exception, key[2]):
+                    continue
+                if exception is not None and (exception.status or row.status) not in BLOCKING_STATUSES:
+                    continue
+                start = (exception and exception.start_time) or key[2]
+                end = (exception and exception.end_time) or start + (row.end_time - row.start_time)
+                reminders.append(Reminder(key, (exception and exception.title) or row.title, start, end,
+                                          (exception and exception.location) or row.location, row.meeting_link,
+                                          exception_id=exception.id if exception is not None else None))
+                users[len(reminders) - 1] = [row.customer_id, row.technician_id]
+
+        wanted = {user_id for ids in users.values() for user_id in ids if user_id is not None}
+        emails = dict(db.query(User.id, User.email).filter(User.id.in_(wanted)).all()) if wanted else {}
+        for index, user_ids in users.items():
+            reminders[index].recipients = [emails[u] for u in dict.fromkeys(user_ids) if u in emails]
+        return reminders, marks
+
+    def _claim(self, db: Session, reminders: List[Reminder], marks: Dict[int, Optional[datetime]]) -> List[Reminder]:
+        """
+        Mark reminders as sent before they go out and keep the ones this
+        process won; every API worker runs a dispatcher over the same rows
+        """
+        connection = db.connection()
+        won = set()
+        appt_table, exception_table = Appointment.__table__, AppointmentException.__table__
+        appt_ids = [r.key[1] for r in reminders if r.key[0] == "appointment"]
+        if appt_ids:
+            won.update(("appointment", row[0]) for row in connection.execute(
+                update(appt_table)
+                .where(appt_table.c.id.in_(appt_ids), appt_table.c.reminder_sent == False)
+                .values(reminder_sent=True)
+                .returning(appt_table.c.id)
+            ))
+        exception_ids = [r.exception_id for r in reminders if r.exception_id is not None]
+        if exception_ids:
+            won.update(("exception", row[0]) for row in connection.execute(
+                update(exception_table)
+                .where(exception_table.c.id.in_(exception_ids), exception_table.c.reminder_sent == False)
+                .values(reminder_sent=True)
+                .returning(exception_table.c.id)
+            ))
+        # Unmodified occurrences: move each series' mark on from the value read, all or nothing
+        for series_id, originals in _by_series(reminders).items():
+            if _set_mark(connection, series_id, marks.get(series_id), max(originals)):
+                won.add(("series", series_id))
+        return [r for r in reminders if _claim_key(r) in won]
+
+    def _release(self, db: Session, claimed: List[Reminder], unsent: List[Reminder],
+                 marks: Dict[int, Optional[datetime]]):
+        """Undo the claim on reminders that didn't go out, so they are retried"""
+        connection = db.connection()
+        appt_ids = [r.key[1] for r in unsent if r.key[0] == "appointment"]
+        if appt_ids:
+            connection.execute(
+                update(Appointment.__table__)
+                .where(Appointment.__table__.c.id.in_(appt_ids))
+                .values(reminder_sent=False)
+            )
+        exception_ids = [r.exception_id for r in unsent if r.exception_id is not None]
+        if exception_ids:
+            connection.execute(
+                update(AppointmentException.__table__)
+                .where(AppointmentException.__table__.c.id.in_(exception_ids))
+                .values(reminder_sent=False)
+            )
+        claimed_by_series = _by_series(claimed)
+        for series_id, failed in _by_series(unsent).items():
+            # Back to the last occurrence before the first failure that did go out
+            sent_before = [o for o in claimed_by_series[series_id] if o < min(failed)]
+            mark = max(sent_before) if sent_before else marks.get(series_id)
+            _set_mark(connection, series_id, max(claimed_by_series[series_id]), mark)
+        db.commit()
+
+    def dispatch(self, keys: List[ReminderKey], db: Optional[Session] = None) -> int:
+        """Claim, send and, if sending fails, release one batch; returns the number sent"""
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            reminders, marks = self._build(db, keys)
+            # Core statements: the flags don't affect availability, so the
+            # appointment write hooks (which would drop every timeline) stay out of it
+            claimed = self._claim(db, reminders, marks) if reminders else []
+            db.commit()
+            if not claimed:
+                return 0
+            try:
+                sent = self.notifier.send(claimed)
+            except Exception:
+                self._release(db, claimed, claimed, marks)
+                raise
+            went_out = {id(r) for r in sent}
+            unsent = [r for r in claimed if id(r) not in went_out]
+            if unsent:
+                self._release(db, claimed, unsent, marks)
+            return len(sent)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+    def run_once(self, db: Optional[Session] = None, now: Optional[datetime] = None) -> int:
+        """Reload and send everything due by `now` (for scripts and tests)"""
+        now = now or datetime.utcnow()
+        self.reload(db, now)
+        total = 0
+        while True:
+            keys = self._pop_due(now)
+            if not keys:
+                return total
+            total += self.dispatch(keys, db)
+
+    # ----- lifecycle -----
+
+    async def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._loop = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reload = 0.0
+        while True:
+            if self._reload_requested or time.monotonic() >= next_reload:
+                try:
+                    await loop.run_in_executor(None, self.reload)
+                except Exception as e:
+                    print(f"Reminder reload failed: {str(e)}")
+                next_reload = time.monotonic() + self.reload_interval
+
+            keys = self._pop_due(datetime.utcnow())
+            if keys:
+                try:
+                    await loop.run_in_executor(None, self.dispatch, keys)
+                except Exception as e:
+                    print(f"Reminder dispatch failed: {str(e)}")
+                    retry = datetime.utcnow() + timedelta(seconds=RETRY_DELAY_SECONDS)
+                    with self._lock:
+                        for key in keys:
+                            self._push(key, retry)
+                continue
+
+            delay = next_reload - time.monotonic()
+            next_due = self.next_due()
+            if next_due is not None:
+                delay = min(delay, (next_due - datetime.utcnow()).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+
+def _claim_key(reminder: Reminder) -> Tuple:
+    if reminder.exception_id is not None:
+        return "exception", reminder.exception_id
+    return reminder.key[:2]
+
+
+def _by_series(reminders: Iterable[Reminder]) -> Dict[int, List[datetime]]:
+    """Original starts of unmodified series occurrences, by series"""
+    found: Dict[int, List[datetime]] = {}
+    for r in reminders:
+        if r.key[0] == "series" and r.exception_id is None:
+            found.setdefault(r.key[1], []).append(r.key[2])
+    return found
+
+
+def _set_mark(connection, series_id: int, expected: Optional[datetime], value: Optional[datetime]) -> bool:
+    """Compare-and-set a series' reminded_through; False if it no longer holds `expected`"""
+    table = AppointmentSeries.__table__
+    current = table.c.reminded_through.is_(None) if expected is None else table.c.reminded_through == expected
+    return connection.execute(
+        update(table).where(table.c.id == series_id, current).values(reminded_through=value)
+    ).rowcount == 1
+
+
+def _occurrence_reminded(row: AppointmentSeries, exception: Optional[AppointmentException],
+                         original: datetime) -> bool:
+    # A moved occurrence can start after later ones, so the series' mark only covers unmodified ones
+    if exception is not None:
+        return bool(exception.reminder_sent)
+    return row.reminded_through is not None and original <= row.reminded_through
+
+
+# Shared dispatcher started by the application
+reminder_dispatcher = ReminderDispatcher()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_reminder_changes(session, flush_context):
+    changes = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Appointment):
+            gone = obj in session.deleted
+            changes.append((
+                obj.id,
+                None if gone else obj.start_time,
+                not gone and obj.status in BLOCKING_STATUSES and not obj.reminder_sent
+            ))
+        elif isinstance(obj, (AppointmentSeries, AppointmentException)):
+            session.info[_RELOAD_KEY] = True
+    if changes:
+        session.info.setdefault(_PENDING_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in (
+            Appointment.__tablename__, AppointmentSeries.__tablename__, AppointmentException.__tablename__
+        ):
+            orm_execute_state.session.info[_RELOAD_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_reminder_changes(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        reminder_dispatcher.apply(changes)
+    if session.info.pop(_RELOAD_KEY, False):
+        reminder_dispatcher.request_reload()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_reminder_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_RELOAD_KEY, None)
@@ -0,0 +1,212 @@
+"""
+Visit scheduling heuristic
+Greedy insertion of visits into technicians' free time, then local search
+(relocate and eject-and-reinsert moves) until the time budget runs out.
+Pure Python on plain data, so it can run in a worker process; times are
+minutes from an arbitrary origin.
+"""
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+UNASSIGNED_PENALTY = 10_000.0  # per visit, scaled by 1 + priority
+WAIT_WEIGHT = 0.01  # prefer earlier starts, far below a minute of travel
+TRAVEL_SPEED_KMH = 40.0
+STALL_ITERATIONS = 5_000  # stop early after this many moves without improvement
+
+Slot = Tuple[float, float, int]  # start, end, visit index
+
+
+def travel_minutes(a: Optional[Sequence[float]], b: Optional[Sequence[float]],
+                   speed_kmh: float = TRAVEL_SPEED_KMH) -> float:
+    """Great-circle drive estimate between (lat, lon) points; 0 when either is unknown"""
+    if a is None or b is None:
+        return 0.0
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h)) / speed_kmh * 60
+
+
+class Schedule:
+    """Assigned visits per technician, each list kept in start order"""
+
+    def __init__(self, problem: Dict[str, Any]):
+        self.visits: List[Dict[str, Any]] = problem["visits"]
+        self.free: Dict[Any, List[Tuple[float, float]]] = {
+            tech: sorted(map(tuple, intervals)) for tech, intervals in problem["technicians"].items()
+        }
+        self.speed = problem.get("travel_speed_kmh", TRAVEL_SPEED_KMH)
+        self.routes: Dict[Any, List[Slot]] = {tech: [] for tech in self.free}
+        self.assigned: Dict[int, Any] = {}  # visit index -> technician
+
+    def copy(self) -> "Schedule":
+        clone = object.__new__(Schedule)
+        clone.visits, clone.free, clone.speed = self.visits, self.free, self.speed
+        clone.routes = {tech: list(route) for tech, route in self.routes.items()}
+        clone.assigned = dict(self.assigned)
+        return clone
+
+    def _travel(self, a: Optional[int], b: Optional[int]) -> float:
+        if a is None or b is None:
+            return 0.0
+        return travel_minutes(self.visits[a].get("location"), self.visits[b].get("location"), self.speed)
+
+    def route_cost(self, tech) -> float:
+        cost, previous = 0.0, None
+        for start, end, index in self.routes[tech]:
+            cost += self._travel(previous, index)
+            cost += WAIT_WEIGHT * (start - min(s for s, e in self.visits[index]["windows"] if e >= start))
+            previous = index
+        return cost
+
+    def cost(self) -> float:
+        unassigned = sum(
+            UNASSIGNED_PENALTY * (1 + visit.get("priority", 0))
+            for index, visit in enumerate(self.visits) if index not in self.assigned
+        )
+        return unassigned + sum(self.route_cost(tech) for tech in self.routes)
+
+    def best_insertion(self, index: int) -> Optional[Tuple[float, Any, float]]:
+        """Cheapest feasible (added cost, technician, start) for an unassigned visit"""
+        visit = self.visits[index]
+        duration = visit["duration"]
+        best = None
+        for tech in visit["candidates"]:
+            if tech not in self.routes:
+                continue
+            route = self.routes[tech]
+            for free_start, free_end in self.free[tech]:
+                # Gaps between this interval's assigned visits
+                inside = [slot for slot in route if slot[0] >= free_start and slot[1] <= free_end]
+                bounds = [(free_start, None)] + [(end, i) for start, end, i in inside]
+                nexts = [(start, i) for start, end, i in inside] + [(free_end, None)]
+                for (gap_start, prev), (gap_end, nxt) in zip(bounds, nexts):
+                    to_visit = self._travel(prev, index)
+                    from_visit = self._travel(index, nxt)
+                    for window_start, window_end in visit["windows"]:
+                        # Whole minutes, so booked times come out on the minute
+                        start = math.ceil(max(gap_start + to_visit, window_start))
+                        end = start + duration
+                        if end > window_end or end + from_visit > gap_end:
+                            continue
+                        added = to_visit + from_visit - self._travel(prev, nxt) + WAIT_WEIGHT * (start - window_start)
+                        if best is None or added < best[0]:
+                            best = (added, tech, start)
+                        break  # later windows only start later in this gap
+        return best
+
+    def insert(self, index: int, tech, start: float):
+        route = self.routes[tech]
+        route.append((start, start + self.visits[index]["duration"], index))
+        route.sort()
+        self.assigned[index] = tech
+
+    def remove(self, index: int):
+        tech = self.assigned.pop(index)
+        self.routes[tech] = [slot for slot in self.routes[tech] if slot[2] != index]
+
+    def try_insert(self, index: int) -> bool:
+        found = self.best_insertion(index)
+        if found is None:
+            return False
+        self.insert(index, found[1], found[2])
+        return True
+
+
+def _greedy(schedule: Schedule):
+    # Hardest first: fewest candidates, then shortest total window, then priority
+    order = sorted(
+        range(len(schedule.visits)),
+        key=lambda i: (
+            len(schedule.visits[i]["candidates"]),
+            sum(e - s for s, e in schedule.visits[i]["windows"]) - schedule.visits[i]["duration"],
+            -schedule.visits[i].get("priority", 0)
+        )
+    )
+    for index in order:
+        schedule.try_insert(index)
+
+
+def _relocate(schedule: Schedule, rng: random.Random) -> Optional[Schedule]:
+    if not schedule.assigned:
+        return None
+    candidate = schedule.copy()
+    index = rng.choice(list(candidate.assigned))
+    candidate.remove(index)
+    if not candidate.try_insert(index):
+        return None
+    return candidate
+
+
+def _eject(schedule: Schedule, rng: random.Random) -> Optional[Schedule]:
+    """Make room for an unassigned visit by moving one that blocks it"""
+    unassigned = [i for i in range(len(schedule.visits)) if i not in schedule.assigned]
+    if not unassigned:
+        return None
+    index = rng.choice(unassigned)
+    visit = schedule.visits[index]
+    blockers = [
+        i for tech in visit["candidates"] for start, end, i in schedule.routes.get(tech, ())
+        if any(start < w_end and end > w_start for w_start, w_end in visit["windows"])
+    ]
+    if not blockers:
+        return None
+    candidate = schedule.copy()
+    candidate.remove(rng.choice(blockers))
+    if not candidate.try_insert(index):
+        return None
+    # The ejected visit gets one chance to land elsewhere; cost decides if it was worth it
+    for i in range(len(candidate.visits)):
+        if i not in candidate.assigned and i != index:
+            candidate.try_insert(i)
+    return candidate
+
+
+def solve(problem: Dict[str, Any], time_budget: float, seed: int = 0) -> Dict[str, Any]:
+    """
+    Assign visits to technicians within `time_budget` seconds
+
+    problem = {"visits": [{"duration", "windows": [[start, end]], "candidates": [tech],
+    "location": [lat, lon] | None, "priority"}], "technicians": {tech: [[free_start, free_end]]}}
+    Returns assignments as (visit index, technician, start, end) plus run statistics.
+    """
+    started = time.monotonic()
+    deadline = started + max(time_budget, 0.0)
+    rng = random.Random(seed)
+
+    best = Schedule(problem)
+    _greedy(best)
+    best_cost = best.cost()
+    greedy_cost = best_cost
+
+    iterations = stalled = 0
+    while time.monotonic() < deadline and stalled < STALL_ITERATIONS:
+        iterations += 1
+        move = _eject if rng.random() < 0.3 else _relocate
+        candidate = move(best, rng)
+        if candidate is not None:
+            cost = candidate.cost()
+            if cost < best_cost - 1e-9:
+                best, best_cost, stalled = candidate, cost, 0
+                continue
+        stalled += 1
+
+    assignments = sorted(
+        (index, tech, start, end)
+        for tech, route in best.routes.items() for start, end, index in route
+    )
+    travel = sum(
+        best._travel(a[2], b[2]) for route in best.routes.values() for a, b in zip(route, route[1:])
+    )
+    return {
+        "assignments": assignments,
+        "unassigned": [i for i in range(len(best.visits)) if i not in best.assigned],
+        "stats": {
+            "iterations": iterations,
+            "greedy_cost": round(greedy_cost, 2),
+            "cost": round(best_cost, 2),
+            "travel_minutes": round(travel, 1),
+            "elapsed_seconds": round(time.monotonic() - started, 3)
+        }
+    }
@@ -0,0 +1,148 @@
+"""
+Batch visit scheduling
+Turns visit requests and technicians' free time into a plain problem for
+services/schedule_optimizer.py and runs it in a worker process under a time
+budget, so a large batch never blocks the event loop or other requests.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from models import TeamMember, User
+from services.availability import availability
+from services.schedule_optimizer import solve
+
+DEFAULT_TIME_BUDGET_SECONDS = 5.0
+MAX_TIME_BUDGET_SECONDS = 30.0
+SCHEDULE_MAX_VISITS = 200
+SCHEDULE_MAX_DAYS = 31
+# Solver processes; 0 runs the solver on a thread of this process instead
+SOLVER_PROCESSES = 2
+# Allowance on top of the budget for process start-up and pickling
+SOLVER_GRACE_SECONDS = 10.0
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _executor() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if SOLVER_PROCESSES and _pool is None:
+        # spawn: a forked child would inherit the parent's DB connections and threads
+        _pool = ProcessPoolExecutor(max_workers=SOLVER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_solver_pool():
+    """Stop the solver processes (called on application shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _candidates(db: Session, visits: Sequence[Dict[str, Any]]) -> List[List[int]]:
+    """Technicians allowed on each visit: listed ones, the team's members, or every technician"""
+    team_ids = {visit["team_id"] for visit in visits if visit.get("team_id") and not visit.get("technician_ids")}
+    members: Dict[int, List[int]] = {team_id: [] for team_id in team_ids}
+    if team_ids:
+        for team_id, user_id in db.query(TeamMember.team_id, TeamMember.user_id).filter(
+            TeamMember.team_id.in_(team_ids)
+        ).order_by(TeamMember.user_id):
+            members[team_id].append(user_id)
+    technicians = None
+    result = []
+    for visit in visits:
+        if visit.get("technician_ids"):
+            result.append(list(dict.fromkeys(visit["technician_ids"])))
+        elif visit.get("team_id"):
+            result.append(members[visit["team_id"]])
+        else:
+            if technicians is None:
+                technicians = [row[0] for row in db.query(User.id).filter(
+                    User.role == "technician", User.is_active == True
+                ).order_by(User.id)]
+            result.append(technicians)
+    return result
+
+
+def build_problem(db: Session, visits: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Solver input for visits given as dicts with duration_minutes, windows
+    [(start, end)] in naive UTC, optional latitude/longitude, priority,
+    team_id and technician_ids. Times become minutes from the earliest window.
+    """
+    starts = [start for visit in visits for start, end in visit["windows"]]
+    ends = [end for visit in visits for start, end in visit["windows"]]
+    origin, horizon_end = min(starts), max(ends)
+    if horizon_end - origin > timedelta(days=SCHEDULE_MAX_DAYS):
+        raise ValueError(f"Visit windows must fall within {SCHEDULE_MAX_DAYS} days")
+
+    def minutes(value: datetime) -> float:
+        return (value - origin).total_seconds() / 60
+
+    candidates = _candidates(db, visits)
+    technician_ids = list(dict.fromkeys(tech for techs in candidates for tech in techs))
+    shortest = timedelta(minutes=min(visit["duration_minutes"] for visit in visits))
+    # Loads every candidate's timeline in one query before the per-technician reads
+    availability.timelines(db, technician_ids, origin)
+    technicians = {
+        tech: [[minutes(s), minutes(e)] for s, e in availability.free_slots(db, tech, origin, horizon_end, shortest)]
+        for tech in technician_ids
+    }
+    return {
+        "origin": origin,
+        "technicians": technicians,
+        "visits": [
+            {
+                "duration": visit["duration_minutes"],
+                "windows": sorted([minutes(s), minutes(e)] for s, e in visit["windows"]),
+                "candidates": techs,
+                "location": [visit["latitude"], visit["longitude"]]
+                if visit.get("latitude") is not None and visit.get("longitude") is not None else None,
+                "priority": visit.get("priority", 0)
+            }
+            for visit, techs in zip(visits, candidates)
+        ]
+    }
+
+
+async def optimize(db: Session, visits: Sequence[Dict[str, Any]],
+                   time_budget: float = DEFAULT_TIME_BUDGET_SECONDS) -> Dict[str, Any]:
+    """
+    Assign technicians and start times to a batch of visits
+
+    Returns {"assignments": [{visit, technician_id, start, end}], "unassigned":
+    [visit index], "stats"}; raises asyncio.TimeoutError if the solver overruns
+    and RuntimeError if its process dies.
+    """
+    time_budget = min(max(time_budget, 0.0), MAX_TIME_BUDGET_SECONDS)
+    problem = build_problem(db, visits)
+    origin = problem.pop("origin")
+    loop = asyncio.get_running_loop()
+    try:
+        result = await asyncio.wait_for(
+            loop.run_in_executor(_executor(), solve, problem, time_budget),
+            time_budget + SOLVER_GRACE_SECONDS
+        )
+    except BrokenProcessPool:
+        # A dead pool stays dead; start a fresh one on the next request
+        shutdown_solver_pool()
+        raise RuntimeError("Scheduling solver process exited unexpectedly")
+    return {
+        "assignments": [
+            {
+                "visit": index,
+                "technician_id": tech,
+                "start": origin + timedelta(minutes=start),
+                "end": origin + timedelta(minutes=end)
+            }
+            for index, tech, start, end in result["assignments"]
+        ],
+        "unassigned": result["unassigned"],
+        "stats": result["stats"]
+    }
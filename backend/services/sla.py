@@ -0,0 +1,384 @@
+"""
+Ticket SLA deadlines
+Due dates come from the active SLAPolicy for a ticket's priority, counted in
+the business hours of its company's calendar (or the default calendar).
+Calendars are compiled into cumulative working-minute arrays, so adding N
+business hours is two binary searches, run for whole batches with numpy.
+"""
+import json
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm import Session, selectinload
+
+from models import BusinessCalendar, CalendarHoliday, SLAPolicy, Ticket, TicketPriority
+from services.sla_timer import OPEN_TICKET_STATUSES
+
+# Resolution hours for priorities no active policy covers
+DEFAULT_SLA_HOURS = {
+    TicketPriority.CRITICAL.value: 4,
+    TicketPriority.HIGH.value: 8,
+    TicketPriority.MEDIUM.value: 24,
+    TicketPriority.LOW.value: 72
+}
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_WORKING_HOURS = {day: [["09:00", "17:00"]] for day in WEEKDAY_NAMES[:5]}
+# Days compiled past the latest start; extended on demand up to the maximum
+CALENDAR_HORIZON_DAYS = 400
+CALENDAR_MAX_DAYS = 3660
+
+_EPOCH = datetime(1970, 1, 1)
+_CHANGED_KEY = "sla_calendars_changed"
+_CALENDAR_TABLES = (BusinessCalendar.__tablename__, CalendarHoliday.__tablename__)
+
+WeeklyHours = List[List[Tuple[int, int]]]  # per weekday, (start, end) minutes of the day
+CalendarSpec = Tuple[WeeklyHours, Set[date], ZoneInfo]
+
+
+def _minute_of_day(value: str) -> int:
+    hours, sep, minutes = str(value).partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit() or len(minutes) != 2:
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    minute = int(hours) * 60 + int(minutes)
+    if int(minutes) > 59 or minute > 1440:
+        raise ValueError(f"Invalid time {value!r}")
+    return minute
+
+
+def parse_working_hours(value) -> WeeklyHours:
+    """Weekly hours from the calendar's JSON (or dict); None means Mon-Fri 09:00-17:00"""
+    if value is None:
+        value = DEFAULT_WORKING_HOURS
+    elif isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError("Working hours must map weekdays to [start, end] pairs")
+    unknown = set(value) - set(WEEKDAY_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown weekdays: {', '.join(sorted(unknown))}")
+
+    weekly: WeeklyHours = []
+    for day in WEEKDAY_NAMES:
+        intervals = []
+        for pair in value.get(day) or []:
+            if len(pair) != 2:
+                raise ValueError(f"Working hours for {day} must be [start, end] pairs")
+            start, end = _minute_of_day(pair[0]), _minute_of_day(pair[1])
+            if start >= end:
+                raise ValueError(f"Working hours for {day} end before they start")
+            intervals.append((start, end))
+        intervals.sort()
+        if any(prev[1] > cur[0] for prev, cur in zip(intervals, intervals[1:])):
+            raise ValueError(f"Working hours for {day} overlap")
+        weekly.append(intervals)
+    if not any(weekly):
+        raise ValueError("A calendar needs some working hours")
+    return weekly
+
+
+def _to_minutes(value: datetime) -> float:
+    return (value - _EPOCH).total_seconds() / 60
+
+
+def _from_minutes(value: float) -> datetime:
+    return _EPOCH + timedelta(seconds=round(value * 60))
+
+
+class CompiledCalendar:
+    """
+    Working intervals of [first_day, last_day) as UTC minutes since the epoch
+
+    before[i] is the working time ahead of interval i, so a start's position
+    in working time and the interval where a total runs out are both bisects.
+    """
+
+    __slots__ = ("first_day", "last_day", "starts", "ends", "before", "through")
+
+    def __init__(self, weekly: WeeklyHours, holidays: Set[date], tz: ZoneInfo, first_day: date, last_day: date):
+        starts, ends = [], []
+        day = first_day
+        while day < last_day:
+            if day not in holidays:
+                midnight = datetime.combine(day, datetime.min.time())
+                for start, end in weekly[day.weekday()]:
+                    # Local wall-clock hours, so DST shifts move the UTC interval
+                    starts.append(_to_minutes(_utc(midnight + timedelta(minutes=start), tz)))
+                    ends.append(_to_minutes(_utc(midnight + timedelta(minutes=end), tz)))
+            day += timedelta(days=1)
+        self.first_day = first_day
+        self.last_day = last_day
+        self.starts = np.array(starts, dtype=np.float64)
+        self.ends = np.maximum(np.array(ends, dtype=np.float64), self.starts)
+        self.through = np.cumsum(self.ends - self.starts)
+        self.before = self.through - (self.ends - self.starts)
+
+    def add(self, starts: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+        """End of `minutes` working minutes from each start; NaN where that runs past last_day"""
+        result = np.full(len(starts), np.nan)
+        if len(self.starts) == 0:
+            return result
+        # First interval ending after the start, and the working time already behind it
+        i = np.searchsorted(self.ends, starts, side="right")
+        inside = i < len(self.ends)
+        i = np.minimum(i, len(self.ends) - 1)
+        worked = self.before[i] + np.clip(starts - self.starts[i], 0, None)
+        target = worked + minutes
+        # First interval whose cumulative total reaches the target
+        j = np.searchsorted(self.through, target, side="left")
+        found = inside & (j < len(self.through))
+        j = np.minimum(j, len(self.through) - 1)
+        result[found] = (self.starts[j] + target - self.before[j])[found]
+        return np.where(minutes <= 0, starts, result)
+
+
+def _utc(local: datetime, tz: ZoneInfo) -> datetime:
+    return local.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def next_sla_state(old_due: Optional[datetime], new_due: datetime, state: Optional[str],
+                   now: datetime) -> Optional[str]:
+    """A deadline moved into the future starts the SLA timer over; one already past keeps what fired"""
+    if old_due == new_due or new_due <= now:
+        return state
+    return None
+
+
+class SLACalculator:
+    """
+    Picks each ticket's SLA policy and computes its response and resolution due dates
+
+    Active calendars are loaded once and compiled per calendar on first use;
+    any committed calendar or holiday write drops them. A session with
+    flushed, uncommitted calendar changes reads and compiles its own copy. Companies without a
+    calendar use the default one (company_id None), and without that the
+    clock runs around the clock.
+    """
+
+    def __init__(self, horizon_days: int = CALENDAR_HORIZON_DAYS):
+        self.horizon_days = horizon_days
+        self._lock = threading.Lock()
+        self._generation = 0
+        # (calendars by id, calendar id by company, default calendar id)
+        self._calendars: Optional[Tuple[Dict[int, CalendarSpec], Dict[int, int], Optional[int]]] = None
+        self._compiled: Dict[int, CompiledCalendar] = {}
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._calendars = None
+            self._compiled = {}
+
+    def _load(self, db: Session) -> Tuple[Dict[int, CalendarSpec], Dict[int, int], Optional[int]]:
+        if db.info.get(_CHANGED_KEY):
+            # This transaction changed calendars: read its own view, don't share it
+            return self._read(db)
+        loaded = self._calendars
+        if loaded is not None:
+            return loaded
+        generation = self._generation
+        loaded = self._read(db)
+        with self._lock:
+            # A calendar write committed while loading wins
+            if generation == self._generation:
+                self._calendars = loaded
+        return loaded
+
+    def _read(self, db: Session) -> Tuple[Dict[int, CalendarSpec], Dict[int, int], Optional[int]]:
+        calendars, by_company, default = {}, {}, None
+        for row in db.query(BusinessCalendar).options(selectinload(BusinessCalendar.holidays)).filter(
+            BusinessCalendar.is_active == True
+        ).order_by(BusinessCalendar.id):
+            try:
+                spec = (parse_working_hours(row.working_hours), {h.date for h in row.holidays},
+                        ZoneInfo(row.timezone or "UTC"))
+            except (ValueError, ZoneInfoNotFoundError) as e:
+                print(f"Business calendar {row.id} skipped: {str(e)}")
+                continue
+            calendars[row.id] = spec
+            if row.company_id is None:
+                default = default or row.id
+            else:
+                by_company.setdefault(row.company_id, row.id)
+        return calendars, by_company, default
+
+    def calendar_for(self, db: Session, company_id: Optional[int]) -> Optional[int]:
+        """Calendar id that applies to a company; None runs the SLA clock around the clock"""
+        calendars, by_company, default = self._load(db)
+        return by_company.get(company_id, default)
+
+    def _compiled_for(self, calendar_id: int, spec: CalendarSpec, first_day: date, last_day: date,
+                      shared: bool = True) -> CompiledCalendar:
+        if not shared:
+            return CompiledCalendar(*spec, first_day, last_day)
+        with self._lock:
+            generation = self._generation
+            compiled = self._compiled.get(calendar_id)
+        if compiled is not None and compiled.first_day <= first_day and compiled.last_day >= last_day:
+            return compiled
+        if compiled is not None:
+            first_day, last_day = min(first_day, compiled.first_day), max(last_day, compiled.last_day)
+        compiled = CompiledCalendar(*spec, first_day, last_day)
+        with self._lock:
+            if generation == self._generation:
+                self._compiled[calendar_id] = compiled
+        return compiled
+
+    def add_business_minutes(self, db: Session, calendar_id: Optional[int],
+                             starts: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+        """Vectorized start + working minutes, both as minutes since the epoch"""
+        if calendar_id is None or len(starts) == 0:
+            return starts + minutes
+        spec = self._load(db)[0].get(calendar_id)
+        if spec is None:
+            raise ValueError(f"Business calendar {calendar_id} is not active")
+        # A day either side covers any UTC offset
+        first_day = _from_minutes(float(starts.min())).date() - timedelta(days=1)
+        days = self.horizon_days
+        while True:
+            last_day = _from_minutes(float(starts.max())).date() + timedelta(days=days)
+            result = self._compiled_for(
+                calendar_id, spec, first_day, last_day, shared=not db.info.get(_CHANGED_KEY)
+            ).add(starts, minutes)
+            if not np.isnan(result).any():
+                return result
+            if days >= CALENDAR_MAX_DAYS:
+                raise ValueError(f"Business calendar {calendar_id} has too little working time for these SLAs")
+            days = min(days * 2, CALENDAR_MAX_DAYS)
+
+    def due_dates(self, db: Session, tickets: Sequence[Tuple[str, Optional[int], datetime]]
+                  ) -> List[Tuple[Optional[int], Optional[datetime], datetime]]:
+        """(policy id, response due, resolution due) for (priority, company id, start) tuples"""
+        policies: Dict[str, SLAPolicy] = {}
+        for policy in db.query(SLAPolicy).filter(SLAPolicy.is_active == True).order_by(SLAPolicy.id):
+            policies.setdefault(policy.priority, policy)
+
+        count = len(tickets)
+        starts = np.array([_to_minutes(start) for _, _, start in tickets], dtype=np.float64)
+        response = np.full(count, np.nan)
+        resolution = np.empty(count)
+        policy_ids: List[Optional[int]] = []
+        calendar_ids = np.empty(count, dtype=np.int64)
+        for index, (priority, company_id, _) in enumerate(tickets):
+            policy = policies.get(priority)
+            policy_ids.append(policy.id if policy else None)
+            if policy is not None:
+                response[index] = policy.response_time_hours * 60
+                resolution[index] = policy.resolution_time_hours * 60
+            else:
+                resolution[index] = DEFAULT_SLA_HOURS.get(priority, 24) * 60
+            calendar_id = self.calendar_for(db, company_id)
+            calendar_ids[index] = -1 if calendar_id is None else calendar_id
+
+        response_due = np.full(count, np.nan)
+        resolution_due = np.empty(count)
+        for calendar_id in np.unique(calendar_ids):
+            rows = np.flatnonzero(calendar_ids == calendar_id)
+            with_response = rows[~np.isnan(response[rows])]
+            # One pass per calendar for both deadlines
+            ends = self.add_business_minutes(
+                db, None if calendar_id < 0 else int(calendar_id),
+                np.concatenate([starts[rows], starts[with_response]]),
+                np.concatenate([resolution[rows], response[with_response]])
+            )
+            resolution_due[rows] = ends[:len(rows)]
+            response_due[with_response] = ends[len(rows):]
+
+        def after(index: int, due: float) -> datetime:
+            # Offset from the exact start; epoch floats alone would drop sub-second precision
+            return tickets[index][2] + timedelta(microseconds=round((due - starts[index]) * 60_000_000))
+
+        return [
+            (policy_ids[i], None if np.isnan(response_due[i]) else after(i, response_due[i]),
+             after(i, resolution_due[i]))
+            for i in range(count)
+        ]
+
+    def assign(self, db: Session, ticket: Ticket, now: Optional[datetime] = None):
+        """Set a ticket's policy and due dates, counted from its creation"""
+        now = now or datetime.utcnow()
+        (policy_id, response_due, resolution_due), = self.due_dates(
+            db, [(ticket.priority, ticket.company_id, ticket.created_at or now)]
+        )
+        ticket.sla_state = next_sla_state(ticket.sla_due_date, resolution_due, ticket.sla_state, now)
+        ticket.sla_policy_id = policy_id
+        ticket.response_due_date = response_due
+        ticket.sla_due_date = resolution_due
+
+    def recalculate(self, db: Session, *, priorities: Optional[Sequence[str]] = None,
+                    company_ids: Optional[Sequence[Optional[int]]] = None,
+                    now: Optional[datetime] = None) -> int:
+        """
+        Recompute due dates of open tickets (optionally only some priorities or
+        companies) in one batch; returns how many changed. Does not commit.
+        """
+        now = now or datetime.utcnow()
+        query = db.query(
+            Ticket.id, Ticket.priority, Ticket.company_id, Ticket.created_at,
+            Ticket.sla_policy_id, Ticket.response_due_date, Ticket.sla_due_date, Ticket.sla_state
+        ).filter(Ticket.status.in_(OPEN_TICKET_STATUSES))
+        if priorities is not None:
+            query = query.filter(Ticket.priority.in_(list(priorities)))
+        if company_ids is not None:
+            condition = Ticket.company_id.in_([c for c in company_ids if c is not None])
+            if None in company_ids:
+                condition = condition | Ticket.company_id.is_(None)
+            query = query.filter(condition)
+        rows = query.all()
+        if not rows:
+            return 0
+
+        computed = self.due_dates(db, [(row.priority, row.company_id, row.created_at or now) for row in rows])
+        params = [
+            {
+                "ticket_id": row.id, "policy_id": policy_id, "response_due": response_due,
+                "resolution_due": resolution_due,
+                "state": next_sla_state(row.sla_due_date, resolution_due, row.sla_state, now)
+            }
+            for row, (policy_id, response_due, resolution_due) in zip(rows, computed)
+            if (row.sla_policy_id, row.response_due_date, row.sla_due_date) != (policy_id, response_due, resolution_due)
+        ]
+        if params:
+            # Statement-level, so the SLA timer reloads once instead of tracking each row
+            table = Ticket.__table__
+            db.execute(
+                update(table).where(table.c.id == bindparam("ticket_id")).values(
+                    sla_policy_id=bindparam("policy_id"), response_due_date=bindparam("response_due"),
+                    sla_due_date=bindparam("resolution_due"), sla_state=bindparam("state")
+                ),
+                params
+            )
+        return len(params)
+
+
+# Shared calculator used by the ticket endpoints
+sla_calculator = SLACalculator()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_calendar_changes(session, flush_context):
+    if any(isinstance(obj, (BusinessCalendar, CalendarHoliday))
+           for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_calendar_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in _CALENDAR_TABLES:
+            orm_execute_state.session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_calendar_changes(session):
+    if session.info.pop(_CHANGED_KEY, False):
+        sla_calculator.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_calendar_changes(session):
+    session.info.pop(_CHANGED_KEY, None)
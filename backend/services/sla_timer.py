@@ -0,0 +1,435 @@
+"""
+SLA deadline timer
+Each open ticket's next SLA event (at risk, then breached) sits in a min-heap,
+rebuilt at startup from the (status, sla_due_date) index and kept current from
+committed ticket writes. The worker sleeps until the next deadline, so events
+fire within moments of it and an idle tick costs one heap peek.
+"""
+import asyncio
+import heapq
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import SessionLocal
+from models import Alert, Team, TeamMember, Ticket, TicketComment, TicketStatus, User
+from services.alerting import OPEN_ALERT_STATUSES, alert_fingerprint, alert_pipeline
+from services.notifications import LogNotifier, Notifier
+
+OPEN_TICKET_STATUSES = (TicketStatus.NEW.value, TicketStatus.IN_PROGRESS.value, TicketStatus.PENDING.value)
+# A ticket is at risk once this share of its SLA window has elapsed
+AT_RISK_RATIO = 0.8
+# Re-sync with the table for writes made by other processes
+SLA_RELOAD_INTERVAL_SECONDS = 3600
+SLA_BATCH_SIZE = 200
+RETRY_DELAY_SECONDS = 60
+# Breaching an SLA raises priority one step
+ESCALATION = {"low": "medium", "medium": "high", "high": "critical"}
+
+_PENDING_KEY = "sla_changes"
+_RELOAD_KEY = "sla_reload"
+
+# (ticket id, sla_due_date, created_at, sla_state, still open)
+TicketChange = Tuple[int, Optional[datetime], Optional[datetime], Optional[str], bool]
+
+
+@dataclass
+class SLAEvent:
+    ticket_id: int
+    ticket_number: str
+    kind: str  # at_risk, breached
+    due: datetime
+    priority: str
+    recipients: List[str] = field(default_factory=list)  # team, team members and assignee
+
+    @property
+    def subject(self) -> str:
+        label = "SLA breached" if self.kind == "breached" else "SLA at risk"
+        return f"{label}: ticket {self.ticket_number} (due {self.due.isoformat()}, now {self.priority})"
+
+
+def next_sla_event(due: Optional[datetime], created: Optional[datetime],
+                   state: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """(when, kind) of the ticket's next SLA event; "clear" is not scheduled here"""
+    if due is None or state == "breached":
+        return None
+    if state is None and created is not None and created < due:
+        return due - (due - created) * (1 - AT_RISK_RATIO), "at_risk"
+    return due, "breached"
+
+
+def _alert_title(kind: str, ticket_number: str) -> Tuple[str, str]:
+    if kind == "breached":
+        return "critical", f"SLA breached: ticket {ticket_number}"
+    return "warning", f"SLA at risk: ticket {ticket_number}"
+
+
+class SLATimer:
+    """
+    Fires SLA events for open tickets
+
+    At risk raises a warning alert and notifies the ticket's team; breached
+    raises a critical alert, escalates priority one step and notifies again.
+    Ticket.sla_state records what has fired, so a restart never repeats an
+    escalation. Closing a ticket resolves its open SLA alerts.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        *,
+        notifier: Optional[Notifier] = None,
+        reload_interval: float = SLA_RELOAD_INTERVAL_SECONDS,
+        batch_size: int = SLA_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.notifier = notifier or LogNotifier()
+        self.reload_interval = reload_interval
+        self.batch_size = batch_size
+
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._due: Dict[int, Tuple[datetime, str]] = {}
+        self._lock = threading.Lock()
+        self._reload_requested = False
+        self._loading = False
+        self._applied_while_loading: List[TicketChange] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ----- heap -----
+
+    def _push(self, ticket_id: int, when: datetime, kind: str):
+        self._due[ticket_id] = (when, kind)
+        heapq.heappush(self._heap, (when, ticket_id, kind))
+
+    def _pop_due(self, now: datetime) -> List[Tuple[int, str]]:
+        fired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(fired) < self.batch_size:
+                when, ticket_id, kind = heapq.heappop(self._heap)
+                if self._due.get(ticket_id) != (when, kind):
+                    continue  # superseded by a later change
+                del self._due[ticket_id]
+                fired.append((ticket_id, kind))
+        return fired
+
+    def next_due(self) -> Optional[datetime]:
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != (self._heap[0][0], self._heap[0][2]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._due)
+
+    # ----- loading -----
+
+    def load(self, db: Session) -> Dict[int, Tuple[datetime, str]]:
+        """
+        Next event of every open ticket with an SLA that hasn't breached yet,
+        plus a "clear" for closed tickets whose SLA alerts are still open
+        """
+        due = {}
+        # Uses ix_tickets_status_sla_due
+        for ticket_id, sla_due, created, state in db.query(
+            Ticket.id, Ticket.sla_due_date, Ticket.created_at, Ticket.sla_state
+        ).filter(
+            Ticket.status.in_(OPEN_TICKET_STATUSES),
+            Ticket.sla_due_date.isnot(None),
+            (Ticket.sla_state.is_(None)) | (Ticket.sla_state != "breached")
+        ):
+            upcoming = next_sla_event(sla_due, created, state)
+            if upcoming is not None:
+                due[ticket_id] = upcoming
+
+        # "clear" events only live in the heap; rebuild them from the SLA alerts
+        # still open for tickets that have since been closed
+        numbers = {
+            title.rsplit(" ticket ", 1)[-1]
+            for (title,) in db.query(Alert.title).filter(
+                Alert.service_id.is_(None),
+                Alert.status.in_(OPEN_ALERT_STATUSES),
+                Alert.title.like("SLA % ticket %")
+            )
+        }
+        if numbers:
+            now = datetime.utcnow()
+            for (ticket_id,) in db.query(Ticket.id).filter(
+                Ticket.ticket_number.in_(numbers),
+                Ticket.status.notin_(OPEN_TICKET_STATUSES),
+                Ticket.sla_state.isnot(None)
+            ):
+                due[ticket_id] = (now, "clear")
+        return due
+
+    def reload(self, db: Optional[Session] = None):
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            self._reload_requested = False
+            with self._lock:
+                self._loading = True
+                self._applied_while_loading = []
+            due = self.load(db)
+            with self._lock:
+                self._loading = False
+                missed = self._applied_while_loading
+                self._due = dict(due)
+                self._heap = [(when, ticket_id, kind) for ticket_id, (when, kind) in due.items()]
+                heapq.heapify(self._heap)
+            # Writes committed after the query ran would otherwise be lost until the next reload
+            self.apply(missed)
+        finally:
+            self._loading = False
+            if own_session:
+                db.close()
+
+    def apply(self, changes: List[TicketChange]):
+        """Reschedule tickets after committed writes"""
+        with self._lock:
+            if self._loading:
+                self._applied_while_loading.extend(changes)
+            for ticket_id, sla_due, created, state, is_open in changes:
+                if is_open:
+                    upcoming = next_sla_event(sla_due, created, state)
+                elif state is not None:
+                    upcoming = (datetime.utcnow(), "clear")
+                else:
+                    upcoming = None
+                if upcoming is None:
+                    self._due.pop(ticket_id, None)
+                elif self._due.get(ticket_id) != upcoming:
+                    self._push(ticket_id, *upcoming)
+        self._wake()
+
+    def request_reload(self):
+        self._reload_requested = True
+        self._wake()
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    # ----- firing -----
+
+    def _recipients(self, db: Session, tickets: List[Ticket]) -> Dict[int, List[str]]:
+        team_ids = {t.team_id for t in tickets if t.team_id}
+        user_ids = {t.assigned_to for t in tickets if t.assigned_to}
+        team_emails = dict(db.query(Team.id, Team.email).filter(Team.id.in_(team_ids)).all()) if team_ids else {}
+        members: Dict[int, List[int]] = {}
+        if team_ids:
+            for team_id, user_id in db.query(TeamMember.team_id, TeamMember.user_id).filter(
+                TeamMember.team_id.in_(team_ids)
+            ):
+                members.setdefault(team_id, []).append(user_id)
+                user_ids.add(user_id)
+        emails = dict(db.query(User.id, User.email).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+        result = {}
+        for ticket in tickets:
+            found = [team_emails.get(ticket.team_id)]
+            found += [emails.get(u) for u in members.get(ticket.team_id, []) + [ticket.assigned_to]]
+            result[ticket.id] = list(dict.fromkeys(e for e in found if e))
+        return result
+
+    def _resolve_alerts(self, db: Session, ticket_number: str, kinds=("at_risk", "breached")):
+        fingerprints = [alert_fingerprint(None, *_alert_title(kind, ticket_number)) for kind in kinds]
+        for alert in db.query(Alert).filter(
+            Alert.fingerprint.in_(fingerprints), Alert.status.in_(OPEN_ALERT_STATUSES)
+        ):
+            alert_pipeline.resolve(db, alert)
+
+    def _claim(self, db: Session, ticket: Ticket, kind: str) -> bool:
+        """
+        Move sla_state on from the value this worker read; every API worker runs
+        a timer, and only the one whose UPDATE matches acts on the event
+        """
+        table = Ticket.__table__
+        observed = table.c.sla_state.is_(None) if ticket.sla_state is None else table.c.sla_state == ticket.sla_state
+        # Connection-level, so the timer's own bulk-write listener doesn't trigger a reload
+        claimed = db.connection().execute(
+            update(table).where(table.c.id == ticket.id, observed).values(sla_state=kind)
+        ).rowcount == 1
+        if claimed:
+            set_committed_value(ticket, "sla_state", kind)
+        return claimed
+
+    def fire(self, fired: List[Tuple[int, str]], db: Optional[Session] = None,
+             now: Optional[datetime] = None) -> List[SLAEvent]:
+        """Act on one batch of due events, re-checked against the tickets; returns what fired"""
+        own_session = db is None
+        db = db or self.session_factory()
+        now = now or datetime.utcnow()
+        try:
+            kinds = dict(fired)
+            tickets = db.query(Ticket).filter(Ticket.id.in_(list(kinds))).all()
+            events: List[SLAEvent] = []
+            for ticket in tickets:
+                kind = kinds[ticket.id]
+                if kind == "clear":
+                    if ticket.status not in OPEN_TICKET_STATUSES:
+                        self._resolve_alerts(db, ticket.ticket_number)
+                    continue
+                if ticket.status not in OPEN_TICKET_STATUSES or ticket.sla_due_date is None:
+                    continue
+                upcoming = next_sla_event(ticket.sla_due_date, ticket.created_at, ticket.sla_state)
+                if upcoming is None or upcoming[0] > now:
+                    continue  # changed since it was scheduled; the commit rescheduled it
+                kind = "breached" if now >= ticket.sla_due_date else upcoming[1]
+                if not self._claim(db, ticket, kind):
+                    continue  # another worker fired it
+
+                if kind == "breached":
+                    self._resolve_alerts(db, ticket.ticket_number, ("at_risk",))
+                    ticket.priority = ESCALATION.get(ticket.priority, ticket.priority)
+                severity, title = _alert_title(kind, ticket.ticket_number)
+                alert_pipeline.ingest(
+                    db, service_id=None, severity=severity, title=title,
+                    description=f"{ticket.title} - due {ticket.sla_due_date.isoformat()}", now=now
+                )
+                evt = SLAEvent(ticket.id, ticket.ticket_number, kind, ticket.sla_due_date, ticket.priority)
+                db.add(TicketComment(ticket_id=ticket.id, comment=evt.subject, is_internal=True, created_at=now))
+                events.append(evt)
+
+            claimed: List[TicketChange] = []
+            if events:
+                fired_tickets = [t for t in tickets if t.id in {e.ticket_id for e in events}]
+                recipients = self._recipients(db, fired_tickets)
+                for evt in events:
+                    evt.recipients = recipients.get(evt.ticket_id, [])
+                claimed = [(t.id, t.sla_due_date, t.created_at, t.sla_state, True) for t in fired_tickets]
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+        # The claim bypasses the ORM, so schedule what comes next here
+        self.apply(claimed)
+        if events:
+            try:
+                self.notifier.send(events)
+            except Exception as e:
+                # Alerts and escalation are already committed; a lost notification isn't retried
+                print(f"SLA notification failed: {str(e)}")
+        return events
+
+    def run_once(self, db: Optional[Session] = None, now: Optional[datetime] = None) -> List[SLAEvent]:
+        """Reload and fire everything due by `now` (for scripts and tests)"""
+        now = now or datetime.utcnow()
+        self.reload(db)
+        events = []
+        while True:
+            fired = self._pop_due(now)
+            if not fired:
+                return events
+            events.extend(self.fire(fired, db, now))
+
+    # ----- lifecycle -----
+
+    async def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._loop = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reload = 0.0
+        while True:
+            if self._reload_requested or time.monotonic() >= next_reload:
+                try:
+                    await loop.run_in_executor(None, self.reload)
+                except Exception as e:
+                    print(f"SLA timer reload failed: {str(e)}")
+                next_reload = time.monotonic() + self.reload_interval
+
+            fired = self._pop_due(datetime.utcnow())
+            if fired:
+                try:
+                    await loop.run_in_executor(None, self.fire, fired)
+                except Exception as e:
+                    print(f"SLA timer failed: {str(e)}")
+                    retry = datetime.utcnow() + timedelta(seconds=RETRY_DELAY_SECONDS)
+                    with self._lock:
+                        for ticket_id, kind in fired:
+                            if ticket_id not in self._due:
+                                self._push(ticket_id, retry, kind)
+                continue
+
+            delay = next_reload - time.monotonic()
+            next_due = self.next_due()
+            if next_due is not None:
+                delay = min(delay, (next_due - datetime.utcnow()).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+
+# Shared timer started by the application
+sla_timer = SLATimer()
+
+_TRACKED_FIELDS = ("status", "sla_due_date", "sla_state")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_ticket_changes(session, flush_context):
+    changes = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Ticket):
+            continue
+        if obj in session.dirty and not any(
+            attributes.get_history(obj, key).has_changes() for key in _TRACKED_FIELDS
+        ):
+            continue
+        gone = obj in session.deleted
+        changes.append((
+            obj.id, obj.sla_due_date, obj.created_at, None if gone else obj.sla_state,
+            not gone and obj.status in OPEN_TICKET_STATUSES
+        ))
+    if changes:
+        session.info.setdefault(_PENDING_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_writes(orm_execute_state):
+    # Statement-level ticket writes (CRUDBase bulk ops) don't say which rows they hit
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) == Ticket.__tablename__:
+            orm_execute_state.session.info[_RELOAD_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_ticket_changes(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        sla_timer.apply(changes)
+    if session.info.pop(_RELOAD_KEY, False):
+        sla_timer.request_reload()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_ticket_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_RELOAD_KEY, None)
@@ -0,0 +1,172 @@
+"""
+Ticket aggregate loading and serialization for the ticket detail views
+Child collections are fetched with selectinload, so the number of queries
+depends on which collections are asked for, never on how many rows they hold
+"""
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session, selectinload
+
+from models import (
+    Ticket, TicketComment, TimeEntry, TicketDependency, CustomFieldValue,
+    Attachment, ArticleTicketLink, KnowledgeArticle
+)
+from shared.serializers import ModelSerializer
+
+TICKET_INCLUDES = (
+    "comments", "time_entries", "tags", "dependencies", "custom_fields",
+    "attachments", "articles", "satisfaction"
+)
+# What the customer portal has always shown; the rest is staff-only
+PORTAL_INCLUDES = ("comments", "tags", "custom_fields")
+
+TICKET_DETAIL_SERIALIZER = ModelSerializer(Ticket, [
+    "id", "ticket_number", "title", "description", "status", "priority", "category",
+    "submitter_id", "assigned_to", "team_id", "sla_policy_id", "response_due_date", "sla_due_date", "sla_state", "resolution",
+    "time_spent_minutes", "created_at", "updated_at", "resolved_at", "closed_at"
+])
+PORTAL_DETAIL_SERIALIZER = ModelSerializer(Ticket, [
+    "id", "ticket_number", "title", "description", "status", "priority", "category",
+    "submitter_id", "assigned_to", "sla_due_date", "resolution", "created_at", "updated_at", "resolved_at"
+])
+COMMENT_SERIALIZER = ModelSerializer(TicketComment, ["id", "user_id", "comment", "is_internal", "created_at"])
+TIME_ENTRY_SERIALIZER = ModelSerializer(TimeEntry, ["id", "user_id", "minutes", "description", "billable", "created_at"])
+ATTACHMENT_SERIALIZER = ModelSerializer(Attachment, [
+    "id", "filename", "file_size", "mime_type", "comment_id", "uploaded_by", "created_at"
+])
+
+
+def parse_includes(include: Optional[str], allowed: Sequence[str] = TICKET_INCLUDES) -> Tuple[str, ...]:
+    """
+    Turn an `include=a,b` query value into the collections to load
+
+    No value means every allowed collection; an empty value means none.
+    Unknown names are a 400.
+    """
+    if include is None:
+        return tuple(allowed)
+    names = {name.strip() for name in include.split(",") if name.strip()}
+    unknown = sorted(names - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(unknown)}")
+    return tuple(name for name in allowed if name in names)
+
+
+def _loader_options(include: Sequence[str], public_only: bool) -> list:
+    options = []
+    if "comments" in include:
+        comments = Ticket.comments
+        if public_only:
+            comments = comments.and_(TicketComment.is_internal == False)
+        options.append(selectinload(comments))
+    if "time_entries" in include:
+        options.append(selectinload(Ticket.time_entries))
+    if "tags" in include:
+        options.append(selectinload(Ticket.tags))
+    if "dependencies" in include:
+        options.append(
+            selectinload(Ticket.dependencies)
+            .joinedload(TicketDependency.depends_on_ticket)
+            .load_only(Ticket.id, Ticket.ticket_number, Ticket.title, Ticket.status)
+        )
+    if "custom_fields" in include:
+        options.append(selectinload(Ticket.custom_field_values).joinedload(CustomFieldValue.field))
+    if "attachments" in include:
+        attachments = Ticket.attachments
+        if public_only:
+            # Files attached to an internal note are as internal as the note
+            attachments = attachments.and_(or_(
+                Attachment.comment_id.is_(None),
+                ~exists().where(TicketComment.id == Attachment.comment_id, TicketComment.is_internal == True)
+            ))
+        options.append(selectinload(attachments))
+    if "articles" in include:
+        options.append(
+            selectinload(Ticket.article_links)
+            .joinedload(ArticleTicketLink.article)
+            .load_only(KnowledgeArticle.id, KnowledgeArticle.title)
+        )
+    if "satisfaction" in include:
+        options.append(selectinload(Ticket.satisfaction))
+    return options
+
+
+def load_ticket(
+    db: Session,
+    ticket_id: int,
+    include: Sequence[str] = TICKET_INCLUDES,
+    *,
+    public_only: bool = False
+) -> Optional[Ticket]:
+    """
+    Ticket with the requested child collections loaded: one query for the
+    ticket plus one per collection. public_only drops internal comments and
+    their attachments.
+    """
+    return (
+        db.query(Ticket)
+        .options(*_loader_options(include, public_only))
+        .filter(Ticket.id == ticket_id)
+        # Collections may already be loaded (e.g. unfiltered) in a shared session
+        .execution_options(populate_existing=True)
+        .first()
+    )
+
+
+def serialize_ticket(
+    ticket: Ticket,
+    include: Sequence[str],
+    serializer: ModelSerializer = TICKET_DETAIL_SERIALIZER
+) -> Dict[str, Any]:
+    """Ticket fields (those of `serializer`) plus one key per included collection"""
+    data = serializer.from_obj(ticket)
+    if "comments" in include:
+        data["comments"] = COMMENT_SERIALIZER.many_objs(ticket.comments)
+    if "time_entries" in include:
+        data["time_entries"] = TIME_ENTRY_SERIALIZER.many_objs(ticket.time_entries)
+    if "tags" in include:
+        data["tags"] = [tag.tag_name for tag in ticket.tags]
+    if "dependencies" in include:
+        data["dependencies"] = [
+            {
+                "id": dep.id,
+                "depends_on_ticket_id": dep.depends_on_ticket_id,
+                "dependency_type": dep.dependency_type,
+                "ticket_number": dep.depends_on_ticket.ticket_number if dep.depends_on_ticket else None,
+                "title": dep.depends_on_ticket.title if dep.depends_on_ticket else None,
+                "status": dep.depends_on_ticket.status if dep.depends_on_ticket else None
+            }
+            for dep in ticket.dependencies
+        ]
+    if "custom_fields" in include:
+        data["custom_fields"] = [
+            {
+                "custom_field_id": value.custom_field_id,
+                "field_name": value.field.name if value.field else None,
+                "field_type": value.field.field_type if value.field else None,
+                "value": value.value
+            }
+            for value in ticket.custom_field_values
+        ]
+    if "attachments" in include:
+        data["attachments"] = ATTACHMENT_SERIALIZER.many_objs(ticket.attachments)
+    if "articles" in include:
+        data["articles"] = [
+            {
+                "link_id": link.id,
+                "article_id": link.article_id,
+                "title": link.article.title if link.article else None,
+                "link_type": link.link_type
+            }
+            for link in ticket.article_links
+        ]
+    if "satisfaction" in include:
+        satisfaction = ticket.satisfaction
+        data["satisfaction"] = {
+            "rating": satisfaction.rating,
+            "feedback": satisfaction.feedback,
+            "created_at": satisfaction.created_at.isoformat() if satisfaction.created_at else None
+        } if satisfaction else None
+    return data
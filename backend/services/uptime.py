@@ -0,0 +1,168 @@
+"""
+Service status history and uptime/SLA computation
+Status changes are stored as interval spans, each carrying the downtime
+accumulated before it, so uptime over any window needs two indexed lookups
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import MonitoredService, ServiceStatusSpan, SLA
+
+# Statuses counted against uptime
+DOWNTIME_STATUSES = {"down"}
+# Share of the SLA error budget that may be consumed before it is "at-risk"
+AT_RISK_BUDGET_RATIO = 0.75
+# Window used for MonitoredService.uptime_percentage
+UPTIME_WINDOW_DAYS = 30
+
+
+def span_downtime(status: str, started_at: datetime, ended_at: datetime) -> float:
+    """Seconds of downtime contributed by a span up to ended_at"""
+    if status not in DOWNTIME_STATUSES or ended_at <= started_at:
+        return 0.0
+    return (ended_at - started_at).total_seconds()
+
+
+def record_transitions(db: Session, transitions: Iterable[Tuple[int, str, datetime]]) -> int:
+    """
+    Append status transitions to the span log
+
+    Each transition closes the service's open span and opens a new one whose
+    downtime_before is the running prefix sum. Repeats of the current status
+    are ignored. Does not commit; returns the number of spans opened.
+    """
+    transitions = sorted(transitions, key=lambda t: t[2])
+    if not transitions:
+        return 0
+
+    service_ids = {service_id for service_id, _, _ in transitions}
+    open_spans: Dict[int, ServiceStatusSpan] = {
+        span.service_id: span
+        for span in db.query(ServiceStatusSpan).filter(
+            ServiceStatusSpan.service_id.in_(service_ids),
+            ServiceStatusSpan.ended_at.is_(None)
+        )
+    }
+
+    opened = 0
+    touched = set()
+    for service_id, status, at in transitions:
+        current = open_spans.get(service_id)
+        downtime_before = 0.0
+        if current is not None:
+            if current.status == status or at < current.started_at:
+                continue
+            current.ended_at = at
+            downtime_before = (current.downtime_before or 0.0) + span_downtime(
+                current.status, current.started_at, at
+            )
+
+        span = ServiceStatusSpan(
+            service_id=service_id,
+            status=status,
+            started_at=at,
+            downtime_before=downtime_before
+        )
+        db.add(span)
+        open_spans[service_id] = span
+        touched.add(service_id)
+        opened += 1
+
+    if touched:
+        db.flush()
+        now = datetime.utcnow()
+        window_start = now - timedelta(days=UPTIME_WINDOW_DAYS)
+        for service_id in touched:
+            uptime = compute_uptime(db, service_id, window_start, now)
+            if uptime is not None:
+                db.query(MonitoredService).filter(MonitoredService.id == service_id).update(
+                    {MonitoredService.uptime_percentage: uptime},
+                    synchronize_session=False
+                )
+    return opened
+
+
+def cumulative_downtime(db: Session, service_id: int, at: datetime) -> float:
+    """Total downtime in seconds from the start of history up to `at`"""
+    span = db.query(
+        ServiceStatusSpan.status,
+        ServiceStatusSpan.started_at,
+        ServiceStatusSpan.ended_at,
+        ServiceStatusSpan.downtime_before
+    ).filter(
+        ServiceStatusSpan.service_id == service_id,
+        ServiceStatusSpan.started_at <= at
+    ).order_by(
+        ServiceStatusSpan.started_at.desc(),
+        ServiceStatusSpan.id.desc()
+    ).first()
+
+    if span is None:
+        return 0.0
+
+    status, started_at, ended_at, downtime_before = span
+    end = min(at, ended_at) if ended_at else at
+    return (downtime_before or 0.0) + span_downtime(status, started_at, end)
+
+
+def history_start(db: Session, service_id: int) -> Optional[datetime]:
+    """When the first recorded span for a service began"""
+    row = db.query(ServiceStatusSpan.started_at).filter(
+        ServiceStatusSpan.service_id == service_id
+    ).order_by(ServiceStatusSpan.started_at.asc()).first()
+    return row[0] if row else None
+
+
+def compute_uptime(db: Session, service_id: int, start: datetime, end: datetime) -> Optional[float]:
+    """
+    Uptime percentage over [start, end]
+
+    The window is clipped to recorded history; returns None when there is no
+    history inside it.
+    """
+    first = history_start(db, service_id)
+    if first is None or first >= end:
+        return None
+
+    start = max(start, first)
+    total = (end - start).total_seconds()
+    if total <= 0:
+        return None
+
+    downtime = cumulative_downtime(db, service_id, end) - cumulative_downtime(db, service_id, start)
+    return round(100.0 * (1.0 - downtime / total), 4)
+
+
+def sla_status(uptime: Optional[float], target: float) -> str:
+    """Derive meeting / at-risk / breached from uptime against a target"""
+    if uptime is None:
+        return "meeting"
+    if uptime < target:
+        return "breached"
+
+    budget = 100.0 - target
+    if budget <= 0:
+        return "meeting"
+    consumed = (100.0 - uptime) / budget
+    return "at-risk" if consumed >= AT_RISK_BUDGET_RATIO else "meeting"
+
+
+def evaluate_sla(db: Session, sla: SLA, now: Optional[datetime] = None) -> Dict[str, object]:
+    """Live uptime and status for an SLA over its own period"""
+    now = now or datetime.utcnow()
+    end = min(sla.end_date, now) if sla.end_date else now
+
+    uptime = None
+    if sla.service_id and sla.start_date and sla.start_date < end:
+        uptime = compute_uptime(db, sla.service_id, sla.start_date, end)
+
+    if uptime is None:
+        # No recorded history yet - fall back to the stored figure
+        uptime = sla.current_uptime
+
+    return {
+        "current_uptime": uptime,
+        "status": sla_status(uptime, sla.target_uptime or 0.0)
+    }
@@ -4,14 +4,16 @@ Reduces duplicate code in more sophisticated routers
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any
 from pydantic import BaseModel
 
 from database import get_db
 from auth import get_current_user
 from models import User
-from shared.crud import CRUDBase
+from shared.crud import CRUDBase, to_dict, serialize_list
 from shared.utils import admin_required, paginate_query, StandardResponse
+from shared.counting import COUNT_EXACT, COUNT_NONE
+from shared.serializers import parse_fields, serializer_for
 
 
 def create_advanced_router(
@@ -25,251 +27,271 @@ def create_advanced_router(
     permissions_required: bool = True,
     enable_search: bool = True,
     enable_filters: bool = True,
-    enable_export: bool = False
+    enable_export: bool = False,
+    enable_list: bool = True,
+    enable_crud: bool = True,
+    count_strategy: str = COUNT_EXACT,
+    build_item: Optional[Callable] = None
 ) -> APIRouter:
     """
     Creates an advanced CRUD router with additional features:
     - Search functionality
+    - Keyset (cursor) or offset pagination
     - Advanced filtering
     - Bulk operations  
     - Export capabilities
     - Custom endpoint integration
+
+    Set enable_list=False when the module defines its own filtered "/" list,
+    and enable_crud=False when it defines its own "/" create and /{id}
+    get/update/delete.
+    count_strategy picks how list totals are produced (shared.counting).
+    build_item(db, item, current_user) is the module's own create logic for
+    one validated create_schema item; /bulk create uses it when the schema
+    doesn't map straight onto model columns.
     """
     router = APIRouter(prefix=route_prefix, tags=tags or [])
     
     # Standard GET all with filtering and search
-    @router.get("/", response_model=StandardResponse)
-    async def get_items(
-        skip: int = Query(0, ge=0, description="Number of items to skip"),
-        limit: int = Query(100, ge=1, le=1000, description="Number of items to return"),
-        search: Optional[str] = Query(None, description="Search query"),
-        sort_by: Optional[str] = Query(None, description="Field to sort by"),
-        sort_order: str = Query("asc", regex="^(asc|desc)$", description="Sort order"),
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user) if permissions_required else None
-    ):
-        """Get all items with optional search and filtering"""
-        try:
-            items, total = crud_operations.get_multi_with_search(
-                db, 
-                skip=skip, 
-                limit=limit,
-                search=search,
-                sort_by=sort_by,
-                sort_order=sort_order
-            )
-            
-            return StandardResponse(
-                success=True,
-                data=items,
-                meta={
-                    "total": total,
-                    "skip": skip,
-                    "limit": limit,
-                    "has_more": skip + limit < total
-                }
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-    # Standard GET by ID
-    @router.get("/{item_id}", response_model=StandardResponse)
-    async def get_item(
-        item_id: int,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user) if permissions_required else None
-    ):
-        """Get a single item by ID"""
-        item = crud_operations.get(db, id=item_id)
-        if not item:
-            raise HTTPException(status_code=404, detail="Item not found")
-        
-        return StandardResponse(success=True, data=item)
-
-    # Standard CREATE
-    @router.post("/", response_model=StandardResponse)
-    async def create_item(
-        item: create_schema,
-        background_tasks: BackgroundTasks,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user) if permissions_required else None
-    ):
-        """Create a new item"""
-        try:
-            # Add created_by if model has it
-            item_data = item.dict()
-            if hasattr(model, 'created_by') and current_user:
-                item_data['created_by'] = current_user.id
-            
-            new_item = crud_operations.create(db, obj_in=item_data)
-            
-            # Add background task for audit logging if needed
-            if hasattr(model, '__tablename__'):
-                background_tasks.add_task(
-                    log_audit_event,
-                    action="create",
-                    table=model.__tablename__,
-                    item_id=new_item.id,
-                    user_id=current_user.id if current_user else None
+    if enable_list:
+        @router.get("/", response_model=StandardResponse)
+        async def get_items(
+            skip: int = Query(0, ge=0, description="Number of items to skip (OFFSET paging)"),
+            limit: int = Query(100, ge=1, le=1000, description="Number of items to return"),
+            cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+            include_total: bool = Query(True, description="Also count the whole filtered set"),
+            search: Optional[str] = Query(None, description="Search query"),
+            sort_by: Optional[str] = Query(None, description="Field to sort by"),
+            sort_order: str = Query("asc", regex="^(asc|desc)$", description="Sort order"),
+            fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+            db: Session = Depends(get_db),
+            current_user: User = Depends(get_current_user) if permissions_required else None
+        ):
+            """Get all items with optional search and filtering"""
+            try:
+                requested = parse_fields(fields, serializer_for(model).available_fields())
+                items, total, next_cursor = crud_operations.get_multi_with_search(
+                    db, 
+                    skip=skip, 
+                    limit=limit,
+                    search=search if enable_search else None,
+                    sort_by=sort_by,
+                    sort_order=sort_order,
+                    cursor=cursor,
+                    count_strategy=count_strategy if include_total else COUNT_NONE,
+                    fields=requested
                 )
-            
-            return StandardResponse(
-                success=True,
-                data=new_item,
-                message=f"{model.__name__} created successfully"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
-
-    # Standard UPDATE
-    @router.put("/{item_id}", response_model=StandardResponse)
-    async def update_item(
-        item_id: int,
-        item: update_schema,
-        background_tasks: BackgroundTasks,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user) if permissions_required else None
-    ):
-        """Update an existing item"""
-        existing_item = crud_operations.get(db, id=item_id)
-        if not existing_item:
-            raise HTTPException(status_code=404, detail="Item not found")
-        
-        try:
-            # Add updated_by if model has it
-            item_data = item.dict(exclude_unset=True)
-            if hasattr(model, 'updated_by') and current_user:
-                item_data['updated_by'] = current_user.id
-            
-            updated_item = crud_operations.update(db, db_obj=existing_item, obj_in=item_data)
-            
-            # Add background task for audit logging
-            if hasattr(model, '__tablename__'):
-                background_tasks.add_task(
-                    log_audit_event,
-                    action="update",
-                    table=model.__tablename__,
-                    item_id=item_id,
-                    user_id=current_user.id if current_user else None
+                if next_cursor is not None or cursor or not skip:
+                    has_more = next_cursor is not None
+                else:
+                    has_more = total is not None and skip + limit < total
+                
+                return StandardResponse(
+                    success=True,
+                    data=serialize_list(items, fields=requested),
+                    meta={
+                        "total": total,
+                        "skip": skip,
+                        "limit": limit,
+                        "next_cursor": next_cursor,
+                        "has_more": has_more
+                    }
                 )
-            
-            return StandardResponse(
-                success=True,
-                data=updated_item,
-                message=f"{model.__name__} updated successfully"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
 
-    # Standard DELETE
-    @router.delete("/{item_id}", response_model=StandardResponse)
-    async def delete_item(
-        item_id: int,
-        background_tasks: BackgroundTasks,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user) if permissions_required else None
-    ):
-        """Delete an item"""
-        item = crud_operations.get(db, id=item_id)
-        if not item:
-            raise HTTPException(status_code=404, detail="Item not found")
-        
-        try:
-            crud_operations.remove(db, id=item_id)
-            
-            # Add background task for audit logging
-            if hasattr(model, '__tablename__'):
-                background_tasks.add_task(
-                    log_audit_event,
-                    action="delete",
-                    table=model.__tablename__,
-                    item_id=item_id,
-                    user_id=current_user.id if current_user else None
-                )
-            
-            return StandardResponse(
-                success=True,
-                message=f"{model.__name__} deleted successfully"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
-
-    # Bulk operations
+    # Bulk operations - registered before /{item_id} so "bulk" isn't parsed as an id
     @router.post("/bulk", response_model=StandardResponse)
     async def bulk_create(
         items: List[create_schema],
         background_tasks: BackgroundTasks,
+        atomic: bool = Query(False, description="Roll back the whole batch if any item fails"),
         db: Session = Depends(get_db),
         current_user: User = Depends(get_current_user) if permissions_required else None
     ):
-        """Bulk create multiple items"""
-        try:
-            created_items = []
-            for item_data in items:
-                item_dict = item_data.dict()
-                if hasattr(model, 'created_by') and current_user:
-                    item_dict['created_by'] = current_user.id
-                
-                new_item = crud_operations.create(db, obj_in=item_dict)
-                created_items.append(new_item)
-            
-            return StandardResponse(
-                success=True,
-                data=created_items,
-                message=f"Created {len(created_items)} {model.__name__}s successfully"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
+        """Bulk create multiple items in one transaction"""
+        extra = {}
+        if hasattr(model, 'created_by') and current_user:
+            extra['created_by'] = current_user.id
+
+        build = (lambda item: build_item(db, item, current_user)) if build_item else None
+        created_items, errors = crud_operations.bulk_create(
+            db, objs_in=items, atomic=atomic, build=build, **extra
+        )
+
+        return StandardResponse(
+            success=not errors,
+            data=serialize_list(created_items),
+            message=f"Created {len(created_items)} {model.__name__}s",
+            meta={"errors": errors}
+        )
 
     @router.put("/bulk", response_model=StandardResponse)
     async def bulk_update(
         updates: List[Dict[str, Any]],
         background_tasks: BackgroundTasks,
+        atomic: bool = Query(False, description="Roll back the whole batch if any item fails"),
         db: Session = Depends(get_db),
         current_user: User = Depends(get_current_user) if permissions_required else None
     ):
-        """Bulk update multiple items"""
-        try:
-            updated_items = []
-            for update_data in updates:
-                item_id = update_data.pop('id')
-                existing_item = crud_operations.get(db, id=item_id)
-                if existing_item:
-                    if hasattr(model, 'updated_by') and current_user:
-                        update_data['updated_by'] = current_user.id
-                    
-                    updated_item = crud_operations.update(db, db_obj=existing_item, obj_in=update_data)
-                    updated_items.append(updated_item)
-            
-            return StandardResponse(
-                success=True,
-                data=updated_items,
-                message=f"Updated {len(updated_items)} {model.__name__}s successfully"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
+        """Bulk update multiple items in one transaction"""
+        extra = {}
+        if hasattr(model, 'updated_by') and current_user:
+            extra['updated_by'] = current_user.id
+
+        updated_ids, errors = crud_operations.bulk_update(
+            db, updates=updates, atomic=atomic, schema=update_schema, **extra
+        )
+
+        return StandardResponse(
+            success=not errors,
+            data=updated_ids,
+            message=f"Updated {len(updated_ids)} {model.__name__}s",
+            meta={"errors": errors}
+        )
 
     @router.delete("/bulk", response_model=StandardResponse)
     async def bulk_delete(
         item_ids: List[int],
         background_tasks: BackgroundTasks,
+        atomic: bool = Query(False, description="Delete nothing if any id is missing"),
         db: Session = Depends(get_db),
         current_user: User = Depends(get_current_user) if permissions_required else None
     ):
-        """Bulk delete multiple items"""
-        try:
-            deleted_count = 0
-            for item_id in item_ids:
-                if crud_operations.get(db, id=item_id):
-                    crud_operations.remove(db, id=item_id)
-                    deleted_count += 1
+        """Bulk delete multiple items in one transaction"""
+        deleted_ids, errors = crud_operations.bulk_delete(db, ids=item_ids, atomic=atomic)
+
+        return StandardResponse(
+            success=not errors,
+            data=deleted_ids,
+            message=f"Deleted {len(deleted_ids)} {model.__name__}s",
+            meta={"errors": errors}
+        )
+
+    if enable_crud:
+        # Standard CREATE
+        @router.post("/", response_model=StandardResponse)
+        async def create_item(
+            item: create_schema,
+            background_tasks: BackgroundTasks,
+            db: Session = Depends(get_db),
+            current_user: User = Depends(get_current_user) if permissions_required else None
+        ):
+            """Create a new item"""
+            try:
+                # Add created_by if model has it
+                item_data = item.dict()
+                if hasattr(model, 'created_by') and current_user:
+                    item_data['created_by'] = current_user.id
             
-            return StandardResponse(
-                success=True,
-                message=f"Deleted {deleted_count} {model.__name__}s successfully"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=str(e))
+                new_item = crud_operations.create(db, obj_in=item_data)
+            
+                # Add background task for audit logging if needed
+                if hasattr(model, '__tablename__'):
+                    background_tasks.add_task(
+                        log_audit_event,
+                        action="create",
+                        table=model.__tablename__,
+                        item_id=new_item.id,
+                        user_id=current_user.id if current_user else None
+                    )
+            
+                return StandardResponse(
+                    success=True,
+                    data=to_dict(new_item),
+                    message=f"{model.__name__} created successfully"
+                )
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        # Standard GET by ID
+        @router.get("/{item_id:int}", response_model=StandardResponse)
+        async def get_item(
+            item_id: int,
+            db: Session = Depends(get_db),
+            current_user: User = Depends(get_current_user) if permissions_required else None
+        ):
+            """Get a single item by ID"""
+            item = crud_operations.get(db, id=item_id)
+            if not item:
+                raise HTTPException(status_code=404, detail="Item not found")
+        
+            return StandardResponse(success=True, data=to_dict(item))
+
+        # Standard UPDATE
+        @router.put("/{item_id:int}", response_model=StandardResponse)
+        async def update_item(
+            item_id: int,
+            item: update_schema,
+            background_tasks: BackgroundTasks,
+            db: Session = Depends(get_db),
+            current_user: User = Depends(get_current_user) if permissions_required else None
+        ):
+            """Update an existing item"""
+            existing_item = crud_operations.get(db, id=item_id)
+            if not existing_item:
+                raise HTTPException(status_code=404, detail="Item not found")
+        
+            try:
+                # Add updated_by if model has it
+                item_data = item.dict(exclude_unset=True)
+                if hasattr(model, 'updated_by') and current_user:
+                    item_data['updated_by'] = current_user.id
+            
+                updated_item = crud_operations.update(db, db_obj=existing_item, obj_in=item_data)
+            
+                # Add background task for audit logging
+                if hasattr(model, '__tablename__'):
+                    background_tasks.add_task(
+                        log_audit_event,
+                        action="update",
+                        table=model.__tablename__,
+                        item_id=item_id,
+                        user_id=current_user.id if current_user else None
+                    )
+            
+                return StandardResponse(
+                    success=True,
+                    data=to_dict(updated_item),
+                    message=f"{model.__name__} updated successfully"
+                )
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        # Standard DELETE
+        @router.delete("/{item_id:int}", response_model=StandardResponse)
+        async def delete_item(
+            item_id: int,
+            background_tasks: BackgroundTasks,
+            db: Session = Depends(get_db),
+            current_user: User = Depends(get_current_user) if permissions_required else None
+        ):
+            """Delete an item"""
+            item = crud_operations.get(db, id=item_id)
+            if not item:
+                raise HTTPException(status_code=404, detail="Item not found")
+        
+            try:
+                crud_operations.remove(db, id=item_id)
+            
+                # Add background task for audit logging
+                if hasattr(model, '__tablename__'):
+                    background_tasks.add_task(
+                        log_audit_event,
+                        action="delete",
+                        table=model.__tablename__,
+                        item_id=item_id,
+                        user_id=current_user.id if current_user else None
+                    )
+            
+                return StandardResponse(
+                    success=True,
+                    message=f"{model.__name__} deleted successfully"
+                )
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
     # Export functionality
     if enable_export:
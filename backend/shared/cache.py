@@ -0,0 +1,236 @@
+"""
+In-process caches invalidated by table writes
+Every write made through a Session bumps a per-table generation counter, and
+cached entries are only served while the generations they were built at hold
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Safety net for writes made by other processes, which never bump our counters
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_ENTRIES = 1024
+
+_MISSING = object()
+
+
+class TableVersions:
+    """Monotonic write generation per table name"""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, tables: Iterable[str]):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+        """Current generations of the given tables, usable as part of a cache key"""
+        with self._lock:
+            return tuple((table, self._versions.get(table, 0)) for table in sorted(set(tables)))
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a TTL and whenever one of
+    the tables they were computed from is written to
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 versions: Optional[TableVersions] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.versions = versions or table_versions
+        self._entries: "OrderedDict[Hashable, Tuple[float, tuple, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, tables: Iterable[str], default: Any = None) -> Any:
+        generation = self.versions.snapshot(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, entry_generation, value = entry
+            if expires_at < time.monotonic() or entry_generation != generation:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, tables: Iterable[str], value: Any, generation: Optional[tuple] = None):
+        """
+        Store a value; pass the generation snapshot taken *before* computing it
+        so a write that raced the computation still invalidates the entry
+        """
+        if generation is None:
+            generation = self.versions.snapshot(tables)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# ----- response cache backends -----
+# A backend stores opaque entries under string keys and tracks table
+# generations. Keys embed the generations an entry was built at, so a write
+# makes the old keys unreachable and they age out through LRU/TTL.
+
+class MemoryBackend:
+    """Per-process LRU store with TTL; generations come from table_versions"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, tables: Iterable[str]) -> tuple:
+        return table_versions.snapshot(tables)
+
+    def bump(self, tables: Iterable[str]):
+        # The session hooks already bumped table_versions
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Store shared by every uvicorn worker; generations live in Redis too, so
+    a commit in one worker invalidates entries for all of them
+
+    `client` is anything with the redis-py get/set/mget/incr/scan_iter/delete
+    calls (a fake works in tests).
+    """
+
+    def __init__(self, client, prefix: str = "msp:cache:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBackend":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RedisBackend needs the redis package (pip install redis)")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key: str) -> Any:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def generations(self, tables: Iterable[str]) -> tuple:
+        tables = sorted(set(tables))
+        if not tables:
+            return ()
+        values = self.client.mget([self.prefix + "gen:" + table for table in tables])
+        return tuple((table, int(value or 0)) for table, value in zip(tables, values))
+
+    def bump(self, tables: Iterable[str]):
+        for table in set(tables):
+            self.client.incr(self.prefix + "gen:" + table)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+# ----- invalidation hooks -----
+
+_PENDING_KEY = "cache_dirty_tables"
+
+
+def mark_written(session: Session, tables: Iterable[str]):
+    """Record writes the session events can't see (e.g. raw connection statements)"""
+    tables = set(tables)
+    if tables:
+        session.info.setdefault(_PENDING_KEY, set()).update(tables)
+        # Bump now so reads in the same transaction miss, and again on commit
+        # so nothing cached from pre-commit data outlives it
+        table_versions.bump(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            tables.add(table.name)
+    mark_written(session, tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_execute(orm_execute_state):
+    # Core/bulk INSERT, UPDATE and DELETE run through Session.execute skip the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        name = getattr(table, "name", None)
+        if name:
+            mark_written(orm_execute_state.session, [name])
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    tables = session.info.pop(_PENDING_KEY, None)
+    if tables:
+        table_versions.bump(tables)
+        try:
+            response_backend.current.bump(tables)
+        except Exception as e:
+            # The commit already happened; entries still expire by TTL
+            print(f"Cache invalidation failed: {str(e)}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class BackendSlot:
+    """Holds the active response cache backend so it can be swapped at startup"""
+
+    def __init__(self, backend):
+        self.current = backend
+
+    def use(self, backend):
+        self.current = backend
+
+
+# Shared instances
+table_versions = TableVersions()
+response_backend = BackendSlot(MemoryBackend())
@@ -0,0 +1,202 @@
+"""
+Response content negotiation: MessagePack bodies and gzip/brotli encoding
+JSON responses are re-encoded as MessagePack when the client asks for it,
+and large compressible bodies are compressed off the event loop
+"""
+import gzip
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib decoder
+    orjson = None
+    import json
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - MessagePack is only offered when installed
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/", "application/javascript")
+# Long-lived streams must reach the client event by event
+STREAMING_TYPES = ("text/event-stream",)
+
+# Below this, headers and CPU cost more than the bytes saved
+MINIMUM_SIZE = 1024
+# Above this, compress in a worker thread instead of on the event loop
+THREADPOOL_SIZE = 64 * 1024
+# Bodies larger than this are streamed through untouched
+MAX_BUFFER_SIZE = 32 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 5 is the usual on-the-fly sweet spot; 11 is for static assets
+
+
+def _parse_accept(header: str) -> dict:
+    """Media range or coding -> q value"""
+    accepted = {}
+    for part in header.split(","):
+        pieces = [p.strip() for p in part.split(";")]
+        if not pieces[0]:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[pieces[0].lower()] = q
+    return accepted
+
+
+def wants_msgpack(accept: str) -> bool:
+    """True when MessagePack is acceptable and preferred at least as much as JSON"""
+    if msgpack is None or not accept:
+        return False
+    accepted = _parse_accept(accept)
+    q_msgpack = max(accepted.get(t, 0.0) for t in MSGPACK_TYPES)
+    q_json = accepted.get("application/json", accepted.get("application/*", accepted.get("*/*", 0.0)))
+    return q_msgpack > 0 and q_msgpack >= q_json
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br when available and accepted, else gzip, else None"""
+    accepted = _parse_accept(accept_encoding or "")
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def to_msgpack(body: bytes) -> bytes:
+    data = orjson.loads(body) if orjson is not None else json.loads(body)
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _weaken(etag: bytes) -> bytes:
+    # The validator now names a different encoding of the same data
+    return etag if etag.startswith(b"W/") else b"W/" + etag
+
+
+class ContentNegotiationMiddleware:
+    """
+    ASGI middleware serving application/msgpack to clients that prefer it and
+    compressing bodies of MINIMUM_SIZE or more with brotli or gzip
+
+    Add it after ConditionalGetMiddleware so ETags are computed on the JSON
+    body; rewritten responses get weak ETags, which If-None-Match still
+    matches.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE, threadpool_size: int = THREADPOOL_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope.get("headers") or [])
+        msgpack_wanted = wants_msgpack(request_headers.get(b"accept", b"").decode("latin-1"))
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if not msgpack_wanted and encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body = []
+        size = 0
+        passthrough = False
+
+        async def negotiated_send(message):
+            nonlocal start_message, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers") or [])
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if (b"content-encoding" in headers
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or content_type.startswith(STREAMING_TYPES)):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+                size += len(body[-1])
+                if size > MAX_BUFFER_SIZE:
+                    passthrough = True
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": b"".join(body),
+                                "more_body": message.get("more_body", False)})
+                    return
+                if message.get("more_body", False):
+                    return
+
+                headers, payload = await self._negotiate(
+                    start_message, b"".join(body), msgpack_wanted, encoding
+                )
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": payload})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, negotiated_send)
+
+    async def _negotiate(self, start_message, payload: bytes, msgpack_wanted: bool,
+                         encoding: Optional[str]) -> Tuple[list, bytes]:
+        headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"]
+        content_type = dict(headers).get(b"content-type", b"")
+        vary = [b"Accept-Encoding"]
+        changed = False
+
+        if msgpack_wanted and content_type.startswith(b"application/json") and payload:
+            payload = await self._run(to_msgpack, payload)
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-type"]
+            headers.append((b"content-type", b"application/msgpack"))
+            vary.append(b"Accept")
+            changed = True
+        elif content_type.startswith(b"application/json"):
+            vary.append(b"Accept")
+
+        if encoding is not None and len(payload) >= self.minimum_size:
+            payload = await self._run(compress, payload, encoding)
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            changed = True
+
+        if changed:
+            headers = [(k, _weaken(v) if k.lower() == b"etag" else v) for k, v in headers]
+        existing_vary = [v for k, v in headers if k.lower() == b"vary"]
+        headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+        headers.append((b"vary", b", ".join(existing_vary + vary)))
+        headers.append((b"content-length", str(len(payload)).encode("latin-1")))
+        return headers, payload
+
+    async def _run(self, func, payload: bytes, *args):
+        if len(payload) >= self.threadpool_size:
+            return await run_in_threadpool(func, payload, *args)
+        return func(payload, *args)
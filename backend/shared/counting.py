@@ -0,0 +1,141 @@
+"""
+Total-count strategies for list endpoints
+Picks how a list's "total" is produced so it doesn't cost a second full scan
+"""
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.sql.util import find_tables
+
+from shared.cache import TTLCache
+from shared.pagination import keyset_order, keyset_page
+
+COUNT_EXACT = "exact"        # COUNT(*) OVER() fused into the page query
+COUNT_CACHED = "cached"      # per-filter count, dropped when the table is written
+COUNT_ESTIMATE = "estimate"  # planner/rowid estimate for unfiltered lists
+COUNT_NONE = "none"          # no total at all
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATE, COUNT_NONE)
+
+TOTAL_LABEL = "_total_count"
+
+count_cache = TTLCache()
+
+
+def query_tables(query) -> list:
+    """Names of every table a query reads from"""
+    return [table.name for table in find_tables(query.statement, include_joins=True) if hasattr(table, "name")]
+
+
+def _cache_key(query) -> Tuple[str, str]:
+    # The compiled SQL plus bound values is the normalized filter set
+    compiled = query.statement.compile()
+    return str(compiled), repr(sorted(compiled.params.items()))
+
+
+def cached_count(query) -> int:
+    """query.count(), served from cache until one of its tables is written"""
+    query = query.order_by(None)
+    key = _cache_key(query)
+    tables = query_tables(query)
+    total = count_cache.get(key, tables)
+    if total is None:
+        generation = count_cache.versions.snapshot(tables)
+        total = query.count()
+        count_cache.set(key, tables, total, generation)
+    return total
+
+
+def estimated_count(db, model) -> int:
+    """Cheap row estimate for a whole table (no filters)"""
+    table = model.__table__.name
+    if db.bind.dialect.name == "postgresql":
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {"table": table}
+        ).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    # Highest id reads one index leaf; it overshoots only by deleted rows
+    return db.query(func.max(model.id)).scalar() or 0
+
+
+def paged_with_total(
+    query,
+    columns: Sequence[Any],
+    key: Callable[[Any], Tuple],
+    *,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 50,
+    descending: bool = True,
+    strategy: str = COUNT_EXACT,
+    model=None,
+    filtered: bool = True
+) -> Tuple[list, Optional[str], Optional[int]]:
+    """
+    Fetch one page and its total in as few queries as the strategy allows
+
+    Keyset paging is used unless a non-zero skip is given without a cursor.
+    Returns (rows, next_cursor, total).
+
+    exact: the total rides along the page query as COUNT(*) OVER(). On a
+    cursor page the window only sees rows past the cursor, so the total
+    comes from the count cache instead (primed by the first page).
+    estimate: only for unfiltered lists; filtered ones fall back to cached.
+    """
+    if strategy == COUNT_ESTIMATE and (filtered or model is None):
+        strategy = COUNT_CACHED
+
+    use_window = strategy == COUNT_EXACT and not cursor
+    base_query = query
+    strip = _total_stripper(base_query)
+    if use_window:
+        tables = query_tables(base_query)
+        generation = count_cache.versions.snapshot(tables)
+        query = query.add_columns(func.count().over().label(TOTAL_LABEL))
+
+    if cursor or not skip:
+        rows, next_cursor = keyset_page(
+            query,
+            columns,
+            (lambda row: key(strip(row))) if use_window else key,
+            cursor=cursor,
+            limit=limit,
+            descending=descending
+        )
+    else:
+        rows = query.order_by(*keyset_order(columns, descending)).offset(skip).limit(limit).all()
+        next_cursor = None
+
+    total = None
+    if use_window:
+        if rows:
+            total = rows[0][-1]
+        elif not skip:
+            total = 0
+        rows = [strip(row) for row in rows]
+        if total is not None:
+            count_cache.set(_cache_key(base_query.order_by(None)), tables, total, generation)
+        else:
+            # Offset past the end - the window had no row to ride on
+            total = cached_count(base_query)
+    elif strategy in (COUNT_EXACT, COUNT_CACHED):
+        total = cached_count(base_query)
+    elif strategy == COUNT_ESTIMATE:
+        total = estimated_count(base_query.session, model)
+
+    return rows, next_cursor, total
+
+
+def _total_stripper(query) -> Callable[[Any], Any]:
+    """
+    How to get the original row back once the window column is added
+
+    A single-entity query unwraps to the ORM object. Column rows are kept as
+    they are, since positional and named access both still work with one
+    trailing column.
+    """
+    descriptions = query.column_descriptions
+    if len(descriptions) == 1 and isinstance(descriptions[0]["expr"], type):
+        return lambda row: row[0]
+    return lambda row: row
@@ -2,18 +2,34 @@
 Shared CRUD operations and database utilities
 Eliminates repetitive database patterns across all routers
 """
-from typing import Type, TypeVar, Generic, List, Optional, Dict, Any
-from sqlalchemy.orm import Session
+from typing import Type, TypeVar, Generic, List, Optional, Dict, Any, Tuple, Callable
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy.ext.declarative import DeclarativeMeta
-from sqlalchemy import or_, and_, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import or_, and_, func, insert, update, delete, bindparam, String
 from fastapi import HTTPException, status
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from datetime import datetime
 
+from shared.pagination import keyset_page
+from shared.counting import COUNT_EXACT, paged_with_total
+from shared.serializers import serializer_for
+
 ModelType = TypeVar("ModelType", bound=DeclarativeMeta)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Keep IN lists and multi-row statements under database parameter limits
+BULK_CHUNK_SIZE = 500
+
+
+def _db_error(e: Exception) -> str:
+    return str(e.orig if hasattr(e, 'orig') else e)
+
+
+def _validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors())
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """
@@ -37,18 +53,23 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             )
         return obj
 
-    def get_multi(
+    def _filtered_query(
         self,
         db: Session,
-        *,
-        skip: int = 0,
-        limit: int = 100,
         filters: Dict[str, Any] = None,
         search: str = None,
-        search_fields: List[str] = None
-    ) -> List[ModelType]:
-        """Get multiple records with filtering and search"""
+        search_fields: List[str] = None,
+        fields: List[str] = None
+    ):
+        """
+        Base query with equality/IN filters and ILIKE search applied
+
+        With `fields` only those columns (plus the primary key) are loaded;
+        the rest are deferred so wide Text columns never leave the database.
+        """
         query = db.query(self.model)
+        if fields:
+            query = query.options(load_only(*[getattr(self.model, field) for field in fields]))
 
         # Apply filters
         if filters:
@@ -70,8 +91,119 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             if search_clauses:
                 query = query.filter(or_(*search_clauses))
 
+        return query
+
+    def _sort_columns(self, sort_by: Optional[str]) -> List[Any]:
+        """Keyset sort key: the requested column plus id as a unique tie-breaker"""
+        if not sort_by or sort_by == 'id':
+            return [self.model.id]
+        if sort_by not in self.model.__table__.columns:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot sort by {sort_by}"
+            )
+        return [getattr(self.model, sort_by), self.model.id]
+
+    @staticmethod
+    def _with_sort_fields(fields: Optional[List[str]], columns: List[Any]) -> Optional[List[str]]:
+        """Sparse fieldset plus the sort columns the cursor is built from"""
+        if not fields:
+            return fields
+        return list(dict.fromkeys(list(fields) + [column.key for column in columns]))
+
+    def _search_fields(self) -> List[str]:
+        """Default search fields: every string column"""
+        return [
+            column.name for column in self.model.__table__.columns
+            if isinstance(column.type, String)
+        ]
+
+    def get_multi(
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        filters: Dict[str, Any] = None,
+        search: str = None,
+        search_fields: List[str] = None,
+        fields: List[str] = None
+    ) -> List[ModelType]:
+        """Get multiple records with filtering and search (OFFSET paging)"""
+        query = self._filtered_query(db, filters, search, search_fields, fields)
         return query.offset(skip).limit(limit).all()
 
+    def get_page(
+        self,
+        db: Session,
+        *,
+        cursor: str = None,
+        limit: int = 100,
+        filters: Dict[str, Any] = None,
+        search: str = None,
+        search_fields: List[str] = None,
+        sort_by: str = None,
+        sort_order: str = "asc",
+        fields: List[str] = None
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """
+        Get one page with keyset pagination
+
+        Returns the records and the cursor for the next page (None on the last
+        page). Cost does not grow with page depth, and rows inserted while a
+        client is paging never shift it onto duplicates.
+        """
+        columns = self._sort_columns(sort_by)
+        query = self._filtered_query(db, filters, search, search_fields, self._with_sort_fields(fields, columns))
+        return keyset_page(
+            query,
+            columns,
+            lambda obj: tuple(getattr(obj, column.key) for column in columns),
+            cursor=cursor,
+            limit=limit,
+            descending=sort_order == "desc"
+        )
+
+    def get_multi_with_search(
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        search: str = None,
+        search_fields: List[str] = None,
+        filters: Dict[str, Any] = None,
+        sort_by: str = None,
+        sort_order: str = "asc",
+        cursor: str = None,
+        count_strategy: str = COUNT_EXACT,
+        fields: List[str] = None
+    ) -> Tuple[List[ModelType], Optional[int], Optional[str]]:
+        """
+        List records for the router factories: (items, total, next_cursor)
+
+        Uses keyset paging unless a non-zero skip is given without a cursor.
+        count_strategy picks how total is produced (see shared.counting);
+        total is None for "none". `fields` limits the columns loaded.
+        """
+        if search_fields is None:
+            search_fields = self._search_fields()
+        columns = self._sort_columns(sort_by)
+        query = self._filtered_query(db, filters, search, search_fields, self._with_sort_fields(fields, columns))
+        items, next_cursor, total = paged_with_total(
+            query,
+            columns,
+            lambda obj: tuple(getattr(obj, column.key) for column in columns),
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+            descending=sort_order == "desc",
+            strategy=count_strategy,
+            model=self.model,
+            filtered=bool(search) or any(v is not None for v in (filters or {}).values())
+        )
+        return items, total, next_cursor
+
     def create(self, db: Session, *, obj_in: CreateSchemaType, **kwargs) -> ModelType:
         """Create new record"""
         obj_data = obj_in.dict() if hasattr(obj_in, 'dict') else obj_in
@@ -112,6 +244,263 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.commit()
         return obj
 
+    def remove(self, db: Session, *, id: int) -> ModelType:
+        """Hard delete record (alias used by the advanced router)"""
+        return self.delete(db, id=id)
+
+    # ----- bulk operations (one transaction, per-item errors) -----
+
+    def _validate_row(self, data: Dict[str, Any]) -> Optional[str]:
+        """Return an error message if a row can't be inserted as-is"""
+        columns = self.model.__table__.columns
+        unknown = [key for key in data if key not in columns]
+        if unknown:
+            return f"Unknown fields: {', '.join(sorted(unknown))}"
+        for column in columns:
+            if (not column.nullable and not column.primary_key
+                    and column.default is None and column.server_default is None
+                    and data.get(column.name) is None):
+                return f"Missing required field: {column.name}"
+        return None
+
+    def bulk_create(
+        self,
+        db: Session,
+        *,
+        objs_in: List[Any],
+        atomic: bool = False,
+        build: Optional[Callable[[Any], ModelType]] = None,
+        **kwargs
+    ) -> Tuple[List[ModelType], List[Dict[str, Any]]]:
+        """
+        Insert many records with multi-row INSERT ... RETURNING in one transaction
+
+        Rows that fail validation are reported and skipped. If the database
+        rejects the batch, rows are retried one by one under savepoints to
+        find the offenders. With atomic=True any error rolls everything back.
+        With `build`, each item goes through it instead (the router's own
+        single-create logic, adding to the session), one savepoint per item.
+        Returns (created objects, errors).
+        """
+        if build is not None:
+            return self._bulk_build(db, objs_in, build, atomic)
+
+        rows, indexes, errors = [], [], []
+        for index, obj_in in enumerate(objs_in):
+            data = obj_in.dict() if hasattr(obj_in, 'dict') else dict(obj_in)
+            data.update(kwargs)
+            error = self._validate_row(data)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                rows.append(data)
+                indexes.append(index)
+
+        if errors and atomic:
+            return [], errors
+
+        created: List[ModelType] = []
+        try:
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                chunk = rows[start:start + BULK_CHUNK_SIZE]
+                created.extend(db.scalars(insert(self.model).returning(self.model), chunk).all())
+            db.commit()
+            return created, errors
+        except SQLAlchemyError as e:
+            db.rollback()
+            if atomic:
+                return [], errors + [{"index": None, "error": _db_error(e)}]
+
+        # Slow path: isolate the rows the database rejects
+        created = []
+        for index, data in zip(indexes, rows):
+            savepoint = db.begin_nested()
+            try:
+                created.append(db.scalars(insert(self.model).returning(self.model), [data]).one())
+                savepoint.commit()
+            except SQLAlchemyError as e:
+                savepoint.rollback()
+                errors.append({"index": index, "error": _db_error(e)})
+        db.commit()
+        errors.sort(key=lambda err: err["index"])
+        return created, errors
+
+    def _bulk_build(
+        self,
+        db: Session,
+        objs_in: List[Any],
+        build: Callable[[Any], ModelType],
+        atomic: bool
+    ) -> Tuple[List[ModelType], List[Dict[str, Any]]]:
+        created: List[ModelType] = []
+        errors: List[Dict[str, Any]] = []
+        for index, obj_in in enumerate(objs_in):
+            savepoint = db.begin_nested()
+            try:
+                obj = build(obj_in)
+                db.flush()
+                savepoint.commit()
+                created.append(obj)
+            except HTTPException as e:
+                savepoint.rollback()
+                errors.append({"index": index, "error": e.detail})
+            except (SQLAlchemyError, TypeError) as e:
+                savepoint.rollback()
+                errors.append({"index": index, "error": _db_error(e)})
+            if errors and atomic:
+                db.rollback()
+                return [], errors
+        db.commit()
+        return created, errors
+
+    def bulk_update(
+        self,
+        db: Session,
+        *,
+        updates: List[Dict[str, Any]],
+        atomic: bool = False,
+        schema: Optional[Type[BaseModel]] = None,
+        **kwargs
+    ) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """
+        Update many records in one transaction
+
+        Each item carries an "id" plus the fields to change, validated through
+        `schema` (the router's update schema) when given. An id may appear
+        once. Rows with the same set of fields share one UPDATE ... WHERE
+        id = :_id statement executed with per-row bindparams; if the database
+        rejects the batch, rows are retried one by one under savepoints to
+        find the offenders. With atomic=True any error rolls everything back.
+        Returns (updated ids, errors).
+        """
+        table = self.model.__table__
+        errors: List[Dict[str, Any]] = []
+        items = [dict(update_data) for update_data in updates]
+        seen, duplicates = set(), set()
+        for data in items:
+            item_id = data.get('id')
+            if item_id in seen:
+                duplicates.add(item_id)
+            seen.add(item_id)
+        errors.extend({"id": item_id, "error": "Duplicate id"} for item_id in duplicates if item_id is not None)
+
+        by_id: Dict[int, Dict[str, Any]] = {}
+        for data in items:
+            item_id = data.pop('id', None)
+            if item_id is None:
+                errors.append({"id": None, "error": "Missing id"})
+                continue
+            if item_id in duplicates:
+                continue
+            unknown = [key for key in data if key not in table.columns or key == 'id']
+            if unknown:
+                errors.append({"id": item_id, "error": f"Unknown fields: {', '.join(sorted(unknown))}"})
+                continue
+            if schema is not None:
+                try:
+                    validated = schema(**data)
+                except ValidationError as e:
+                    errors.append({"id": item_id, "error": _validation_error(e)})
+                    continue
+                fields = validated.dict(exclude_unset=True)
+                unknown = [key for key in data if key not in fields]
+                if unknown:
+                    errors.append({"id": item_id, "error": f"Cannot update: {', '.join(sorted(unknown))}"})
+                    continue
+                data = fields
+            data.update({k: v for k, v in kwargs.items() if k in table.columns})
+            if 'updated_at' in table.columns:
+                data['updated_at'] = datetime.utcnow()
+            by_id[item_id] = data
+
+        existing = set(self._existing_ids(db, list(by_id)))
+        for item_id in list(by_id):
+            if item_id not in existing:
+                errors.append({"id": item_id, "error": f"{self.model.__name__} not found"})
+                del by_id[item_id]
+
+        if errors and atomic:
+            return [], errors
+
+        # Group rows by the fields they set so each group is one executemany
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for item_id, data in by_id.items():
+            fields = tuple(sorted(data))
+            if not fields:
+                continue
+            row = {f"_{field}": value for field, value in data.items()}
+            row["_id"] = item_id
+            groups.setdefault(fields, []).append(row)
+
+        def statement(fields: Tuple[str, ...]):
+            return (
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values({field: bindparam(f"_{field}") for field in fields})
+            )
+
+        try:
+            for fields, rows in groups.items():
+                db.execute(statement(fields), rows)
+            db.commit()
+            return list(by_id), errors
+        except SQLAlchemyError:
+            db.rollback()
+
+        # Slow path: isolate the rows the database rejects
+        failed = set()
+        for fields, rows in groups.items():
+            for row in rows:
+                savepoint = db.begin_nested()
+                try:
+                    db.execute(statement(fields), [row])
+                    savepoint.commit()
+                except SQLAlchemyError as e:
+                    savepoint.rollback()
+                    failed.add(row["_id"])
+                    errors.append({"id": row["_id"], "error": _db_error(e)})
+        if failed and atomic:
+            db.rollback()
+            return [], errors
+        db.commit()
+        return [item_id for item_id in by_id if item_id not in failed], errors
+
+    def bulk_delete(
+        self,
+        db: Session,
+        *,
+        ids: List[int],
+        atomic: bool = False
+    ) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Delete many records with DELETE ... WHERE id IN in one transaction"""
+        existing = set(self._existing_ids(db, ids))
+        errors = [
+            {"id": item_id, "error": f"{self.model.__name__} not found"}
+            for item_id in ids if item_id not in existing
+        ]
+        if errors and atomic:
+            return [], errors
+
+        deleted = [item_id for item_id in dict.fromkeys(ids) if item_id in existing]
+        table = self.model.__table__
+        try:
+            for start in range(0, len(deleted), BULK_CHUNK_SIZE):
+                chunk = deleted[start:start + BULK_CHUNK_SIZE]
+                db.execute(delete(table).where(table.c.id.in_(chunk)))
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            return [], errors + [{"id": None, "error": _db_error(e)}]
+
+        return deleted, errors
+
+    def _existing_ids(self, db: Session, ids: List[int]) -> List[int]:
+        found: List[int] = []
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            found.extend(row[0] for row in db.query(self.model.id).filter(self.model.id.in_(chunk)))
+        return found
+
     def soft_delete(self, db: Session, *, id: int) -> ModelType:
         """Soft delete (mark as inactive)"""
         obj = self.get_or_404(db, id)
@@ -122,37 +511,33 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             db.refresh(obj)
         return obj
 
-    def count(self, db: Session, filters: Dict[str, Any] = None) -> int:
-        """Count records with optional filters"""
-        query = db.query(func.count(self.model.id))
-        
-        if filters:
-            for field, value in filters.items():
-                if value is not None and hasattr(self.model, field):
-                    attr = getattr(self.model, field)
-                    query = query.filter(attr == value)
-                    
-        return query.scalar()
+    def count(
+        self,
+        db: Session,
+        filters: Dict[str, Any] = None,
+        *,
+        search: str = None,
+        search_fields: List[str] = None
+    ) -> int:
+        """Count records with optional filters and search"""
+        query = self._filtered_query(db, filters, search, search_fields)
+        return query.with_entities(func.count(self.model.id)).scalar()
 
 
 def to_dict(obj: Any, exclude: List[str] = None) -> Dict[str, Any]:
     """Convert SQLAlchemy model to dictionary"""
-    exclude = exclude or []
-    result = {}
-    
-    for column in obj.__table__.columns:
-        if column.name not in exclude:
-            value = getattr(obj, column.name)
-            if isinstance(value, datetime):
-                value = value.isoformat()
-            result[column.name] = value
-            
-    return result
+    return serializer_for(type(obj), exclude=exclude or ()).from_obj(obj)
 
 
-def serialize_list(items: List[Any], exclude: List[str] = None) -> List[Dict[str, Any]]:
-    """Serialize list of SQLAlchemy models"""
-    return [to_dict(item, exclude) for item in items]
+def serialize_list(
+    items: List[Any],
+    exclude: List[str] = None,
+    fields: List[str] = None
+) -> List[Dict[str, Any]]:
+    """Serialize list of SQLAlchemy models, optionally only `fields`"""
+    if not items:
+        return []
+    return serializer_for(type(items[0]), fields=fields, exclude=exclude or ()).many_objs(items)
 
 
 class APIResponse:
@@ -175,12 +560,18 @@ class APIResponse:
         return response
 
     @staticmethod
-    def list_response(items: List[Any], total: int = None, page: int = 1) -> Dict[str, Any]:
+    def list_response(
+        items: List[Any],
+        total: int = None,
+        page: int = 1,
+        next_cursor: str = None
+    ) -> Dict[str, Any]:
         """Standard list response"""
         response = {
             "success": True,
             "items": items,
-            "count": len(items)
+            "count": len(items),
+            "next_cursor": next_cursor
         }
         if total is not None:
             response["total"] = total
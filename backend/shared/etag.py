@@ -0,0 +1,338 @@
+"""
+HTTP conditional requests: ETag/Last-Modified validators and 304 handling
+Hot GET endpoints look up a cheap version token first and answer 304 before
+running the full query and serialization when the client's copy is current
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, Optional, Sequence
+
+from fastapi import Request, Response
+from sqlalchemy import event, func, update, select
+from sqlalchemy.orm import Session, aliased, attributes
+
+from models import (
+    Board, BoardCard, BoardColumn, Ticket, TicketComment, TimeEntry, TicketTag,
+    TicketDependency, CustomFieldValue, Attachment, ArticleTicketLink,
+    CustomerSatisfaction, KnowledgeArticle
+)
+from shared.cache import mark_written, table_versions
+from shared.serializers import FastJSONResponse
+
+# Unique per process, so counter-based tokens from different workers never collide
+BOOT_ID = uuid.uuid4().hex
+# Counter-based tokens can't see writes made by other processes; bound the staleness
+COUNTER_TOKEN_WINDOW_SECONDS = 30
+CACHE_CONTROL = "private, no-cache"
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Naive datetimes in this codebase are UTC; HTTP dates have whole seconds"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _etag(parts: Iterable[Any]) -> str:
+    return '"' + hashlib.sha1(repr(tuple(parts)).encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/"x" matches "x" """
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class ResourceVersion:
+    """
+    Validators for one representation of a resource
+
+    `parts` must change whenever the representation does: a row's updated_at
+    or version counter, plus anything per-user that the payload includes.
+    """
+
+    def __init__(self, *parts: Any, last_modified: Optional[datetime] = None):
+        self.parts = parts
+        self.etag = _etag(parts)
+        self.last_modified = last_modified
+
+    @property
+    def headers(self) -> dict:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(_as_utc(self.last_modified), usegmt=True)
+        return headers
+
+    def not_modified(self, request: Request) -> Optional[Response]:
+        """A 304 response if the client's cached copy is current, else None"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            fresh = etag_matches(if_none_match, self.etag)
+        else:
+            fresh = self._not_modified_since(request.headers.get("if-modified-since"))
+        if fresh:
+            return Response(status_code=304, headers=self.headers)
+        return None
+
+    def _not_modified_since(self, header: Optional[str]) -> bool:
+        if not header or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(header)
+        except (TypeError, ValueError):
+            return False
+        if since is None:
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return _as_utc(self.last_modified) <= since
+
+    def respond(self, content: Any, status_code: int = 200) -> FastJSONResponse:
+        """Full JSON response carrying the validators"""
+        return FastJSONResponse(content, status_code=status_code, headers=self.headers)
+
+
+def table_version(*tables: str, scope: Any = None) -> ResourceVersion:
+    """
+    Version for aggregate views (dashboards) built from whole tables
+
+    Uses this process's write counters, so it is only trusted for
+    COUNTER_TOKEN_WINDOW_SECONDS before clients must refetch.
+    """
+    window = int(time.time() // COUNTER_TOKEN_WINDOW_SECONDS)
+    return ResourceVersion(BOOT_ID, window, scope, table_versions.snapshot(tables))
+
+
+# ----- per-resource version tokens -----
+
+def ticket_version(
+    db: Session,
+    ticket_id: int,
+    include: Sequence[str] = (),
+    scope: Any = None
+) -> Optional[ResourceVersion]:
+    """
+    Ticket detail (ticket plus the included collections); None if it doesn't exist
+
+    Child rows bump Ticket.updated_at (see _touch_parents). Rows shown from
+    elsewhere - dependency tickets, linked articles - add their own newest
+    updated_at, all in the same single query.
+    """
+    columns = [Ticket.id, Ticket.updated_at]
+    if "dependencies" in include:
+        other = aliased(Ticket)
+        columns.append(
+            select(func.max(other.updated_at))
+            .join(TicketDependency, TicketDependency.depends_on_ticket_id == other.id)
+            .where(TicketDependency.ticket_id == ticket_id)
+            .scalar_subquery()
+        )
+    if "articles" in include:
+        columns.append(
+            select(func.max(KnowledgeArticle.updated_at))
+            .join(ArticleTicketLink, ArticleTicketLink.article_id == KnowledgeArticle.id)
+            .where(ArticleTicketLink.ticket_id == ticket_id)
+            .scalar_subquery()
+        )
+    row = db.execute(select(*columns).where(Ticket.id == ticket_id)).first()
+    if row is None:
+        return None
+    parts = ["ticket", ticket_id, tuple(include), scope, *row[1:]]
+    if "custom_fields" in include:
+        # Field names/types come from custom_fields, which has no updated_at
+        parts.append(table_versions.snapshot(["custom_fields"]))
+    return ResourceVersion(*parts, last_modified=row.updated_at)
+
+
+def board_version(db: Session, board_id: int) -> Optional[ResourceVersion]:
+    """Board detail (columns, cards and their tickets); None if it doesn't exist"""
+    row = db.execute(
+        select(Board.id, Board.version).where(Board.id == board_id)
+    ).first()
+    if row is None:
+        return None
+    return ResourceVersion("board", board_id, row.version)
+
+
+# ----- keep parent versions moving when children change -----
+# Ticket.updated_at and Board.version stand for the whole detail payload, so
+# writes to rows shown inside it bump them. Core statements that bypass the
+# unit of work must bump them themselves (see bump_board_versions).
+
+# Rows shown inside the ticket detail payload
+TICKET_CHILDREN = (
+    TicketComment, TimeEntry, TicketTag, TicketDependency, CustomFieldValue,
+    Attachment, ArticleTicketLink, CustomerSatisfaction
+)
+
+
+def _values(obj, key: str) -> set:
+    """Current and pre-flush values of an attribute"""
+    history = attributes.get_history(obj, key)
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    values.add(getattr(obj, key, None))
+    values.discard(None)
+    return values
+
+
+def bump_board_versions(connection, *, board_ids=(), column_ids=(), ticket_ids=()):
+    """Advance Board.version for boards owning the given columns or showing the tickets"""
+    boards = Board.__table__
+    conditions = []
+    if board_ids:
+        conditions.append(boards.c.id.in_(list(board_ids)))
+    if column_ids:
+        conditions.append(boards.c.id.in_(
+            select(BoardColumn.board_id).where(BoardColumn.id.in_(list(column_ids)))
+        ))
+    if ticket_ids:
+        conditions.append(boards.c.id.in_(
+            select(BoardColumn.board_id)
+            .join(BoardCard, BoardCard.board_column_id == BoardColumn.id)
+            .where(BoardCard.ticket_id.in_(list(ticket_ids)))
+        ))
+    for condition in conditions:
+        connection.execute(
+            update(boards).where(condition).values(version=boards.c.version + 1)
+        )
+
+
+@event.listens_for(Session, "after_flush")
+def _touch_parents(session, flush_context):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if not changed:
+        return
+
+    ticket_ids, board_ids, column_ids, board_ticket_ids = set(), set(), set(), set()
+    for obj in changed:
+        if isinstance(obj, TICKET_CHILDREN):
+            ticket_ids |= _values(obj, "ticket_id")
+        elif isinstance(obj, BoardCard):
+            column_ids |= _values(obj, "board_column_id")
+        elif isinstance(obj, BoardColumn):
+            board_ids |= _values(obj, "board_id")
+        elif isinstance(obj, Board) and obj not in session.new and obj not in session.deleted:
+            board_ids.add(obj.id)
+        elif isinstance(obj, Ticket) and obj not in session.new:
+            board_ticket_ids.add(obj.id)
+
+    connection = session.connection()
+    if ticket_ids:
+        mark_written(session, [Ticket.__tablename__])
+        tickets = Ticket.__table__
+        connection.execute(
+            update(tickets).where(tickets.c.id.in_(list(ticket_ids))).values(updated_at=datetime.utcnow())
+        )
+    if board_ids or column_ids or board_ticket_ids:
+        mark_written(session, [Board.__tablename__])
+        bump_board_versions(
+            connection, board_ids=board_ids, column_ids=column_ids, ticket_ids=board_ticket_ids
+        )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _touch_boards_on_bulk_ticket_writes(orm_execute_state):
+    # Statement-level ticket writes (CRUDBase bulk ops) skip after_flush and
+    # don't say which rows they hit, so every board showing a ticket moves on
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if getattr(table, "name", None) != Ticket.__tablename__:
+        return
+    session = orm_execute_state.session
+    mark_written(session, [Board.__tablename__])
+    boards = Board.__table__
+    session.connection().execute(
+        update(boards)
+        .where(boards.c.id.in_(
+            select(BoardColumn.board_id).join(BoardCard, BoardCard.board_column_id == BoardColumn.id)
+        ))
+        .values(version=boards.c.version + 1)
+    )
+
+
+class ConditionalGetMiddleware:
+    """
+    ASGI middleware adding a strong ETag to JSON GET responses that don't set
+    one, and turning a matching If-None-Match into a bodiless 304
+
+    This saves bandwidth on every endpoint. Endpoints with a cheap version
+    token (ResourceVersion) also skip the query and serialization.
+    """
+
+    def __init__(self, app, max_body_size: int = 4 * 1024 * 1024):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope.get("headers") or [])
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        start_message = None
+        body = []
+        size = 0
+        passthrough = False
+
+        async def buffered_send(message):
+            nonlocal start_message, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers") or [])
+                content_type = headers.get(b"content-type", b"")
+                if (message["status"] != 200 or b"etag" in headers
+                        or not content_type.startswith(b"application/json")):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+                size += len(body[-1])
+                if size > self.max_body_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": b"".join(body),
+                                "more_body": message.get("more_body", False)})
+                    return
+                if message.get("more_body", False):
+                    return
+
+                payload = b"".join(body)
+                etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+                headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() != b"content-length"
+                ]
+                headers.append((b"etag", etag.encode("latin-1")))
+                if if_none_match and etag_matches(if_none_match, etag):
+                    headers = [(k, v) for k, v in headers if k.lower() != b"content-type"]
+                    await send({**start_message, "status": 304, "headers": headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                headers.append((b"content-length", str(len(payload)).encode("latin-1")))
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": payload})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, buffered_send)
@@ -0,0 +1,111 @@
+"""
+Keyset (cursor) pagination helpers
+Pages are addressed by the sort key of the last row seen instead of an
+OFFSET, so fetching a deep page costs the same as fetching the first one
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, false, or_
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode sort key values into an opaque URL-safe cursor"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor produced by encode_cursor, or raise 400"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("cursor has the wrong shape")
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def _after(column: Any, value: Any, descending: bool):
+    """Rows strictly past `value` in sort order, NULL sorting above every value"""
+    if value is None:
+        return column.isnot(None) if descending else false()
+    if descending:
+        return column < value
+    return or_(column > value, column.is_(None))
+
+
+def _same(column: Any, value: Any):
+    return column.is_(None) if value is None else column == value
+
+
+def keyset_condition(columns: Sequence[Any], values: Sequence[Any], descending: bool = True):
+    """
+    Row-value comparison (c1, c2, ...) < (v1, v2, ...) written as OR/AND so
+    every database can use a composite index on the sort columns
+
+    NULLs compare above every value, matching the placement from keyset_order.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [_same(columns[j], values[j]) for j in range(i)]
+        clauses.append(and_(*equal_prefix, _after(column, values[i], descending)))
+    return or_(*clauses)
+
+
+def keyset_order(columns: Sequence[Any], descending: bool = True) -> List[Any]:
+    """ORDER BY for keyset_condition: NULLs last ascending, first descending"""
+    if descending:
+        return [c.desc().nulls_first() for c in columns]
+    return [c.asc().nulls_last() for c in columns]
+
+
+def keyset_page(
+    query,
+    columns: Sequence[Any],
+    key: Callable[[Any], Tuple],
+    *,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    descending: bool = True
+) -> Tuple[list, Optional[str]]:
+    """
+    Fetch one page ordered by `columns` (the last one must be unique, e.g. id)
+
+    `key` extracts the sort values from a result row. Returns the rows and
+    the cursor for the next page, or None on the last page.
+    """
+    if cursor:
+        query = query.filter(keyset_condition(columns, decode_cursor(cursor, len(columns)), descending))
+
+    rows = query.order_by(*keyset_order(columns, descending)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
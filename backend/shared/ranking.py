@@ -0,0 +1,61 @@
+"""
+Lexicographic rank keys for user-ordered rows (board columns and cards)
+A rank is a base-62 string; a row moves by taking a key strictly between its
+new neighbours, so no other row is rewritten
+"""
+from typing import List, Optional
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"  # ASCII order
+BASE = len(DIGITS)
+_VALUE = {digit: i for i, digit in enumerate(DIGITS)}
+
+
+def _midpoint(lo: str, hi: Optional[str]) -> str:
+    # lo < hi, neither ends in "0"; hi None means "past the end"
+    if hi is not None:
+        n = 0
+        while n < len(hi) and (lo[n] if n < len(lo) else "0") == hi[n]:
+            n += 1
+        if n:
+            return hi[:n] + _midpoint(lo[n:], hi[n:])
+
+    low = _VALUE[lo[0]] if lo else 0
+    high = _VALUE[hi[0]] if hi is not None else BASE
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    # Adjacent digits: hi's first digit alone still sorts below hi if hi is longer
+    if hi is not None and len(hi) > 1:
+        return hi[:1]
+    return DIGITS[low] + _midpoint(lo[1:], None)
+
+
+def rank_between(lo: Optional[str], hi: Optional[str]) -> str:
+    """
+    Shortest-ish key strictly between lo and hi
+
+    None stands for the start (lo) or the end (hi) of the list. Raises
+    ValueError when lo >= hi, i.e. the neighbours need rebalancing first.
+    """
+    for key in (lo, hi):
+        if key is not None and (not key or key.endswith("0") or any(c not in _VALUE for c in key)):
+            raise ValueError(f"Invalid rank: {key!r}")
+    if lo is not None and hi is not None and lo >= hi:
+        raise ValueError(f"No rank between {lo!r} and {hi!r}")
+    return _midpoint(lo or "", hi)
+
+
+def evenly_spaced_ranks(count: int) -> List[str]:
+    """count ascending keys spread across the key space, leaving room on every side"""
+    width = 1
+    while BASE ** width <= count * 2:
+        width += 1
+    step = BASE ** width // (count + 1)
+    ranks = []
+    for i in range(1, count + 1):
+        value = i * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append("".join(reversed(digits)).rstrip("0"))
+    return ranks
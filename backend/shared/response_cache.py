@@ -0,0 +1,89 @@
+"""
+Response cache for read-heavy GET endpoints
+Endpoints declare the tables they read; entries are keyed by those tables'
+write generations, so any commit touching them makes the entry unreachable
+"""
+import hashlib
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from fastapi import BackgroundTasks, Request, Response
+from sqlalchemy.orm import Session
+
+from shared.cache import DEFAULT_TTL_SECONDS, response_backend
+from shared.etag import etag_matches
+from shared.serializers import FastJSONResponse
+
+# Validators worth replaying on a hit; everything else is rebuilt
+_KEPT_HEADERS = ("etag", "last-modified", "cache-control", "vary")
+_SKIPPED_PARAMS = (Session, Request, BackgroundTasks)
+
+
+def _vary_value(value: Any) -> Any:
+    # ORM rows (e.g. current_user) vary by id, not by their whole state
+    if hasattr(value, "__table__"):
+        return (type(value).__name__, getattr(value, "id", None))
+    return value
+
+
+def cache_key(name: str, params: dict, generations: tuple) -> str:
+    return hashlib.sha1(repr((name, sorted(params.items()), generations)).encode("utf-8")).hexdigest()
+
+
+def cached_response(*tables: str, ttl: float = DEFAULT_TTL_SECONDS, per_user: bool = False):
+    """
+    Cache a GET endpoint's 200 JSON responses until one of `tables` is written
+
+    The key is the endpoint plus its query/path parameters; the caller only
+    counts when `per_user` is set, for payloads that differ between users.
+    Hits replay the stored body and validators without calling the endpoint.
+    """
+    def decorator(func: Callable) -> Callable:
+        name = f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Optional[Request] = next(
+                (value for value in kwargs.values() if isinstance(value, Request)), None
+            )
+            params = {
+                key: _vary_value(value) for key, value in kwargs.items()
+                if not isinstance(value, _SKIPPED_PARAMS) and (per_user or key != "current_user")
+            }
+            backend = response_backend.current
+            try:
+                # Taken before running the endpoint, so a write that races it
+                # lands on a newer key instead of being masked by this entry
+                key = cache_key(name, params, backend.generations(tables))
+                entry = backend.get(key)
+            except Exception as e:
+                print(f"Response cache read failed: {str(e)}")
+                return await func(*args, **kwargs)
+
+            if entry is not None:
+                headers, body = entry
+                if_none_match = request.headers.get("if-none-match") if request else None
+                if if_none_match and "etag" in headers and etag_matches(if_none_match, headers["etag"]):
+                    return Response(status_code=304, headers=headers)
+                return Response(body, media_type="application/json", headers={**headers, "X-Cache": "HIT"})
+
+            result = await func(*args, **kwargs)
+            if not isinstance(result, Response):
+                result = FastJSONResponse(result)
+            elif result.status_code != 200 or result.media_type != "application/json":
+                return result
+
+            headers = {k: v for k, v in result.headers.items() if k.lower() in _KEPT_HEADERS}
+            try:
+                backend.set(key, [headers, result.body.decode("utf-8")], ttl)
+            except Exception as e:
+                print(f"Response cache write failed: {str(e)}")
+            result.headers["X-Cache"] = "MISS"
+            return result
+
+        return wrapper
+    return decorator
+
+
+def clear_response_cache():
+    response_backend.current.clear()
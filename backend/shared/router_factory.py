@@ -12,6 +12,8 @@ from auth import get_current_user
 from models import User
 from .crud import CRUDBase, to_dict, serialize_list, APIResponse
 from .utils import CommonParams, handle_exceptions, admin_required
+from .counting import COUNT_EXACT, COUNT_NONE
+from .serializers import FastJSONResponse, parse_fields, serializer_for
 
 
 def create_crud_router(
@@ -19,22 +21,27 @@ def create_crud_router(
     create_schema: Type[BaseModel],
     update_schema: Type[BaseModel],
     *,
+    crud_operations: CRUDBase = None,
     prefix: str = "",
+    route_prefix: str = None,
     tags: List[str] = None,
     search_fields: List[str] = None,
     filter_fields: List[str] = None,
     admin_only_create: bool = False,
     admin_only_update: bool = False,
     admin_only_delete: bool = False,
-    custom_routes: List[Callable] = None
+    custom_routes: List[Callable] = None,
+    count_strategy: str = COUNT_EXACT
 ) -> APIRouter:
     """
     Create a standardized CRUD router for any model
     Eliminates 90% of duplicate router code
+
+    count_strategy picks how list totals are produced (shared.counting)
     """
     
-    router = APIRouter(prefix=prefix, tags=tags or [])
-    crud = CRUDBase[model, create_schema, update_schema](model)
+    router = APIRouter(prefix=route_prefix if route_prefix is not None else prefix, tags=tags or [])
+    crud = crud_operations or CRUDBase[model, create_schema, update_schema](model)
     resource_name = model.__name__
     
     @router.get("/")
@@ -51,22 +58,27 @@ def create_crud_router(
         if filter_fields and hasattr(common, 'filters'):
             filters = common.filters
         
-        items = crud.get_multi(
+        fields = parse_fields(common.fields, serializer_for(model).available_fields())
+        items, total, next_cursor = crud.get_multi_with_search(
             db,
             skip=common.skip,
             limit=common.limit,
             filters=filters,
             search=common.search,
-            search_fields=search_fields or []
+            search_fields=search_fields or [],
+            sort_by=common.sort_by,
+            sort_order=common.sort_order,
+            cursor=common.cursor,
+            count_strategy=count_strategy if common.include_total else COUNT_NONE,
+            fields=fields
         )
         
-        total = crud.count(db, filters) if filters else crud.count(db)
-        
-        return APIResponse.list_response(
-            serialize_list(items),
+        return FastJSONResponse(APIResponse.list_response(
+            serialize_list(items, fields=fields),
             total=total,
-            page=(common.skip // common.limit) + 1
-        )
+            page=(common.skip // common.limit) + 1,
+            next_cursor=next_cursor
+        ))
 
     @router.get("/{item_id}")
     @handle_exceptions
@@ -0,0 +1,230 @@
+"""
+Compiled per-model serializers and a fast JSON response class
+Each serializer is generated once per model and field set, then turns plain
+row tuples (or ORM objects) into dicts without per-field introspection
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Date, DateTime, Time, inspect as sa_inspect
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when available"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS, default=jsonable_encoder)
+        return json.dumps(
+            content, ensure_ascii=False, separators=(",", ":"), default=jsonable_encoder
+        ).encode("utf-8")
+
+
+_TEMPORAL_TYPES = (DateTime, Date, Time)
+
+
+class ModelSerializer:
+    """
+    Serializer for one model and field subset
+
+    `columns` is the projection to select so rows come back as plain tuples
+    (db.query(*serializer.columns)); `from_row` maps such a row to a dict by
+    position and `from_obj` does the same for an already-loaded ORM object.
+
+    aliases: output name -> model attribute, for renamed fields
+    extra: (output name, column expression) pairs selected alongside, e.g.
+           the name of a joined parent
+    computed: output name -> callable(row) for derived values
+    depends: computed name -> model fields it reads from the row
+    hidden: model fields selected (e.g. sort keys) but not serialized
+    """
+
+    def __init__(
+        self,
+        model,
+        fields: Optional[Sequence[str]] = None,
+        *,
+        exclude: Sequence[str] = (),
+        aliases: Optional[Dict[str, str]] = None,
+        extra: Sequence[Tuple[str, Any]] = (),
+        computed: Optional[Dict[str, Callable[[Any], Any]]] = None,
+        depends: Optional[Dict[str, Sequence[str]]] = None,
+        hidden: Sequence[str] = ()
+    ):
+        self.model = model
+        mapper = sa_inspect(model)
+        # Column name -> mapped attribute key (they differ only when renamed)
+        by_name = {prop.columns[0].name: prop.key for prop in mapper.column_attrs}
+
+        aliases = dict(aliases or {})
+        if fields is None:
+            fields = [column.name for column in model.__table__.columns]
+        fields = [name for name in fields if name not in exclude]
+
+        self._aliases = aliases
+        self._extra = list(extra)
+        self._depends = dict(depends or {})
+        self._subsets: Dict[Tuple, "ModelSerializer"] = {}
+
+        hidden = [
+            name for name in dict.fromkeys(
+                list(hidden) + [dep for name in (computed or {}) for dep in self._depends.get(name, ())]
+            )
+            if name not in fields
+        ]
+        unknown = [name for name in list(fields) + hidden if aliases.get(name, name) not in by_name]
+        if unknown:
+            raise ValueError(f"{model.__name__} has no fields {', '.join(unknown)}")
+
+        outputs: List[Tuple[str, Any]] = []
+        for name in fields:
+            key = by_name[aliases.get(name, name)]
+            outputs.append((name, getattr(model, key)))
+        outputs.extend(extra)
+
+        self.fields: Tuple[str, ...] = tuple(name for name, _ in outputs)
+        selected = outputs + [(name, getattr(model, by_name[aliases.get(name, name)])) for name in hidden]
+        self.columns: List[Any] = [
+            expression.label(name) if name != getattr(expression, "key", name) else expression
+            for name, expression in selected
+        ]
+        self.attribute_keys: Tuple[str, ...] = tuple(
+            by_name[aliases.get(name, name)] for name in fields
+        )
+        temporal = {
+            name for name, expression in outputs
+            if isinstance(getattr(expression, "type", None), _TEMPORAL_TYPES)
+        }
+        self.computed = dict(computed or {})
+        self.from_row = self._compile_row(temporal)
+        self.from_obj = self._compile_obj(temporal, len(fields))
+
+    def _compile_row(self, temporal) -> Callable[[Any], Dict[str, Any]]:
+        lines = ["def serialize(row):"]
+        items = []
+        for index, name in enumerate(self.fields):
+            if name in temporal:
+                lines.append(f"    v{index} = row[{index}]")
+                items.append(f"{name!r}: v{index}.isoformat() if v{index} is not None else None")
+            else:
+                items.append(f"{name!r}: row[{index}]")
+        for index, name in enumerate(self.computed):
+            items.append(f"{name!r}: _computed{index}(row)")
+        lines.append("    return {" + ", ".join(items) + "}")
+        return self._build(lines)
+
+    def _compile_obj(self, temporal, count: int) -> Callable[[Any], Dict[str, Any]]:
+        lines = ["def serialize(obj):"]
+        items = []
+        for index, name in enumerate(self.fields[:count]):
+            attr = self.attribute_keys[index]
+            if name in temporal:
+                lines.append(f"    v{index} = obj.{attr}")
+                items.append(f"{name!r}: v{index}.isoformat() if v{index} is not None else None")
+            else:
+                items.append(f"{name!r}: obj.{attr}")
+        for index, name in enumerate(self.computed):
+            items.append(f"{name!r}: _computed{index}(obj)")
+        lines.append("    return {" + ", ".join(items) + "}")
+        return self._build(lines)
+
+    def _build(self, lines: List[str]) -> Callable[[Any], Dict[str, Any]]:
+        namespace = {f"_computed{i}": fn for i, fn in enumerate(self.computed.values())}
+        exec("\n".join(lines), namespace)
+        return namespace["serialize"]
+
+    def available_fields(self) -> List[str]:
+        """Every name a fieldset may ask for: these outputs plus any model column"""
+        names = list(self.fields) + list(self.computed)
+        names += [column.name for column in self.model.__table__.columns if column.name not in names]
+        return names
+
+    def subset(self, fields: Sequence[str], hidden: Sequence[str] = ()) -> "ModelSerializer":
+        """
+        Cached serializer for a sparse fieldset of this one
+
+        Keeps the aliases, joined extras and computed values that were asked
+        for; `hidden` columns are selected but left out of the output.
+        """
+        key = (tuple(fields), tuple(hidden))
+        serializer = self._subsets.get(key)
+        if serializer is None:
+            extra = [(name, expression) for name, expression in self._extra if name in fields]
+            computed = {name: fn for name, fn in self.computed.items() if name in fields}
+            special = {name for name, _ in extra} | set(computed)
+            serializer = ModelSerializer(
+                self.model,
+                [name for name in fields if name not in special],
+                aliases=self._aliases,
+                extra=extra,
+                computed=computed,
+                depends=self._depends,
+                hidden=hidden
+            )
+            self._subsets[key] = serializer
+        return serializer
+
+    def many(self, rows) -> List[Dict[str, Any]]:
+        """Serialize plain row tuples selected with `columns`"""
+        serialize = self.from_row
+        return [serialize(row) for row in rows]
+
+    def many_objs(self, objs) -> List[Dict[str, Any]]:
+        """Serialize loaded ORM objects"""
+        serialize = self.from_obj
+        return [serialize(obj) for obj in objs]
+
+
+_serializers: Dict[Tuple, ModelSerializer] = {}
+
+
+def serializer_for(
+    model,
+    fields: Optional[Sequence[str]] = None,
+    exclude: Sequence[str] = ()
+) -> ModelSerializer:
+    """Cached serializer for a model and field subset"""
+    key = (model, tuple(fields) if fields is not None else None, tuple(exclude or ()))
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = ModelSerializer(model, fields, exclude=exclude)
+        _serializers[key] = serializer
+    return serializer
+
+
+def parse_fields(
+    fields: Optional[str],
+    available: Sequence[str],
+    required: Sequence[str] = ("id",)
+) -> Optional[List[str]]:
+    """
+    Turn a `fields=a,b,c` query value into a validated, de-duplicated list
+
+    Returns None when no fieldset was requested; `required` names are always
+    included. Unknown names are a 400.
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return list(dict.fromkeys([name for name in required if name in available] + names))
+
+
+def warm_serializers(base) -> int:
+    """Compile the full-row serializer of every mapped model up front"""
+    for mapper in base.registry.mappers:
+        serializer_for(mapper.class_)
+    return len(_serializers)
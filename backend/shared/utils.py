@@ -3,12 +3,14 @@ Shared utilities and decorators for FastAPI routes
 Eliminates duplicate patterns across router modules
 """
 from functools import wraps
-from typing import Callable, Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Sequence
 from fastapi import Depends, HTTPException, status, Query
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from database import get_db
 from auth import get_current_user
 from models import User
+from shared.pagination import decode_cursor, keyset_condition, keyset_order
 
 
 def admin_required(func: Callable) -> Callable:
@@ -62,13 +64,19 @@ class CommonParams:
         limit: int = Query(50, ge=1, le=100, description="Number of items to return"),
         search: Optional[str] = Query(None, description="Search term"),
         sort_by: Optional[str] = Query(None, description="Field to sort by"),
-        sort_order: Optional[str] = Query("asc", regex="^(asc|desc)$", description="Sort order")
+        sort_order: Optional[str] = Query("asc", regex="^(asc|desc)$", description="Sort order"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+        include_total: bool = Query(True, description="Also count the whole filtered set"),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return")
     ):
         self.skip = skip
         self.limit = limit
         self.search = search
         self.sort_by = sort_by
         self.sort_order = sort_order
+        self.cursor = cursor
+        self.include_total = include_total
+        self.fields = fields
 
 
 def create_filter_params(**filter_fields) -> Callable:
@@ -96,6 +104,14 @@ def create_filter_params(**filter_fields) -> Callable:
     return filter_params
 
 
+class StandardResponse(BaseModel):
+    """Response envelope used by the advanced router factory"""
+    success: bool = True
+    message: Optional[str] = None
+    data: Any = None
+    meta: Optional[Dict[str, Any]] = None
+
+
 def standardize_response(data: Any, message: str = "Success") -> Dict[str, Any]:
     """Standardize API response format"""
     if isinstance(data, list):
@@ -160,9 +176,28 @@ def validate_date_range(start_date: Optional[str], end_date: Optional[str]) -> D
 
 
 # Common pagination helper
-def paginate_query(query, skip: int = 0, limit: int = 50):
-    """Apply pagination to SQLAlchemy query"""
-    return query.offset(skip).limit(limit)
+def paginate_query(
+    query,
+    skip: int = 0,
+    limit: int = 50,
+    *,
+    cursor: Optional[str] = None,
+    columns: Optional[Sequence[Any]] = None,
+    descending: bool = True
+):
+    """
+    Apply pagination to SQLAlchemy query
+
+    With sort `columns` (ending in a unique one such as id) the page is
+    selected by keyset from `cursor` instead of OFFSET; build the next
+    cursor from the last row with shared.pagination.encode_cursor.
+    """
+    if columns is None:
+        return query.offset(skip).limit(limit)
+
+    if cursor:
+        query = query.filter(keyset_condition(columns, decode_cursor(cursor, len(columns)), descending))
+    return query.order_by(*keyset_order(columns, descending)).limit(limit)
 
 
 # Response helpers for common patterns
@@ -1,5 +1,5 @@
 // Shared library exports
 export { AuthProvider, useAuth } from './hooks/useAuth.js'
 export { useAPI, useSearch, usePagination, useForm } from './hooks/common.js'
-export { createAPIInstance, createCommonAPI, api, commonAPI } from './services/api.js'
+export { createAPIInstance, createCommonAPI, batch, api, commonAPI } from './services/api.js'
 export { MockDataManager, mockDataManager } from './utils/mockData.js'
\ No newline at end of file
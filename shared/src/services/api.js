@@ -1,4 +1,5 @@
 import axios from 'axios'
+import { decode } from '@msgpack/msgpack'
 
 /**
  * Base API configuration for all MSP applications
@@ -11,13 +12,45 @@ export const API_CONFIG = {
   },
 }
 
+/**
+ * Decode a raw (arraybuffer) response body by its content type:
+ * MessagePack and JSON become objects, other text stays a string
+ */
+function decodeBody(data, headers) {
+  if (!(data instanceof ArrayBuffer) || data.byteLength === 0) {
+    return data
+  }
+  const contentType = String(headers?.['content-type'] || '')
+  if (contentType.includes('msgpack')) {
+    return decode(new Uint8Array(data))
+  }
+  const text = new TextDecoder().decode(data)
+  if (contentType.includes('json')) {
+    return JSON.parse(text)
+  }
+  return text
+}
+
 /**
  * Create an axios instance with automatic token handling
+ *
+ * With `binary` (the default) responses are negotiated as MessagePack,
+ * which is smaller and faster to parse than JSON for large lists. The
+ * browser already sends Accept-Encoding, so gzip/brotli needs no opt-in.
  */
-export function createAPIInstance(config = {}) {
+export function createAPIInstance({ binary = true, ...config } = {}) {
   const api = axios.create({
     ...API_CONFIG,
     ...config,
+    ...(binary && {
+      responseType: 'arraybuffer',
+      transformResponse: [decodeBody],
+    }),
+    headers: {
+      ...API_CONFIG.headers,
+      ...(binary && { Accept: 'application/msgpack, application/json;q=0.9' }),
+      ...config.headers,
+    },
   })
 
   // Add token to requests dynamically via interceptor
@@ -48,6 +81,26 @@ export function createAPIInstance(config = {}) {
   return api
 }
 
+/**
+ * Run several API calls in one round trip through /api/batch
+ *
+ * `requests` maps a key to a path relative to the API base ('/tickets/5')
+ * or to { method, url, body, dependsOn }. Resolves to the same keys mapped
+ * to { status, data }; a failed sub-request does not reject the batch.
+ */
+export async function batch(api, requests) {
+  const basePath = new URL(api.defaults.baseURL, window.location.origin).pathname.replace(/\/$/, '')
+  const entries = Object.entries(requests).map(([id, request]) => {
+    const { method = 'GET', url, body, dependsOn = [] } =
+      typeof request === 'string' ? { url: request } : request
+    return { id, method, url: `${basePath}${url}`, body, depends_on: dependsOn }
+  })
+  const response = await api.post('/batch', { requests: entries })
+  return Object.fromEntries(
+    response.data.responses.map(({ id, status, body }) => [id, { status, data: body }])
+  )
+}
+
 /**
  * Common API endpoints used across applications
  */
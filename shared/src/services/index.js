@@ -1 +1 @@
-export { createAPIInstance, createCommonAPI, api, commonAPI } from './api.js'
\ No newline at end of file
+export { createAPIInstance, createCommonAPI, batch, api, commonAPI } from './api.js'
\ No newline at end of file
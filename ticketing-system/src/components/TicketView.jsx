@@ -16,10 +16,41 @@ function TicketView() {
   const [commentVisibility, setCommentVisibility] = useState('public') // 'public' or 'private'
 
   useEffect(() => {
-    fetchTicket()
-    fetchTimeLogs()
+    fetchTicketView()
   }, [id])
 
+  const fetchTicketView = async () => {
+    // Check if authenticated before making API calls
+    const token = localStorage.getItem('token')
+
+    if (!token) {
+      // Use mock data if no authentication
+      loadMockTicket()
+      loadMockTimeLogs()
+      setLoading(false)
+      return
+    }
+
+    try {
+      // The ticket detail carries its comments and time entries
+      const response = await ticketAPI.getTicket(id)
+      setTicket(response.data)
+      setComments(response.data.comments || [])
+      setTimeLogs((response.data.time_entries || []).map(entry => ({
+        id: entry.id,
+        user: entry.user_id,
+        duration: `${entry.minutes}m`,
+        description: entry.description,
+        created_at: entry.created_at
+      })))
+    } catch (error) {
+      // Silently use mock data for development
+      loadMockTicket()
+      loadMockTimeLogs()
+    }
+    setLoading(false)
+  }
+
   const fetchTicket = async () => {
     // Check if authenticated before making API calls
     const token = localStorage.getItem('token')
@@ -75,25 +106,6 @@ function TicketView() {
     ])
   }
 
-  const fetchTimeLogs = async () => {
-    // Check if authenticated before making API calls
-    const token = localStorage.getItem('token')
-    
-    if (!token) {
-      // Use mock data if no authentication
-      loadMockTimeLogs()
-      return
-    }
-
-    try {
-      const response = await ticketAPI.getTimeLog(id)
-      setTimeLogs(response.data)
-    } catch (error) {
-      // Silently use mock data for development
-      loadMockTimeLogs()
-    }
-  }
-
   const loadMockTimeLogs = () => {
     setTimeLogs([
       { id: 1, user: 'John Doe', duration: '30m', description: 'Initial investigation', created_at: new Date(Date.now() - 900000).toISOString() },